@@ -0,0 +1,2124 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import bisect as _bisect
+import collections as _collections
+import hashlib as _hashlib
+import json as _json
+import os as _os
+import proton as _proton
+import proton.handlers as _handlers
+import proton.reactor as _reactor
+import resource as _resource
+import select as _select
+import signal as _signal
+import socket as _socket
+import stat as _stat
+import struct as _struct
+import uuid as _uuid
+import shutil as _shutil
+import subprocess as _subprocess
+import sys as _sys
+import time as _time
+import tempfile as _tempfile
+import traceback as _traceback
+import zlib as _zlib
+
+try:
+    from plano import plural as _plural
+except ImportError: # Running on its own, outside Quiver
+    def _plural(noun, count):
+        return noun if count == 1 else "{0}s".format(noun)
+
+class Broker:
+    def __init__(self, host, port, id=None, ready_file=None,
+                 user=None, password=None,
+                 cert=None, key=None, trust=None,
+                 topics=None, raw=False,
+                 retain_messages=None, retain_bytes=None,
+                 max_queue_messages=None, max_queue_bytes=None,
+                 credit_window=10,
+                 journal_dir=None, commit_interval=0.002, commit_bytes=1024 * 1024,
+                 workers=1, end_to_end=False,
+                 metrics_file=None, metrics_socket=None, metrics_interval=1,
+                 trace=False, trace_sample=1, stream_buffer=0,
+                 quiet=False, verbose=False, debug_enabled=False,
+                 init_only=False):
+        self.host = host
+        self.port = port
+        self.id = id
+        self.ready_file = ready_file
+        self.user = user
+        self.password = password
+        self.cert = cert
+        self.key = key
+        self.trust = trust
+        self.raw = raw
+        self.retain_messages = retain_messages
+        self.retain_bytes = retain_bytes
+        self.max_queue_messages = max_queue_messages
+        self.max_queue_bytes = max_queue_bytes
+        self.credit_window = credit_window
+        self.journal_dir = journal_dir
+        self.commit_interval = commit_interval
+        self.commit_bytes = commit_bytes
+        self.workers = workers
+        self.end_to_end = end_to_end
+        self.metrics_file = metrics_file
+        self.metrics_socket = metrics_socket
+        self.metrics_interval = metrics_interval
+        self.tracing = trace
+        self.trace_sample = trace_sample
+        self.stream_buffer = stream_buffer
+        self.quiet = quiet
+        self.verbose = verbose
+        self.debug_enabled = debug_enabled
+        self.init_only = init_only
+
+        if self.id is None:
+            self.id = "broker-{0}".format(_uuid.uuid4().hex[:8])
+
+        self.container = _reactor.Container(_Handler(self))
+        self.container.container_id = self.id # XXX Obnoxious
+
+        if self.debug_enabled:
+            self.verbose = True
+
+        self._trace_countdowns = dict()
+
+        self._config_dir = None
+        self._nodes = dict()
+
+        self.journal = None
+
+        if self.journal_dir is not None:
+            self.journal = _Journal(self, self.journal_dir, self.commit_interval, self.commit_bytes)
+
+        # Created when the broker runs, in each worker
+        self.metrics = None
+
+        # Set in each worker process when there is more than one
+        self.worker = None
+        self.ring = None
+        self.worker_ports = None
+        self._listen_socket = None
+        self._worker_socket = None
+        self._worker_handler = None
+        self._worker_connections = dict()
+        self._relayed = dict() # Deliveries to other workers to producer deliveries
+
+        if topics:
+            for address in topics:
+                self._create_topic(address)
+
+    def init(self):
+        self.info("Initializing {0}", self)
+
+        if self.user is not None:
+            if self.password is None:
+                self.fail("A password is required for user authentication")
+
+            self._init_sasl_config()
+
+        if self.cert is not None:
+            if self.key is None:
+                self.fail("Both the cert and key files must be provided")
+
+            if not _os.path.isfile(self.cert):
+                self.fail("Certificate file {0} does not exist", self.cert)
+
+            if not _os.path.isfile(self.key):
+                self.fail("Private key file {0} does not exist", self.key)
+
+            if self.trust and not _os.path.isfile(self.trust):
+                self.fail("Trust file {0} does not exist", self.trust)
+
+    def _init_sasl_config(self):
+        self._config_dir = _tempfile.mkdtemp(prefix="brokerlib-", suffix="")
+
+        config_file = _os.path.join(self._config_dir, "proton-server.conf")
+        sasldb_file = _os.path.join(self._config_dir, "users.sasldb")
+
+        _os.environ["PN_SASL_CONFIG_PATH"] = self._config_dir
+
+        with open(config_file, "w") as f:
+            f.write("sasldb_path: {0}\n".format(sasldb_file))
+            f.write("mech_list: PLAIN SCRAM-SHA-1\n")
+
+        command = "echo '{0}' | saslpasswd2 -p -f {1} '{2}'".format \
+                  (self.password, sasldb_file, self.user)
+
+        try:
+            _subprocess.check_call(command, shell=True)
+        except _subprocess.CalledProcessError as e:
+            self.fail("Failed adding user to SASL database: {0}", e)
+
+    def debug(self, message, *args):
+        pass
+
+    # Per-message logging.  Callers check 'tracing' and then
+    # 'trace_sampled(point)' before building any arguments, so trace points
+    # cost one attribute test when tracing is off.
+    def trace(self, message, *args):
+        pass
+
+    # True for one message in each 'trace_sample' at the given trace
+    # point, starting with the first.  Each point counts on its own,
+    # so in order delivery traces the same messages at every point.
+    def trace_sampled(self, point):
+        countdown = self._trace_countdowns.get(point, 1) - 1
+
+        if countdown > 0:
+            self._trace_countdowns[point] = countdown
+            return False
+
+        self._trace_countdowns[point] = self.trace_sample
+
+        return True
+
+    def info(self, message, *args):
+        pass
+
+    def notice(self, message, *args):
+        pass
+
+    def warn(self, message, *args):
+        pass
+
+    def error(self, message, *args):
+        self.log(message, *args)
+
+    def fail(self, message, *args):
+        self.error(message, *args)
+        _sys.exit(1)
+
+    def log(self, message, *args):
+        message = message[0].upper() + message[1:]
+        message = message.format(*args)
+        message = "{0}: {1}".format(self.id, message)
+
+        _sys.stderr.write("{0}\n".format(message))
+        _sys.stderr.flush()
+
+    def run(self):
+        try:
+            if self.init_only:
+                return
+
+            if self.workers > 1:
+                self._run_workers()
+            else:
+                self._run()
+        except OSError as e:
+            if self.debug_enabled:
+                raise
+
+            self.fail(e)
+        finally:
+            if self._config_dir and _os.path.exists(self._config_dir):
+                _shutil.rmtree(self.dir, ignore_errors=True)
+
+    def _run(self):
+        if self.journal is not None:
+            self._recover_messages()
+
+        if self.metrics_enabled:
+            self.metrics = _Metrics(self, self.metrics_file, self.metrics_socket, self.metrics_interval)
+
+        try:
+            self.container.run()
+        finally:
+            if self.metrics is not None:
+                self.metrics.close()
+
+    @property
+    def metrics_enabled(self):
+        return self.metrics_file is not None or self.metrics_socket is not None
+
+    # Each worker is a forked copy of this broker.  With SO_REUSEPORT,
+    # each has its own listening socket and the kernel spreads
+    # connections across them.  Otherwise, they share one socket.  The
+    # sockets are bound before the fork, so connections wait in the
+    # backlog until the workers are running.
+    #
+    # Each queue belongs to one worker, chosen by consistent hashing of
+    # its address.  The other workers reach it through a private port
+    # on the owner.
+    def _run_workers(self):
+        if any(isinstance(x, _Topic) for x in self._nodes.values()):
+            self.fail("Topics are not supported with more than one worker")
+
+        oldest, newest = _worker_proton_versions
+
+        if not oldest <= _proton.VERSION[:2] <= newest:
+            self.fail("More than one worker needs Proton {0}.{1} to {2}.{3}, but this is Proton {4}.{5}",
+                      *(oldest + newest + _proton.VERSION[:2]))
+
+        listen_sockets = _bind_sockets(self.host, self.port, self.workers)
+        worker_sockets = [_bind_sockets("localhost", 0, 1)[0] for i in range(self.workers)]
+
+        self.worker_ports = [x.getsockname()[1] for x in worker_sockets]
+        self.ring = _HashRing(self.workers)
+
+        pids = list()
+
+        for worker in range(self.workers):
+            pid = _os.fork()
+
+            if pid == 0:
+                listen_socket = listen_sockets[worker % len(listen_sockets)]
+                self._run_worker(worker, listen_socket, worker_sockets[worker], listen_sockets + worker_sockets)
+
+            pids.append(pid)
+
+        for sock in listen_sockets + worker_sockets:
+            sock.close()
+
+        self.notice("Started {0} workers listening on '{1}:{2}'", self.workers, self.host, self.port)
+
+        if self.ready_file is not None:
+            with open(self.ready_file, "w") as f:
+                f.write("ready\n")
+
+        def stop_workers(signum, frame):
+            raise KeyboardInterrupt()
+
+        _signal.signal(_signal.SIGTERM, stop_workers)
+
+        failed = False
+
+        try:
+            # If a worker exits, its queues are gone, so stop them all
+            pid, status = _os.wait()
+            pids.remove(pid)
+            status = _os.waitstatus_to_exitcode(status)
+
+            if status != 0:
+                self.error("Worker process {0} failed with status {1}", pid, status)
+                failed = True
+        except KeyboardInterrupt:
+            pass
+        finally:
+            for pid in pids:
+                try:
+                    _os.kill(pid, _signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+            for pid in pids:
+                _os.waitpid(pid, 0)
+
+        if failed:
+            _sys.exit(1)
+
+    # Never returns
+    def _run_worker(self, worker, listen_socket, worker_socket, sockets):
+        status = 1
+
+        try:
+            for sock in sockets:
+                if sock not in (listen_socket, worker_socket):
+                    sock.close()
+
+            self.worker = worker
+            self.id = "{0}-{1}".format(self.id, worker)
+            self.container.container_id = self.id
+            self.ready_file = None
+            self._listen_socket = listen_socket
+            self._worker_socket = worker_socket
+            self._worker_handler = _WorkerHandler(self)
+
+            if self.journal_dir is not None:
+                self.journal_dir = _os.path.join(self.journal_dir, "worker-{0}".format(worker))
+                self.journal = _Journal(self, self.journal_dir, self.commit_interval, self.commit_bytes)
+
+            self._run()
+
+            status = 0
+        except KeyboardInterrupt:
+            status = 0
+        except SystemExit as e:
+            status = e.code if isinstance(e.code, int) else 1
+        except:
+            _traceback.print_exc()
+        finally:
+            _sys.stderr.flush()
+            _os._exit(status)
+
+    def _connect_worker(self, worker):
+        try:
+            return self._worker_connections[worker]
+        except KeyError:
+            url = "amqp://localhost:{0}".format(self.worker_ports[worker])
+            connection = self.container.connect(url, handler=self._worker_handler)
+
+            self._worker_connections[worker] = connection
+
+            return connection
+
+    # Temporary queues stay with the worker that created them, so the
+    # address is varied until it hashes to this worker
+    def _dynamic_address(self, connection, link):
+        address = "{0}/{1}".format(connection.remote_container, link.name)
+
+        if self.ring is None:
+            return address
+
+        candidate = address
+        suffix = 0
+
+        while self.ring.lookup(candidate) != self.worker:
+            suffix += 1
+            candidate = "{0}/{1}".format(address, suffix)
+
+        return candidate
+
+    def _recover_messages(self):
+        count = 0
+
+        for number, address, data in self.journal.open():
+            message = data
+
+            if not self.raw:
+                message = _proton.Message()
+                message.decode(data)
+
+            self._get_node(address).append_message(message, len(data), number)
+            count += 1
+
+        self.info("Recovered {0} messages from the journal in {1}", count, self.journal_dir)
+
+    def _get_node(self, address):
+        try:
+            return self._nodes[address]
+        except KeyError:
+            pass
+
+        if self.ring is not None:
+            worker = self.ring.lookup(address)
+
+            if worker != self.worker:
+                node = _RemoteQueue(self, address, worker)
+                self._nodes[address] = node
+
+                return node
+
+        return self._create_queue(address)
+
+    def _create_queue(self, address):
+        assert address not in self._nodes, address
+
+        node = _Queue(self, address)
+        self._nodes[address] = node
+
+        return node
+
+    def _create_topic(self, address):
+        assert address not in self._nodes, address
+
+        node = _Topic(self, address)
+        self._nodes[address] = node
+
+        return node
+
+# Consumers with credit wait in the ready set, oldest first.  Sends
+# and link flow keep it current, so dispatch never scans consumers
+# that cannot take a message.
+class _Node:
+    def __init__(self, broker, address):
+        self.broker = broker
+        self.address = address
+
+        self.messages = _collections.deque()
+        self.consumers = set()
+        self.ready = _collections.OrderedDict()
+        self.producers = set()
+
+        # Consumers held by streamed messages while they pass
+        # through
+        self.busy = dict()
+
+        self.enqueued = 0
+        self.dequeued = 0
+
+        self.broker.info("Created {0}", self)
+
+    # True when producers must wait for the node to drain
+    @property
+    def full(self):
+        return False
+
+    def add_producer(self, link):
+        assert link.is_receiver
+
+        self.producers.add(link)
+        self.grant_credit(link)
+
+    def remove_producer(self, link):
+        self.producers.discard(link)
+
+    # Tops the producer back up to the credit window, unless the node
+    # is full
+    def grant_credit(self, link):
+        if not self.full:
+            _grant_credit(link, self.broker.credit_window)
+
+    def add_consumer(self, link):
+        assert link.is_sender
+        assert link not in self.consumers
+
+        self.consumers.add(link)
+        self.update_consumer(link)
+
+        self.broker.info("Added consumer for {0} to {1}", _container_repr(link.connection), self)
+
+    def remove_consumer(self, link):
+        assert link.is_sender
+
+        try:
+            self.consumers.remove(link)
+        except KeyError:
+            return False
+
+        self.ready.pop(link, None)
+
+        stream = self.busy.pop(link, None)
+
+        if stream is not None:
+            stream.fail()
+
+        self.broker.info("Removed consumer for {0} from {1}", _container_repr(link.connection), self)
+
+        return True
+
+    # Called when the credit of a consumer changes
+    def update_consumer(self, link):
+        if link.credit > 0 and link in self.consumers and link not in self.busy:
+            self.ready[link] = None
+        else:
+            self.ready.pop(link, None)
+
+    # Only queues keep messages in the journal
+    @property
+    def durable(self):
+        return False
+
+    # True for queues owned by another worker
+    @property
+    def remote(self):
+        return False
+
+    # True if producer deliveries wait for a consumer to settle the
+    # forwarded copy
+    @property
+    def end_to_end(self):
+        return False
+
+    # True if large messages can pass through in pieces
+    @property
+    def streaming(self):
+        return False
+
+    def settle_delivery(self, delivery):
+        pass
+
+    def store_message(self, delivery, message, size, number=None):
+        self.enqueued += 1
+
+        if self.broker.tracing and self.broker.trace_sampled("stored"):
+            self.broker.trace("Stored {0} from {1} on {2}", _message_repr(message),
+                              _container_repr(delivery.connection), self)
+
+    # The current state of the node for the metrics emitter
+    def metrics(self):
+        return {
+            "address": self.address,
+            "type": self.type,
+            "depth": len(self.messages),
+            "bytes": self.size,
+            "enqueued": self.enqueued,
+            "dequeued": self.dequeued,
+            "producers": len(self.producers),
+            "consumers": len(self.consumers),
+            "consumer_credit": sum(x.credit for x in self.consumers),
+        }
+
+class _Queue(_Node):
+    type = "queue"
+
+    def __init__(self, broker, address):
+        super(_Queue, self).__init__(broker, address)
+
+        self.max_messages = broker.max_queue_messages
+        self.max_bytes = broker.max_queue_bytes
+
+        # Message sizes are kept for the byte limit and for metrics
+        self.track_size = self.max_bytes is not None or broker.metrics_enabled
+        self.sizes = _collections.deque()
+        self.size = 0
+        self.blocked = False
+        self.high_water = 0
+
+        # Journal numbers, kept in step with the messages, with None
+        # for messages not in the journal
+        self.numbers = _collections.deque()
+
+        # With end-to-end settlement, the producer deliveries, kept in
+        # step with the messages
+        self.origins = _collections.deque()
+
+        # The forwarded journal or end-to-end messages each consumer
+        # has yet to settle, by delivery tag
+        self.unsettled = dict()
+
+    def __repr__(self):
+        return "queue '{0}'".format(self.address)
+
+    @property
+    def durable(self):
+        return self.broker.journal is not None
+
+    @property
+    def end_to_end(self):
+        return self.broker.end_to_end
+
+    # Messages held for end-to-end settlement must be kept whole.
+    # Each stream checks for itself whether its message is durable.
+    @property
+    def streaming(self):
+        return not self.end_to_end
+
+    # Unsettled messages go back on the queue
+    def remove_consumer(self, link):
+        removed = super(_Queue, self).remove_consumer(link)
+
+        unsettled = self.unsettled.pop(link, None)
+
+        if unsettled:
+            for message, size, number, origin in reversed(list(unsettled.values())):
+                self.requeue_message(message, size, number, origin)
+
+            self.forward_messages()
+
+        return removed
+
+    @property
+    def full(self):
+        if self.max_messages is not None and len(self.messages) >= self.max_messages:
+            return True
+
+        if self.max_bytes is not None and self.size >= self.max_bytes:
+            return True
+
+        return False
+
+    def store_message(self, delivery, message, size, number=None):
+        super(_Queue, self).store_message(delivery, message, size)
+
+        self.messages.append(message)
+        self._add_message(message, size, number, delivery)
+
+        depth = len(self.messages)
+
+        # Log each new high-water mark at powers of two, from 16 up
+        if depth > self.high_water:
+            if depth >= 16 and depth & (depth - 1) == 0:
+                self.broker.notice("Depth of {0} reached {1} messages", self, depth)
+
+            self.high_water = depth
+
+        if not self.blocked and self.full:
+            self.blocked = True
+
+            self.broker.notice("Stopped credit to {0} {1} on {2} at {3} {4} and {5} {6}",
+                               len(self.producers), _plural("producer", len(self.producers)), self,
+                               depth, _plural("message", depth), self.size, _plural("byte", self.size))
+
+    # Adds a message that did not come from a local producer, either
+    # recovered from the journal or received from another worker
+    def append_message(self, message, size, number=None, origin=None):
+        self.messages.append(message)
+        self.enqueued += 1
+        self._add_message(message, size, number, origin)
+
+    def _add_message(self, message, size, number, origin):
+        if self.track_size:
+            self.sizes.append(size)
+            self.size += size
+
+        if self.broker.journal is not None:
+            self.numbers.append(number)
+
+        if self.end_to_end:
+            self.origins.append(origin)
+
+    # Puts a released message back at the front of the queue
+    def requeue_message(self, message, size, number, origin):
+        self.messages.appendleft(message)
+
+        if self.track_size:
+            self.sizes.appendleft(size)
+            self.size += size
+
+        if self.broker.journal is not None:
+            self.numbers.appendleft(number)
+
+        if self.end_to_end:
+            self.origins.appendleft(origin)
+
+    def track_delivery(self, consumer, delivery, message, size, number, origin):
+        if _settles_on_send(consumer):
+            self._finish_message(number, origin, _proton.Delivery.ACCEPTED)
+            return
+
+        try:
+            deliveries = self.unsettled[consumer]
+        except KeyError:
+            deliveries = self.unsettled[consumer] = dict()
+
+        deliveries[delivery.tag] = (message, size, number, origin)
+
+    # Called when a consumer settles a forwarded message.  Released and
+    # modified messages are delivered again.  Other outcomes go back
+    # to the producer.
+    def settle_delivery(self, delivery):
+        try:
+            message, size, number, origin = self.unsettled[delivery.link].pop(delivery.tag)
+        except KeyError:
+            return
+
+        state = delivery.remote_state
+
+        if state in (_proton.Delivery.RELEASED, _proton.Delivery.MODIFIED):
+            self.requeue_message(message, size, number, origin)
+            self.forward_messages()
+            return
+
+        if state != _proton.Delivery.REJECTED:
+            state = _proton.Delivery.ACCEPTED
+
+        self._finish_message(number, origin, state)
+
+    def _finish_message(self, number, origin, state):
+        if number is not None:
+            self.broker.journal.delete(number)
+
+        if origin is not None:
+            origin.update(state)
+            origin.settle()
+
+    def unblock(self):
+        self.blocked = False
+
+        depth = len(self.messages)
+
+        self.broker.notice("Resumed credit to {0} {1} on {2} at {3} {4} and {5} {6}",
+                           len(self.producers), _plural("producer", len(self.producers)), self,
+                           depth, _plural("message", depth), self.size, _plural("byte", self.size))
+
+        for link in self.producers:
+            _grant_credit(link, self.broker.credit_window)
+
+    # Each message goes to the consumer that has waited longest.  A
+    # consumer with credit left goes to the back of the line.
+    def forward_messages(self):
+        messages = self.messages
+        ready = self.ready
+
+        while messages and ready:
+            consumer = ready.popitem(last=False)[0]
+            message = messages.popleft()
+            size = None
+
+            if self.track_size:
+                size = self.sizes.popleft()
+                self.size -= size
+
+            delivery = _send_message(consumer, message)
+            self.dequeued += 1
+            number = None
+
+            if self.numbers:
+                number = self.numbers.popleft()
+
+            if self.origins:
+                self.track_delivery(consumer, delivery, message, size, number, self.origins.popleft())
+            elif number is not None:
+                self.track_delivery(consumer, delivery, message, size, number, None)
+
+            if consumer.credit > 0:
+                ready[consumer] = None
+
+            if self.broker.tracing and self.broker.trace_sampled("forwarded"):
+                self.broker.trace("Forwarded {0} on {1} to {2}", _message_repr(message), self,
+                                  _container_repr(consumer.connection))
+
+        if self.blocked and not self.full:
+            self.unblock()
+
+# Stands in for a queue owned by another worker.  Messages from local
+# producers go to the owner on a sender link.  Local consumers get
+# messages from a receiver link from the owner, which gets credit only
+# while they can take more.
+class _RemoteQueue(_Queue):
+    type = "remote-queue"
+
+    def __init__(self, broker, address, worker):
+        self.worker = worker
+
+        super(_RemoteQueue, self).__init__(broker, address)
+
+        self.sender = None
+        self.receiver = None
+        self.outbox = _collections.deque()
+
+    def __repr__(self):
+        return "queue '{0}' on worker {1}".format(self.address, self.worker)
+
+    @property
+    def durable(self):
+        return False
+
+    @property
+    def remote(self):
+        return True
+
+    @property
+    def streaming(self):
+        return False
+
+    @property
+    def full(self):
+        return len(self.outbox) >= self.broker.credit_window
+
+    def add_consumer(self, link):
+        super(_RemoteQueue, self).add_consumer(link)
+
+        if self.receiver is None:
+            connection = self.broker._connect_worker(self.worker)
+            self.receiver = self.broker.container.create_receiver(connection, source=self.address)
+
+        self.request_messages()
+
+    # The producer delivery is settled when the owner settles the
+    # relayed one
+    def relay_message(self, delivery, message):
+        if self.sender is None:
+            connection = self.broker._connect_worker(self.worker)
+            self.sender = self.broker.container.create_sender(connection, target=self.address)
+
+        self.outbox.append((delivery, message))
+
+        if not self.blocked and self.full:
+            self.blocked = True
+
+        self.send_messages()
+
+    def send_messages(self):
+        while self.outbox and self.sender.credit > 0:
+            delivery, message = self.outbox.popleft()
+            relayed = _send_message(self.sender, message)
+
+            if _settles_on_send(self.sender):
+                delivery.update(_proton.Delivery.ACCEPTED)
+                delivery.settle()
+            else:
+                self.broker._relayed[relayed] = delivery
+
+            if self.broker.tracing and self.broker.trace_sampled("relayed"):
+                self.broker.trace("Relayed {0} to {1}", _message_repr(message), self)
+
+        if self.blocked and not self.full:
+            self.unblock()
+
+    def forward_messages(self):
+        super(_RemoteQueue, self).forward_messages()
+
+        self.request_messages()
+
+    def request_messages(self):
+        if self.receiver is not None and self.ready:
+            _grant_credit(self.receiver, self.broker.credit_window - len(self.messages))
+
+class _Topic(_Node):
+    type = "topic"
+
+    def __init__(self, broker, address):
+        super(_Topic, self).__init__(broker, address)
+
+        self.messages = _Log(broker.retain_messages, broker.retain_bytes,
+                             track_size=broker.metrics_enabled)
+        self.consumer_offsets = dict()
+
+    def __repr__(self):
+        return "topic '{0}'".format(self.address)
+
+    def store_message(self, delivery, message, size, number=None):
+        super(_Topic, self).store_message(delivery, message, size)
+
+        self.messages.append(message, size)
+
+    @property
+    def size(self):
+        return self.messages.size
+
+    # New consumers start with the oldest message still in the log
+    def add_consumer(self, link):
+        self.consumer_offsets[link] = self.messages.first
+
+        super(_Topic, self).add_consumer(link)
+
+    def remove_consumer(self, link):
+        if super(_Topic, self).remove_consumer(link):
+            del self.consumer_offsets[link]
+            self.trim_messages()
+
+    # Every message goes to every consumer, so each ready consumer
+    # takes as many as its credit allows
+    def forward_messages(self):
+        messages = self.messages
+        ready = self.ready
+
+        for consumer in list(ready):
+            offset = self.consumer_offsets[consumer]
+
+            if offset < messages.first:
+                self.broker.warn("Consumer for {0} on {1} missed {2} messages dropped by retention",
+                                 _container_repr(consumer.connection), self, messages.first - offset)
+
+                offset = messages.first
+
+            while offset < messages.end and consumer.credit > 0:
+                message = messages.get(offset)
+
+                _send_message(consumer, message)
+                self.dequeued += 1
+                offset += 1
+
+                if self.broker.tracing and self.broker.trace_sampled("forwarded"):
+                    self.broker.trace("Forwarded {0} on {1} to {2}", _message_repr(message), self,
+                                      _container_repr(consumer.connection))
+
+            self.consumer_offsets[consumer] = offset
+
+            if consumer.credit == 0:
+                del ready[consumer]
+
+        self.trim_messages()
+
+    # Drop the messages every consumer has already seen.  With no
+    # consumers, the log keeps messages for later subscribers, up to
+    # the retention limits.
+    def trim_messages(self):
+        if self.consumer_offsets:
+            self.messages.trim(min(self.consumer_offsets.values()))
+
+# An append-only message log.  Messages are numbered from zero and
+# stored in fixed-size segments, so a read by number is O(1) and
+# trimming frees each segment once it is fully behind the first
+# retained message.  Retention limits drop the oldest messages
+# whether or not they have been read.
+class _Log:
+    def __init__(self, max_messages=None, max_bytes=None, segment_size=1024, track_size=False):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.segment_size = segment_size
+        self.track_size = track_size or max_bytes is not None
+
+        self.segments = dict()
+        self.sizes = _collections.deque()
+        self.size = 0
+
+        self.first = 0 # The number of the oldest retained message
+        self.end = 0 # The number of the next message appended
+
+    def __len__(self):
+        return self.end - self.first
+
+    def append(self, message, size):
+        index, slot = divmod(self.end, self.segment_size)
+
+        if slot == 0:
+            self.segments[index] = [None] * self.segment_size
+
+        self.segments[index][slot] = message
+        self.end += 1
+
+        if self.track_size:
+            self.sizes.append(size)
+            self.size += size
+
+        if self.max_messages is not None and len(self) > self.max_messages:
+            self.trim(self.end - self.max_messages)
+
+        # Always keep the newest message, however large
+        while self.max_bytes is not None and self.size > self.max_bytes and len(self) > 1:
+            self.trim(self.first + 1)
+
+    def get(self, number):
+        assert self.first <= number < self.end, number
+
+        index, slot = divmod(number, self.segment_size)
+
+        return self.segments[index][slot]
+
+    def trim(self, number):
+        number = min(number, self.end)
+
+        while self.first < number:
+            index, slot = divmod(self.first, self.segment_size)
+
+            self.segments[index][slot] = None
+
+            if slot == self.segment_size - 1:
+                del self.segments[index]
+
+            if self.sizes:
+                self.size -= self.sizes.popleft()
+
+            self.first += 1
+
+class _BaseHandler(_handlers.MessagingHandler):
+    def __init__(self, broker):
+        # Producer credit is granted by the nodes, so that full queues
+        # can hold it back
+        super(_BaseHandler, self).__init__(prefetch=0, auto_accept=False)
+
+        self.broker = broker
+
+        # Swap in a delivery handler that reads the message data
+        # itself, so its size is known without encoding it again
+        self.handlers = [_DeliveryHandler(self) if isinstance(x, _handlers.IncomingMessageHandler) else x
+                         for x in self.handlers]
+
+    # Returns True if the delivery is handled as a stream
+    def stream_message(self, delivery):
+        return False
+
+class _Handler(_BaseHandler):
+    def __init__(self, broker):
+        super(_Handler, self).__init__(broker)
+
+        # Partial deliveries being read, by producer link
+        self.streams = dict()
+
+    def on_start(self, event):
+        interface = "{0}:{1}".format(self.broker.host, self.broker.port)
+
+        if self.broker.cert is not None:
+            interface = "amqps://{0}".format(interface)
+
+            ssl_domain = event.container.ssl.server
+            ssl_domain.set_credentials(self.broker.cert, self.broker.key, None)
+
+            if self.broker.trust:
+                ssl_domain.set_peer_authentication(_proton.SSLDomain.VERIFY_PEER, self.broker.trust)
+                ssl_domain.set_trusted_ca_db(self.broker.trust)
+            else:
+                ssl_domain.set_peer_authentication(_proton.SSLDomain.ANONYMOUS_PEER)
+
+        if self.broker._listen_socket is None:
+            self.acceptor = event.container.listen(interface)
+        else:
+            self.acceptor = _SocketAcceptor(event.container, self.broker._listen_socket)
+            self.worker_acceptor = _SocketAcceptor(event.container, self.broker._worker_socket)
+
+            if self.broker.cert is not None:
+                self.acceptor.set_ssl_domain(ssl_domain)
+
+        self.broker.notice("Listening for connections on '{0}'", interface)
+
+        if self.broker.metrics is not None:
+            self.broker.metrics.start(event.container)
+
+        if self.broker.ready_file is not None:
+            with open(self.broker.ready_file, "w") as f:
+                f.write("ready\n")
+
+    def on_link_opening(self, event):
+        if event.link.is_sender:
+            # A client receiving from the broker
+
+            if event.link.remote_source.dynamic:
+                # A temporary queue
+                address = self.broker._dynamic_address(event.connection, event.link)
+                node = self.broker._create_queue(address)
+            elif event.link.remote_source.address in (None, ""):
+                raise Exception("The client created a receiver with no source address")
+            else:
+                # A named queue or topic
+                address = event.link.remote_source.address
+                node = self.broker._get_node(address)
+
+            assert address is not None
+
+            # A client that asks for at-most-once delivery gets its
+            # messages settled as they are sent
+            event.link.snd_settle_mode = event.link.remote_snd_settle_mode
+
+            event.link.source.address = address
+            node.add_consumer(event.link)
+
+        if event.link.is_receiver:
+            # A client sending to the broker
+
+            if event.link.remote_target.dynamic:
+                # A temporary queue
+                address = self.broker._dynamic_address(event.connection, event.link)
+                node = self.broker._create_queue(address)
+            elif event.link.remote_target.address in (None, ""):
+                # Anonymous relay - no queueing
+                address = None
+                node = None
+            else:
+                # A named queue or topic
+                address = event.link.remote_target.address
+                node = self.broker._get_node(address)
+
+            event.link.target.address = address
+
+            if node is None:
+                # Messages on the anonymous relay can go anywhere, so
+                # its credit is never held back
+                _grant_credit(event.link, self.broker.credit_window)
+            else:
+                node.add_producer(event.link)
+
+    def on_link_closing(self, event):
+        self.remove_link(event.link)
+
+    # With a stream buffer, each partial delivery is read as its
+    # frames arrive, so Proton holds no more of it than the session
+    # window.  Large messages to local queues pass straight to a free
+    # consumer.
+    def stream_message(self, delivery):
+        if not self.broker.stream_buffer:
+            return False
+
+        link = delivery.link
+        stream = self.streams.get(link)
+
+        if stream is None:
+            if not delivery.partial or delivery.aborted or not delivery.pending:
+                return False
+
+            if link.state & _proton.Endpoint.LOCAL_CLOSED:
+                # Nobody wants the data, but reading it keeps the
+                # window open
+                link.recv(delivery.pending)
+                return True
+
+            node = None
+
+            if link.target.address not in (None, ""):
+                node = self.broker._get_node(link.target.address)
+
+            stream = self.streams[link] = _Stream(self, node, delivery)
+
+        stream.update()
+
+        return True
+
+    # The session window is counted in frames, so it must hold at
+    # least one
+    def on_session_opening(self, event):
+        if self.broker.stream_buffer:
+            event.session.incoming_capacity = max(self.broker.stream_buffer,
+                                                  event.transport.max_frame_size)
+
+    def on_connection_opening(self, event):
+        # XXX I think this should happen automatically
+        event.connection.container = event.container.container_id
+
+    def on_connection_opened(self, event):
+        self.broker.notice("Opened connection from {0}", _container_repr(event.connection))
+
+    def on_connection_closing(self, event):
+        self.remove_links(event.connection)
+
+    def on_connection_closed(self, event):
+        self.broker.notice("Closed connection from {0}", _container_repr(event.connection))
+
+    def on_disconnected(self, event):
+        self.broker.notice("Disconnected from {0}", _container_repr(event.connection))
+
+        self.remove_links(event.connection)
+
+    def remove_links(self, connection):
+        link = connection.link_head(_proton.Endpoint.REMOTE_ACTIVE)
+
+        while link is not None:
+            self.remove_link(link)
+            link = link.next(_proton.Endpoint.REMOTE_ACTIVE)
+
+    def remove_link(self, link):
+        stream = self.streams.get(link)
+
+        if stream is not None:
+            stream.abort()
+
+        if link.is_sender:
+            node = self.broker._nodes[link.source.address]
+            node.remove_consumer(link)
+        elif link.target.address not in (None, ""):
+            node = self.broker._nodes[link.target.address]
+            node.remove_producer(link)
+
+    def on_link_flow(self, event):
+        link = event.link
+
+        if not link.is_sender:
+            return
+
+        node = self.broker._get_node(link.source.address)
+        node.update_consumer(link)
+
+        # Sent frames free room for more of a streamed message
+        stream = node.busy.get(link)
+
+        if stream is not None:
+            stream.update()
+
+        if link.drain_mode:
+            node.forward_messages()
+            link.drained()
+            node.update_consumer(link)
+
+    def on_sendable(self, event):
+        node = self.broker._get_node(event.link.source.address)
+        node.forward_messages()
+
+    def on_settled(self, event):
+        if event.link.is_sender and (self.broker.end_to_end or self.broker.journal is not None):
+            self.broker._nodes[event.link.source.address].settle_delivery(event.delivery)
+
+        delivery = event.delivery
+        state = delivery.remote_state
+
+        if state == delivery.REJECTED:
+            self.broker.warn("Client '{0}' rejected {1} for {2}", event.connection.remote_container,
+                             _delivery_repr(delivery), _terminus_repr(event.link.source))
+        elif self.broker.tracing and state in _outcomes and self.broker.trace_sampled("settled"):
+            self.broker.trace("Client '{0}' {1} {2} for {3}", event.connection.remote_container,
+                              _outcomes[state], _delivery_repr(delivery),
+                              _terminus_repr(event.link.source))
+
+    # The message is either a proton.Message or, in raw mode, the
+    # encoded message data.  The size is that of the encoded data.
+    def route_message(self, delivery, message, size):
+        address = delivery.link.target.address
+
+        if address in (None, ""):
+            # Anonymous relay - only here do raw messages need decoding
+            if isinstance(message, _proton.Message):
+                address = message.address
+            else:
+                decoded = _proton.Message()
+                decoded.decode(message)
+                address = decoded.address
+
+        node = self.broker._get_node(address)
+
+        if node.remote:
+            node.relay_message(delivery, message)
+        else:
+            # With end-to-end settlement, the consumer's outcome
+            # settles the producer delivery.  Otherwise, durable
+            # messages are accepted when the journal commits.
+            settle = not node.end_to_end
+            number = None
+
+            if node.durable and _is_durable(message):
+                number = self.broker.journal.add(address, message, delivery if settle else None)
+                settle = False
+
+            node.store_message(delivery, message, size, number)
+            node.forward_messages()
+
+            if settle:
+                delivery.update(_proton.Delivery.ACCEPTED)
+                delivery.settle()
+
+        if node.address == delivery.link.target.address:
+            node.grant_credit(delivery.link)
+        else:
+            _grant_credit(delivery.link, self.broker.credit_window)
+
+    def on_unhandled(self, name, event):
+        if self.broker.debug_enabled:
+            self.broker.debug("Unhandled event: {0} {1}", name, event)
+
+# Handles this worker's connections to other workers
+class _WorkerHandler(_BaseHandler):
+    def on_sendable(self, event):
+        node = self.broker._nodes[event.link.target.address]
+        node.send_messages()
+
+    def on_settled(self, event):
+        try:
+            delivery = self.broker._relayed.pop(event.delivery)
+        except KeyError:
+            return
+
+        delivery.update(event.delivery.remote_state)
+        delivery.settle()
+
+    # A message from the owner for local consumers.  With end-to-end
+    # settlement, the owner hears the outcome from the local consumer.
+    def route_message(self, delivery, message, size):
+        node = self.broker._nodes[delivery.link.source.address]
+
+        if self.broker.end_to_end:
+            node.append_message(message, size, origin=delivery)
+            node.forward_messages()
+            return
+
+        node.append_message(message, size)
+        node.forward_messages()
+
+        delivery.update(_proton.Delivery.ACCEPTED)
+        delivery.settle()
+
+    def on_transport_error(self, event):
+        self.broker.error("Connection to another worker failed: {0}", event.transport.condition)
+
+# A large message read as its frames arrive.  On a local queue with
+# a free consumer, it passes to the consumer in pieces instead of being
+# assembled first.  The broker reads it only while the consumer's
+# session has less than the stream buffer size waiting to go out.
+# Until then, the data stays in the producer's session, whose window
+# stops the producer.  Frames sent to the consumer make room for more.
+# Other messages are assembled and then stored as usual.
+class _Stream:
+    def __init__(self, handler, node, delivery):
+        self.handler = handler
+        self.node = node
+        self.broker = handler.broker
+        self.delivery = delivery
+
+        self.consumer = None
+        self.outbound = None
+        self.failed = False # The consumer went away mid-message
+
+        # The header, which says whether the message is durable, comes
+        # first.  Durable messages are read whole for the journal, as
+        # are messages for the anonymous relay and nodes that do not
+        # stream.
+        self.buffer = bytearray(delivery.link.recv(delivery.pending))
+        self.size = len(self.buffer)
+        self.whole = node is None or not node.streaming or node.durable and _is_durable(self.buffer)
+
+    def __repr__(self):
+        return "stream of {0}".format(_delivery_repr(self.delivery))
+
+    # True while the consumer has a stream buffer's worth of the
+    # message still to send
+    @property
+    def blocked(self):
+        if self.consumer is None:
+            return False
+
+        return self.consumer.session.outgoing_bytes >= self.broker.stream_buffer
+
+    def update(self):
+        delivery = self.delivery
+
+        if delivery.aborted:
+            self.abort()
+            return
+
+        if self.consumer is None and not self.failed and not self.whole:
+            self.claim_consumer()
+
+        if delivery.partial and self.blocked:
+            return
+
+        if delivery.pending:
+            data = delivery.link.recv(delivery.pending)
+            self.size += len(data)
+
+            if self.consumer is not None:
+                self.consumer.send(data)
+            elif not self.failed:
+                self.buffer += data
+
+        if not delivery.partial:
+            delivery.link.advance()
+            self.finish()
+
+    # Only a consumer with nothing queued ahead of the message keeps
+    # the queue in order
+    def claim_consumer(self):
+        node = self.node
+
+        if node.messages or not node.ready:
+            return
+
+        consumer = node.ready.popitem(last=False)[0]
+        node.busy[consumer] = self
+
+        self.consumer = consumer
+        self.outbound = consumer.delivery(consumer.delivery_tag())
+
+        if self.buffer:
+            consumer.send(self.buffer)
+            self.buffer = bytearray()
+
+    def finish(self):
+        node = self.node
+        delivery = self.delivery
+
+        self.close()
+
+        if self.whole:
+            self.handler.route_message(delivery, bytes(self.buffer), len(self.buffer))
+            return
+
+        if self.consumer is not None:
+            consumer = self.consumer
+
+            consumer.advance()
+
+            if _settles_on_send(consumer):
+                self.outbound.settle()
+
+            node.enqueued += 1
+            node.dequeued += 1
+
+            self.release_consumer()
+
+            if self.broker.tracing and self.broker.trace_sampled("streamed"):
+                self.broker.trace("Streamed message of {0} bytes on {1} to {2}", self.size, node,
+                                  _container_repr(consumer.connection))
+
+            state = _proton.Delivery.ACCEPTED
+        elif self.failed:
+            state = _proton.Delivery.RELEASED
+        else:
+            # No consumer came free, so it goes on the queue whole
+            node.store_message(delivery, self.buffer, len(self.buffer))
+            state = _proton.Delivery.ACCEPTED
+
+        delivery.update(state)
+        delivery.settle()
+
+        node.forward_messages()
+        node.grant_credit(delivery.link)
+
+    # The consumer went away.  The rest of the message is read and
+    # dropped, and the producer delivery is released.
+    def fail(self):
+        self.consumer = None
+        self.outbound = None
+        self.failed = True
+
+        self.update()
+
+    # The producer aborted the message or went away
+    def abort(self):
+        self.close()
+
+        if self.consumer is not None:
+            self.outbound.abort()
+            self.release_consumer()
+            self.node.forward_messages()
+
+        if self.delivery.aborted:
+            self.delivery.settle()
+
+    def release_consumer(self):
+        del self.node.busy[self.consumer]
+        self.node.update_consumer(self.consumer)
+
+    def close(self):
+        del self.handler.streams[self.delivery.link]
+
+# Accepts connections on a socket bound before the workers forked.
+# Proton's IO handler finds the transport of a selectable and the
+# selectable of a transport through the attributes set below, and it
+# skips the outbound connect for connections that have an acceptor.
+# These are internals of Proton's Python IO layer, so workers run only
+# with the Proton versions in _worker_proton_versions.
+class _SocketAcceptor(_proton.Handler):
+    def __init__(self, container, sock):
+        sock.setblocking(False)
+
+        self.container = container
+        self.socket = sock
+        self.ssl_domain = None
+
+        self.selectable = container.selectable(handler=self, delegate=sock)
+        self.selectable.reading = True
+        self.selectable._transport = None
+
+        container.update(self.selectable)
+
+    def set_ssl_domain(self, ssl_domain):
+        self.ssl_domain = ssl_domain
+
+    def on_selectable_readable(self, event):
+        try:
+            sock, name = self.socket.accept()
+        except BlockingIOError:
+            # Another worker sharing the socket took the connection
+            return
+
+        sock.setblocking(False)
+        sock.setsockopt(_socket.IPPROTO_TCP, _socket.TCP_NODELAY, True)
+
+        conn = self.container.connection(self.container.handler)
+        conn._acceptor = self
+
+        transport = _proton.Transport(_proton.Transport.SERVER)
+
+        if self.ssl_domain is not None:
+            transport.ssl(self.ssl_domain)
+
+        transport.bind(conn)
+
+        selectable = self.container.selectable(delegate=sock)
+        selectable._transport = transport
+        transport._selectable = selectable
+
+        _handlers.IOHandler.update(transport, selectable, self.container.now)
+
+# The oldest and newest Proton releases whose Python IO layer works
+# with _SocketAcceptor
+_worker_proton_versions = ((0, 28), (0, 40))
+
+# Maps addresses to workers.  Each worker has many points on the ring,
+# so the addresses spread evenly.  The hash is stable across
+# processes, unlike the builtin hash.
+class _HashRing:
+    def __init__(self, workers, points=64):
+        ring = sorted((_stable_hash("{0}-{1}".format(worker, i)), worker)
+                      for worker in range(workers) for i in range(points))
+
+        self.hashes = [x[0] for x in ring]
+        self.workers = [x[1] for x in ring]
+
+    def lookup(self, address):
+        index = _bisect.bisect(self.hashes, _stable_hash(address)) % len(self.hashes)
+        return self.workers[index]
+
+def _stable_hash(value):
+    return int.from_bytes(_hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+def _bind_sockets(host, port, count):
+    family, type, proto, _, address = _socket.getaddrinfo(host, port, type=_socket.SOCK_STREAM,
+                                                          flags=_socket.AI_PASSIVE)[0]
+    reuse_port = hasattr(_socket, "SO_REUSEPORT")
+    sockets = list()
+
+    for i in range(count if reuse_port else 1):
+        sock = _socket.socket(family, type, proto)
+        sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEADDR, 1)
+
+        if reuse_port:
+            sock.setsockopt(_socket.SOL_SOCKET, _socket.SO_REUSEPORT, 1)
+
+        sock.bind(address)
+        sock.listen(128)
+
+        # With port 0, the rest bind to the port the first one got
+        address = sock.getsockname()
+        sockets.append(sock)
+
+    return sockets
+
+# Reads each complete delivery as bytes and hands it to the broker
+# with the size of its data, decoding it first outside raw mode.
+# Everything else goes to the standard handling.
+class _DeliveryHandler(_handlers.IncomingMessageHandler):
+    def __init__(self, delegate):
+        super(_DeliveryHandler, self).__init__(True, delegate)
+
+    def on_delivery(self, event):
+        delivery = event.delivery
+        link = delivery.link
+
+        if link.is_receiver and self.delegate.stream_message(delivery):
+            return
+
+        if not link.is_receiver or delivery.aborted or not delivery.readable or delivery.partial:
+            super(_DeliveryHandler, self).on_delivery(event)
+            return
+
+        data = link.recv(delivery.pending)
+        link.advance()
+
+        if link.state & _proton.Endpoint.LOCAL_CLOSED:
+            delivery.update(_proton.Delivery.RELEASED)
+            delivery.settle()
+        else:
+            message = data
+
+            if not self.delegate.broker.raw:
+                message = _proton.Message()
+                message.decode(data)
+
+            self.delegate.route_message(delivery, message, len(data))
+
+_record_prefix = _struct.Struct("<BQI") # Type, number, payload length
+_record_crc = _struct.Struct("<I")
+_record_header_size = _record_prefix.size + _record_crc.size
+_address_length = _struct.Struct("<H")
+
+_ADD = 1
+_DELETE = 2
+
+# An append-only journal of durable queue messages, in numbered
+# segment files.  Each record is an add, carrying the queue address
+# and the encoded message, or a delete for a message that a consumer
+# has settled.  Records are buffered and written with one fsync per
+# group commit, when the buffer reaches the commit size or the commit
+# interval passes.  Producers get their deliveries settled only after
+# the fsync.  A segment file is removed once it and every older
+# segment hold no live messages.
+class _Journal:
+    def __init__(self, broker, dir, commit_interval, commit_bytes, segment_size=64 * 1024 * 1024):
+        self.broker = broker
+        self.dir = dir
+        self.commit_interval = commit_interval
+        self.commit_bytes = commit_bytes
+        self.segment_size = segment_size
+
+        self.buffer = bytearray()
+        self.pending = list() # Producer deliveries waiting for a commit
+        self.timer_scheduled = False
+
+        self.segments = _collections.OrderedDict() # Segment index to live message count
+        self.locations = dict() # Journal number to segment index
+        self.next_number = 0
+
+        self.segment = None
+        self.segment_fd = None
+        self.segment_written = 0
+
+    # Reads the existing segments and returns the live messages, in
+    # order, as (number, address, data) tuples.  New records go to a
+    # new segment.
+    def open(self):
+        _os.makedirs(self.dir, exist_ok=True)
+
+        live = _collections.OrderedDict()
+        indexes = sorted(int(x[8:-4]) for x in _os.listdir(self.dir)
+                         if x.startswith("journal-") and x.endswith(".log"))
+
+        for index in indexes:
+            self.segments[index] = 0
+
+            for type, number, payload in self._read_segment(index):
+                self.next_number = max(self.next_number, number + 1)
+
+                if type == _ADD:
+                    length = _address_length.unpack_from(payload)[0]
+                    start = _address_length.size
+                    address = bytes(payload[start:start + length]).decode("utf-8")
+
+                    live[number] = (address, payload[start + length:])
+                    self.locations[number] = index
+                    self.segments[index] += 1
+                elif type == _DELETE and number in live:
+                    del live[number]
+                    self.segments[self.locations.pop(number)] -= 1
+
+        self._open_segment(indexes[-1] + 1 if indexes else 0)
+        self._remove_segments()
+
+        return [(number, address, data) for number, (address, data) in live.items()]
+
+    # A torn or corrupt record ends the segment.  The rest is cut off.
+    def _read_segment(self, index):
+        path = self._segment_path(index)
+
+        with open(path, "rb") as f:
+            data = f.read()
+
+        offset = 0
+
+        while offset + _record_header_size <= len(data):
+            type, number, length = _record_prefix.unpack_from(data, offset)
+            crc = _record_crc.unpack_from(data, offset + _record_prefix.size)[0]
+            start = offset + _record_header_size
+            payload = data[start:start + length]
+
+            if len(payload) < length or _zlib.crc32(payload, _zlib.crc32(data[offset:offset + _record_prefix.size])) != crc:
+                break
+
+            yield type, number, payload
+
+            offset = start + length
+
+        if offset < len(data):
+            self.broker.warn("Truncating journal segment {0} at offset {1} of {2}", path, offset, len(data))
+
+            with open(path, "r+b") as f:
+                f.truncate(offset)
+
+    def _segment_path(self, index):
+        return _os.path.join(self.dir, "journal-{0:08d}.log".format(index))
+
+    def _open_segment(self, index):
+        if self.segment_fd is not None:
+            _os.close(self.segment_fd)
+
+        self.segment = index
+        self.segment_fd = _os.open(self._segment_path(index), _os.O_WRONLY | _os.O_CREAT | _os.O_APPEND, 0o644)
+        self.segment_written = 0
+        self.segments[index] = 0
+
+        _fsync_dir(self.dir)
+
+    def _remove_segments(self):
+        while self.segments:
+            index, count = next(iter(self.segments.items()))
+
+            if index == self.segment or count > 0:
+                break
+
+            del self.segments[index]
+            _os.unlink(self._segment_path(index))
+
+    def _append(self, type, number, payload):
+        prefix = _record_prefix.pack(type, number, len(payload))
+        crc = _zlib.crc32(payload, _zlib.crc32(prefix))
+
+        self.buffer += prefix
+        self.buffer += _record_crc.pack(crc)
+        self.buffer += payload
+
+        if len(self.buffer) >= self.commit_bytes:
+            self.commit()
+        elif not self.timer_scheduled:
+            self.timer_scheduled = True
+            self.broker.container.schedule(self.commit_interval, self)
+
+    # Returns the journal number of the message.  The producer's
+    # delivery, if given, is settled when the add is committed.
+    def add(self, address, message, delivery):
+        number = self.next_number
+        self.next_number += 1
+
+        if isinstance(message, _proton.Message):
+            message = message.encode()
+
+        address = address.encode("utf-8")
+
+        self.locations[number] = self.segment
+        self.segments[self.segment] += 1
+
+        if delivery is not None:
+            self.pending.append(delivery)
+
+        self._append(_ADD, number, _address_length.pack(len(address)) + address + message)
+
+        return number
+
+    def delete(self, number):
+        try:
+            index = self.locations.pop(number)
+        except KeyError:
+            return
+
+        self.segments[index] -= 1
+        self._append(_DELETE, number, b"")
+
+    def on_timer_task(self, event):
+        self.timer_scheduled = False
+        self.commit()
+
+    def commit(self):
+        if not self.buffer:
+            return
+
+        _os.write(self.segment_fd, self.buffer)
+        _os.fsync(self.segment_fd)
+
+        self.segment_written += len(self.buffer)
+        self.buffer = bytearray()
+
+        pending = self.pending
+        self.pending = list()
+
+        for delivery in pending:
+            delivery.update(_proton.Delivery.ACCEPTED)
+            delivery.settle()
+
+        self.broker.debug("Committed {0} messages to the journal", len(pending))
+
+        if self.segment_written >= self.segment_size:
+            self._open_segment(self.segment + 1)
+
+        self._remove_segments()
+
+# Writes a JSON line with the state of each node and the process
+# CPU time and RSS every interval, to a file, to the clients of a
+# local Unix socket, or both.  Counters are totals since the start, so
+# readers get rates from the difference between lines.  A socket
+# client that falls behind is dropped rather than buffered for.
+class _Metrics:
+    def __init__(self, broker, file, socket_path, interval):
+        self.broker = broker
+        self.interval = interval
+
+        self.fd = None
+        self.socket_path = socket_path
+        self.socket = None
+        self.clients = list()
+
+        # Workers share the file, so each line goes in one append
+        if file is not None:
+            self.fd = _os.open(file, _os.O_WRONLY | _os.O_CREAT | _os.O_APPEND, 0o644)
+
+        if self.socket_path is not None:
+            # Each worker serves its own socket
+            if self.broker.worker is not None:
+                self.socket_path = "{0}.{1}".format(self.socket_path, self.broker.worker)
+
+            if _os.path.exists(self.socket_path):
+                _os.remove(self.socket_path)
+
+            self.socket = _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM)
+            self.socket.bind(self.socket_path)
+            self.socket.listen(8)
+            self.socket.setblocking(False)
+
+            self.broker.notice("Serving metrics on '{0}'", self.socket_path)
+
+    def start(self, container):
+        container.schedule(self.interval, self)
+
+    def on_timer_task(self, event):
+        self.emit()
+        event.container.schedule(self.interval, self)
+
+    def emit(self):
+        line = "{0}\n".format(_json.dumps(self.capture())).encode("utf-8")
+
+        if self.fd is not None:
+            _os.write(self.fd, line)
+
+        if self.socket is not None:
+            self._accept_clients()
+            self._send(line)
+
+    def capture(self):
+        usage = _resource.getrusage(_resource.RUSAGE_SELF)
+
+        return {
+            "timestamp": _time.time(),
+            "broker": self.broker.id,
+            "worker": self.broker.worker,
+            "cpu_time": usage.ru_utime + usage.ru_stime,
+            "rss": _process_rss(usage),
+            "nodes": [x.metrics() for x in self.broker._nodes.values()],
+        }
+
+    def _accept_clients(self):
+        while True:
+            try:
+                client, address = self.socket.accept()
+            except BlockingIOError:
+                return
+
+            client.setblocking(False)
+            self.clients.append(client)
+
+    def _send(self, line):
+        for client in list(self.clients):
+            try:
+                sent = client.send(line)
+            except OSError:
+                sent = 0
+
+            if sent < len(line):
+                self.clients.remove(client)
+                client.close()
+
+    def close(self):
+        if self.fd is not None:
+            _os.close(self.fd)
+
+        if self.socket is not None:
+            for client in self.clients:
+                client.close()
+
+            self.socket.close()
+
+            try:
+                _os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+
+# The current RSS in bytes where /proc has it, or else the peak
+def _process_rss(usage):
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * _resource.getpagesize()
+    except OSError:
+        pass
+
+    if _sys.platform == "darwin":
+        return usage.ru_maxrss
+
+    return usage.ru_maxrss * 1024
+
+def _fsync_dir(dir):
+    fd = _os.open(dir, _os.O_RDONLY)
+
+    try:
+        _os.fsync(fd)
+    finally:
+        _os.close(fd)
+
+# Reads the durable field of the header section, if there is one,
+# without decoding the message.  The header always comes first.
+def _is_durable(message):
+    if isinstance(message, _proton.Message):
+        return message.durable
+
+    if message[:3] != b"\x00\x53\x70":
+        return False
+
+    code = message[3]
+
+    if code == 0xc0: # list8
+        count, field = message[5], 6
+    elif code == 0xd0: # list32
+        count, field = int.from_bytes(message[8:12], "big"), 12
+    else: # list0 or unexpected
+        return False
+
+    if count == 0:
+        return False
+
+    return message[field] == 0x41 or (message[field] == 0x56 and message[field + 1] == 1)
+
+def _grant_credit(link, window):
+    if link.credit < window:
+        link.flow(window - link.credit)
+
+# Sender.send with bytes only streams to the current delivery, so
+# raw messages need their own delivery
+def _send_message(link, message):
+    if isinstance(message, _proton.Message):
+        return link.send(message)
+
+    delivery = link.delivery(link.delivery_tag())
+
+    link.send(message)
+    link.advance()
+
+    if _settles_on_send(link):
+        delivery.settle()
+
+    return delivery
+
+# True if the broker settles its deliveries on the link as it sends
+# them, so no outcome comes back
+def _settles_on_send(link):
+    return link.snd_settle_mode == _proton.Link.SND_SETTLED
+
+def _message_repr(message):
+    if isinstance(message, _proton.Message):
+        return message
+
+    return "message of {0} bytes".format(len(message))
+
+def _container_repr(connection):
+    return "client '{0}'".format(connection.remote_container)
+
+def _terminus_repr(terminus):
+    return "terminus '{0}'".format(terminus.address)
+
+_outcomes = {
+    _proton.Delivery.ACCEPTED: "accepted",
+    _proton.Delivery.RELEASED: "released",
+    _proton.Delivery.MODIFIED: "modified",
+}
+
+def _delivery_repr(delivery):
+    return "delivery '{0}'".format(delivery.tag)
+
+# If the ready file is a named pipe, the caller wakes up as soon as
+# the broker writes to it.  A regular file is polled.
+def await_broker(ready_file, timeout=30):
+    if _stat.S_ISFIFO(_os.stat(ready_file).st_mode):
+        _await_broker_pipe(ready_file, timeout)
+        return
+
+    start_time = _time.time()
+    interval = 0.125
+
+    while True:
+        if _time.time() - start_time > timeout:
+            raise Exception("Timed out waiting for the broker")
+
+        _time.sleep(interval)
+
+        with open(ready_file, "r") as f:
+            if f.read() == "ready\n":
+                break
+
+        if interval < 1:
+            interval = interval * 2
+        else:
+            print("Still waiting for the broker")
+
+def _await_broker_pipe(ready_file, timeout):
+    deadline = _time.time() + timeout
+
+    # The extra write end keeps the read end from seeing end of file
+    read_fd = _os.open(ready_file, _os.O_RDONLY | _os.O_NONBLOCK)
+    write_fd = _os.open(ready_file, _os.O_WRONLY)
+    data = b""
+
+    try:
+        while b"ready\n" not in data:
+            remaining = deadline - _time.time()
+
+            if remaining <= 0 or not _select.select([read_fd], [], [], remaining)[0]:
+                raise Exception("Timed out waiting for the broker")
+
+            data += _os.read(read_fd, 64)
+    finally:
+        _os.close(read_fd)
+        _os.close(write_fd)
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="An AMQP message broker for testing")
+
+    parser.add_argument("--host", metavar="HOST", default="localhost",
+                        help="Listen for connections on HOST (default localhost)")
+    parser.add_argument("--port", metavar="PORT", default=5672, type=int,
+                        help="Listen for connections on PORT (default 5672)")
+    parser.add_argument("--id", metavar="ID",
+                        help="Set the container identity to ID (default is generated)")
+    parser.add_argument("--ready-file", metavar="FILE",
+                        help="The file used to indicate the server is ready")
+    # parser.add_argument("--user", metavar="USER",
+    #                     help="Require USER")
+    # parser.add_argument("--password", metavar="SECRET",
+    #                     help="Require SECRET")
+    # parser.add_argument("--allowed-mechs", metavar="MECHS", default="anonymous,plain",
+    #                     help="Restrict allowed SASL mechanisms to MECHS (default \"anonymous,plain\")")
+    parser.add_argument("--cert", metavar="FILE",
+                        help="The TLS certificate file.  "
+                        "If set, TLS is enabled and you must also set --key.")
+    parser.add_argument("--key", metavar="FILE",
+                        help="The TLS private key file")
+    parser.add_argument("--trust", metavar="FILE",
+                        help="The file containing trusted client certificates.  "
+                        "If set, the server verifies client certificates.")
+    parser.add_argument("--topic", metavar="ADDRESS", action="append",
+                        help="Configure multicast distribution for ADDRESS")
+    parser.add_argument("--raw", action="store_true",
+                        help="Forward messages without decoding them")
+    parser.add_argument("--retain-messages", metavar="COUNT", type=int,
+                        help="Keep at most COUNT messages on each topic (default unlimited)")
+    parser.add_argument("--retain-bytes", metavar="BYTES", type=int,
+                        help="Keep at most BYTES of messages on each topic (default unlimited)")
+    parser.add_argument("--max-queue-messages", metavar="COUNT", type=int,
+                        help="Stop granting credit to producers when a queue holds COUNT messages")
+    parser.add_argument("--max-queue-bytes", metavar="BYTES", type=int,
+                        help="Stop granting credit to producers when a queue holds BYTES of messages")
+    parser.add_argument("--journal", metavar="DIR",
+                        help="Keep durable queue messages in a journal in DIR")
+    parser.add_argument("--commit-interval", metavar="MILLIS", type=float, default=2,
+                        help="Wait at most MILLIS before committing the journal (default 2)")
+    parser.add_argument("--commit-bytes", metavar="BYTES", type=int, default=1024 * 1024,
+                        help="Commit the journal when BYTES are waiting (default 1048576)")
+    parser.add_argument("--workers", metavar="COUNT", type=int, default=1,
+                        help="Run COUNT broker processes sharing the port (default 1)")
+    parser.add_argument("--end-to-end", action="store_true",
+                        help="Accept each message from a producer only when a consumer accepts it")
+    parser.add_argument("--metrics-file", metavar="FILE",
+                        help="Append queue and process metrics to FILE as JSON lines")
+    parser.add_argument("--metrics-socket", metavar="PATH",
+                        help="Serve queue and process metrics as JSON lines on a Unix socket at PATH")
+    parser.add_argument("--metrics-interval", metavar="SECONDS", type=float, default=1,
+                        help="Emit metrics every SECONDS (default 1)")
+    parser.add_argument("--trace", action="store_true",
+                        help="Log each message the broker stores, forwards, and settles")
+    parser.add_argument("--trace-sample", metavar="COUNT", type=int, default=1,
+                        help="Trace one message in COUNT (default 1)")
+    parser.add_argument("--stream-buffer", metavar="BYTES", type=int, default=0,
+                        help="With --raw, pass large messages through in pieces, buffering at most "
+                        "BYTES of each (default 0, disabled)")
+    parser.add_argument("--quiet", action="store_true",
+                        help="Print no logging to the console")
+    parser.add_argument("--verbose", action="store_true",
+                        help="Print detailed logging to the console")
+    parser.add_argument("--debug", action="store_true",
+                        help="Print debugging output")
+    parser.add_argument("--init-only", action="store_true",
+                        help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    class _Broker(Broker):
+        def debug(self, message, *args):
+            if self.debug_enabled:
+                self.log(message, *args)
+
+        def trace(self, message, *args):
+            self.log(message, *args)
+
+        def info(self, message, *args):
+            if self.verbose:
+                self.log(message, *args)
+
+        def notice(self, message, *args):
+            if not self.quiet:
+                self.log(message, *args)
+
+        def warn(self, message, *args):
+            message = "Warning! {0}".format(message)
+            self.log(message, *args)
+
+        def error(self, message, *args):
+            message = "Error! {0}".format(message)
+            self.log(message, *args)
+
+    broker = _Broker(args.host, args.port, id=args.id, ready_file=args.ready_file,
+                     # user=args.user, password=args.password, allowed_mechs=args.allowed_mechs,
+                     cert=args.cert, key=args.key, trust=args.trust,
+                     topics=args.topic, raw=args.raw,
+                     retain_messages=args.retain_messages, retain_bytes=args.retain_bytes,
+                     max_queue_messages=args.max_queue_messages, max_queue_bytes=args.max_queue_bytes,
+                     journal_dir=args.journal, commit_interval=args.commit_interval / 1000,
+                     commit_bytes=args.commit_bytes, workers=args.workers,
+                     end_to_end=args.end_to_end,
+                     metrics_file=args.metrics_file, metrics_socket=args.metrics_socket,
+                     metrics_interval=args.metrics_interval,
+                     trace=args.trace, trace_sample=args.trace_sample,
+                     stream_buffer=args.stream_buffer if args.raw else 0,
+                     quiet=args.quiet, verbose=args.verbose, debug_enabled=args.debug,
+                     init_only=args.init_only)
+
+    try:
+        broker.run()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+# Self-contained SVG charts.  This module has no dependencies outside
+# the standard library so the report scripts can use it directly.
+
+import math as _math
+
+from xml.sax.saxutils import escape as _escape
+
+_colors = ["#1f77b4", "#ff7f0e", "#2ca02c", "#d62728", "#9467bd", "#8c564b"]
+
+_width = 640
+_height = 360
+_margin_left = 70
+_margin_right = 130
+_margin_top = 20
+_margin_bottom = 50
+
+# 'series' is a list of (name, points) tuples, where 'points' is a
+# list of (x, y) pairs.  Points with a y value of None are skipped.
+def line_chart(series, x_label, y_label, width=_width, height=_height):
+    points = [p for name, values in series for p in values if p[1] is not None]
+
+    if not points:
+        return _empty_chart(width, height)
+
+    x_ticks = _ticks(min(p[0] for p in points), max(p[0] for p in points))
+    y_ticks = _ticks(0, max(p[1] for p in points))
+
+    plot = _Plot(width, height, x_ticks, y_ticks)
+    out = plot.start(x_label, y_label)
+
+    for i, (name, values) in enumerate(series):
+        color = _colors[i % len(_colors)]
+        coords = ["{:.1f},{:.1f}".format(plot.x(x), plot.y(y)) for x, y in values if y is not None]
+
+        if coords:
+            out.append('<polyline fill="none" stroke="{}" stroke-width="2" points="{}"/>'.format(color, " ".join(coords)))
+
+            for coord in coords:
+                cx, cy = coord.split(",")
+                out.append('<circle cx="{}" cy="{}" r="3" fill="{}"/>'.format(cx, cy, color))
+
+        out += plot.legend_entry(i, name, color)
+
+    out.append("</svg>")
+
+    return "\n".join(out)
+
+# 'bars' is a list of (name, value) tuples.  The bars are horizontal,
+# one per row, so long names fit.  Bars with a value of None are left
+# empty.
+def bar_chart(bars, x_label, width=_width, bar_height=18):
+    values = [value for name, value in bars if value is not None]
+
+    if not values:
+        return _empty_chart(width, _margin_top + _margin_bottom)
+
+    label_width = min(320, 12 + 6 * max(len(name) for name, value in bars))
+    height = _margin_top + _margin_bottom + bar_height * len(bars)
+    x_ticks = _ticks(0, max(values))
+
+    left = label_width
+    right = width - 20
+    top = _margin_top
+    bottom = height - _margin_bottom
+
+    def x(value):
+        return left + value / x_ticks[-1] * (right - left)
+
+    out = [
+        '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+        'font-family="sans-serif" font-size="11">'.format(width, height),
+    ]
+
+    for tick in x_ticks:
+        out.append('<line x1="{0:.1f}" y1="{1}" x2="{0:.1f}" y2="{2}" stroke="#ddd"/>'.format(x(tick), top, bottom))
+        out.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format(x(tick), bottom + 16, _format_tick(tick)))
+
+    for i, (name, value) in enumerate(bars):
+        y = top + i * bar_height
+
+        out.append('<text x="{}" y="{:.1f}" text-anchor="end">{}</text>'.format(left - 6, y + bar_height * 0.7,
+                                                                             _escape(name)))
+
+        if value is None:
+            continue
+
+        out.append('<rect x="{}" y="{:.1f}" width="{:.1f}" height="{:.1f}" fill="{}"><title>{}</title></rect>'.format \
+                   (left, y + 2, x(value) - left, bar_height - 4, _colors[0], _escape(_format_tick(value))))
+
+    out.append('<line x1="{0}" y1="{1}" x2="{0}" y2="{2}" stroke="#999"/>'.format(left, top, bottom))
+    out.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format \
+               (left + (right - left) / 2, height - 10, _escape(x_label)))
+    out.append("</svg>")
+
+    return "\n".join(out)
+
+class _Plot:
+    def __init__(self, width, height, x_ticks, y_ticks):
+        self.width = width
+        self.height = height
+        self.x_ticks = x_ticks
+        self.y_ticks = y_ticks
+
+        self.left = _margin_left
+        self.right = width - _margin_right
+        self.top = _margin_top
+        self.bottom = height - _margin_bottom
+
+        self.plot_width = self.right - self.left
+        self.plot_height = self.bottom - self.top
+
+    def x(self, value):
+        lo, hi = self.x_ticks[0], self.x_ticks[-1]
+        return self.left + (value - lo) / ((hi - lo) or 1) * self.plot_width
+
+    def y(self, value):
+        lo, hi = self.y_ticks[0], self.y_ticks[-1]
+        return self.bottom - (value - lo) / ((hi - lo) or 1) * self.plot_height
+
+    def start(self, x_label, y_label):
+        out = [
+            '<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+            'font-family="sans-serif" font-size="11">'.format(self.width, self.height),
+            '<rect x="{}" y="{}" width="{}" height="{}" fill="none" stroke="#999"/>'.format \
+            (self.left, self.top, self.plot_width, self.plot_height),
+        ]
+
+        for tick in self.y_ticks:
+            y = self.y(tick)
+            out.append('<line x1="{}" y1="{:.1f}" x2="{}" y2="{:.1f}" stroke="#ddd"/>'.format(self.left, y, self.right, y))
+            out.append('<text x="{}" y="{:.1f}" text-anchor="end">{}</text>'.format(self.left - 6, y + 4, _format_tick(tick)))
+
+        for tick in self.x_ticks:
+            x = self.x(tick)
+            out.append('<line x1="{:.1f}" y1="{}" x2="{:.1f}" y2="{}" stroke="#ddd"/>'.format(x, self.top, x, self.bottom))
+            out.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format(x, self.bottom + 16, _format_tick(tick)))
+
+        out.append('<text x="{:.1f}" y="{}" text-anchor="middle">{}</text>'.format \
+                   (self.left + self.plot_width / 2, self.height - 10, _escape(x_label)))
+
+        cx, cy = 16, self.top + self.plot_height / 2
+        out.append('<text x="{0}" y="{1:.1f}" text-anchor="middle" transform="rotate(-90 {0} {1:.1f})">{2}</text>'.format \
+                   (cx, cy, _escape(y_label)))
+
+        return out
+
+    def legend_entry(self, index, name, color):
+        x = self.right + 12
+        y = self.top + 10 + index * 18
+
+        return [
+            '<rect x="{}" y="{}" width="12" height="3" fill="{}"/>'.format(x, y - 4, color),
+            '<text x="{}" y="{}">{}</text>'.format(x + 18, y, _escape(name)),
+        ]
+
+def _empty_chart(width, height):
+    return ('<svg xmlns="http://www.w3.org/2000/svg" width="{0}" height="{1}" viewBox="0 0 {0} {1}" '
+            'font-family="sans-serif" font-size="11">'
+            '<text x="{2}" y="{3}" text-anchor="middle">No data</text></svg>').format(width, height, width / 2, height / 2)
+
+def _ticks(lo, hi, count=5):
+    if hi <= lo:
+        hi = lo + 1
+
+    step = (hi - lo) / count
+    magnitude = 10 ** _math.floor(_math.log10(step))
+
+    for factor in (1, 2, 5, 10):
+        if step <= factor * magnitude:
+            step = factor * magnitude
+            break
+
+    start = _math.floor(lo / step) * step
+    ticks = [start]
+
+    while ticks[-1] < hi:
+        ticks.append(ticks[-1] + step)
+
+    return ticks
+
+def _format_tick(value):
+    if value >= 1000 * 1000 and value % (1000 * 1000) == 0:
+        return "{:,.0f}m".format(value / (1000 * 1000))
+
+    if value >= 1000 and value % 1000 == 0:
+        return "{:,.0f}k".format(value / 1000)
+
+    if value == int(value):
+        return "{:,.0f}".format(value)
+
+    return "{:,.1f}".format(value)
@@ -0,0 +1,582 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import numpy as _numpy
+import os as _os
+import plano as _plano
+import shlex as _shlex
+import subprocess as _subprocess
+import time as _time
+
+from .arrow import _StatusSnapshot, _compute_latency_stats
+from .common import *
+from .common import __version__
+from .common import _epilog_urls
+from .common import _epilog_arrow_impls
+from .common import _epilog_count_and_duration_formats
+from .results import ResultsDatabase, get_impl_version, record_pair_run
+
+_description = """
+Start a sender-receiver pair for a particular messaging address.
+
+'quiver' is one of the Quiver tools for testing the performance of
+message servers and APIs.
+"""
+
+_epilog = """
+{_epilog_urls}
+
+{_epilog_count_and_duration_formats}
+
+{_epilog_arrow_impls}
+
+example peer-to-peer usage:
+  $ quiver                        # Run the test using the default C arrow
+
+example client-server usage:
+  $ qdrouterd &                   # Start a server listening on localhost
+  $ quiver q0                     # Run the test
+
+message checking:
+  With --set-message-id, quiver joins the sender and receiver
+  transfers by message ID after the run and reports lost, duplicated,
+  and out-of-order messages.  If any messages were lost, it reports no
+  throughput and exits with a non-zero code.
+""".format(**globals())
+
+class QuiverPairCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverPairCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        self.parser.add_argument("url", metavar="URL", nargs="?",
+                                 help="The location of a message source or target "
+                                 "(if not set, quiver runs in peer-to-peer mode)")
+        self.parser.add_argument("--output", metavar="DIR",
+                                 help="Save output files to DIR")
+        self.parser.add_argument("--impl", metavar="IMPL", default=DEFAULT_ARROW_IMPL,
+                                 help="Use IMPL to send and receive " \
+                                 "(default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--sender", metavar="IMPL",
+                                 help="Use IMPL to send (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--receiver", metavar="IMPL",
+                                 help="Use IMPL to receive (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--max-backlog", metavar="COUNT", default="0",
+                                 help="Fail if more than COUNT messages are sent but not yet received "
+                                 "(default 0, no limit)")
+
+        self.add_peer_to_peer_arguments()
+        self.add_common_test_arguments()
+        self.add_common_tool_arguments()
+        self.add_common_tls_arguments()
+
+        self.start_time = None
+        self.results = None
+
+    def init(self):
+        super(QuiverPairCommand, self).init()
+
+        impl = self.args.impl
+
+        self.sender_impl = require_impl(self.args.sender, impl)
+        self.receiver_impl = require_impl(self.args.receiver, impl)
+
+        self.init_url_attributes()
+        self.init_output_dir()
+        self.init_common_test_attributes()
+        self.init_common_tool_attributes()
+
+        self.max_backlog = self.parse_count(self.args.max_backlog)
+
+        self.snapshots_file = _plano.join(self.output_dir, "pair-snapshots.csv")
+        self.summary_file = _plano.join(self.output_dir, "pair-summary.json")
+
+        self.backlog_max = None
+        self.backlog_average = None
+
+    def run(self):
+        args = [
+            "--duration", self.args.duration,
+            "--count", self.args.count,
+            "--rate", self.args.rate,
+            "--body-size", self.args.body_size,
+            "--credit", self.args.credit,
+            "--transaction-size", self.args.transaction_size,
+            "--timeout", self.args.timeout,
+        ]
+
+        if self.durable:
+            args += ["--durable"]
+
+        if self.set_message_id:
+            args += ["--set-message-id"]
+
+        if self.quiet:
+            args += ["--quiet"]
+
+        if self.verbose:
+            args += ["--verbose"]
+
+        if self.args.cert and self.args.key:
+            args += ["--key", self.args.key]
+            args += ["--cert", self.args.cert]
+
+        args += ["--output", self.output_dir]
+
+        sender_args = ["quiver-arrow", "send", self.url, "--impl", self.sender_impl.name] + args
+        receiver_args = ["quiver-arrow", "receive", self.url, "--impl", self.receiver_impl.name] + args
+
+        if self.args.url is None:
+            receiver_args += ["--server", "--passive"]
+
+        self.start_time = now()
+
+        # with working_env(PN_LOG=frame, DEBUG="*"):
+        receiver = _plano.start(receiver_args)
+
+        if self.args.url is None:
+            _plano.await_port(self.port, host=self.host)
+
+        # with working_env(PN_LOG=frame, DEBUG="*"):
+        sender = _plano.start(sender_args)
+
+        try:
+            self.monitor_status(sender, receiver)
+
+            _plano.wait(receiver, check=True)
+            _plano.wait(sender, check=True)
+        except _plano.PlanoProcessError as e:
+            _plano.error(e)
+        finally:
+            _plano.stop(sender)
+            _plano.stop(receiver)
+
+        if (sender.exit_code, receiver.exit_code) != (0, 0):
+            _plano.exit(1)
+
+        self.compute_results()
+        self.save_summary()
+
+        if self.results_db is not None:
+            self.record_results()
+
+        if not self.quiet:
+            self.print_summary()
+
+        join = self.results["join"]
+
+        if join is not None and join["lost"] > 0:
+            _plano.exit("{:,} {} lost", join["lost"], _plano.plural("message", join["lost"]))
+
+    def compute_results(self):
+        sender = _plano.read_json(_plano.join(self.output_dir, "sender-summary.json"))
+        receiver = _plano.read_json(_plano.join(self.output_dir, "receiver-summary.json"))
+
+        count = receiver["results"]["message_count"]
+
+        start_time = sender["results"]["first_send_time"]
+        end_time = receiver["results"]["last_receive_time"]
+
+        duration = (end_time - start_time) / 1000
+        rate = None
+        data_rate = None
+
+        if duration > 0:
+            rate = count / duration
+            data_rate = rate * self.body_size / (1000 * 1000)
+
+        self.results = {
+            "message_count": count,
+            "duration": duration,
+            "message_rate": rate,
+            "data_rate": data_rate,
+            "latency_average": receiver["results"]["latency_average"],
+            "latency_quartiles": receiver["results"]["latency_quartiles"],
+            "latency_nines": receiver["results"]["latency_nines"],
+            "backlog_max": self.backlog_max,
+            "backlog_average": self.backlog_average,
+            "join": None,
+        }
+
+        if not self.set_message_id:
+            return
+
+        sent = _read_transfers(_plano.join(self.output_dir, "sender-transfers.csv.zst"))
+        received = _read_transfers(_plano.join(self.output_dir, "receiver-transfers.csv.zst"))
+
+        if sent is None or received is None:
+            _plano.warn("The sender or receiver did not record message IDs")
+            return
+
+        join, latencies = _join_transfers(sent, received, self.count != 0)
+
+        self.results["join"] = join
+
+        if len(latencies) > 0:
+            (self.results["latency_average"],
+             self.results["latency_quartiles"],
+             self.results["latency_nines"]) = _compute_latency_stats(latencies)
+
+        # Don't report throughput for a run that dropped messages
+        if join["lost"] > 0:
+            self.results["message_rate"] = None
+            self.results["data_rate"] = None
+
+    def save_summary(self):
+        props = {
+            "config": {
+                "sender": self.sender_impl.name,
+                "receiver": self.receiver_impl.name,
+                "url": self.url,
+                "output_dir": self.output_dir,
+                "duration": self.duration,
+                "count": self.count,
+                "rate": self.rate,
+                "body_size": self.body_size,
+                "credit_window": self.credit_window,
+                "transaction_size": self.transaction_size,
+                "durable": self.durable,
+                "set_message_id": self.set_message_id,
+                "max_backlog": self.max_backlog,
+            },
+            "results": self.results,
+        }
+
+        _plano.write_json(self.summary_file, props)
+
+    def record_results(self):
+        join = self.results["join"]
+        status = "FAILED" if join is not None and join["lost"] > 0 else "PASSED"
+
+        versions = {
+            "sender": get_impl_version("quiver-arrow", self.sender_impl.name),
+            "receiver": get_impl_version("quiver-arrow", self.receiver_impl.name),
+        }
+
+        record_pair_run(ResultsDatabase(self.results_db), "quiver", self.output_dir, dict(), status, versions)
+
+    def monitor_status(self, sender, receiver):
+        sender_snaps = _plano.join(self.output_dir, "sender-snapshots.csv")
+        receiver_snaps = _plano.join(self.output_dir, "receiver-snapshots.csv")
+
+        _plano.touch(sender_snaps)
+        _plano.touch(receiver_snaps)
+
+        ssnap, rsnap = None, None
+        last_ssnap, psnap = None, None
+        backlog_total, backlog_samples = 0, 0
+        i = 0
+
+        with open(sender_snaps, "rb") as fs, open(receiver_snaps, "rb") as fr, \
+             open(self.snapshots_file, "wb") as fp:
+            while receiver.poll() == None:
+                _time.sleep(1)
+
+                sline = _read_line(fs)
+                rline = _read_line(fr)
+
+                # print("S: {} R: {}".format(sline, rline))
+
+                if sline is not None:
+                    ssnap = _StatusSnapshot(self, None)
+                    ssnap.unmarshal(sline)
+                    last_ssnap = ssnap
+
+                if rline is not None:
+                    rsnap = _StatusSnapshot(self, None)
+                    rsnap.unmarshal(rline)
+
+                if rsnap is None:
+                    continue
+
+                if last_ssnap is not None:
+                    psnap = _PairSnapshot(psnap, last_ssnap, rsnap, sender.poll() is None)
+
+                    fp.write(psnap.marshal())
+                    fp.flush()
+
+                    self.backlog_max = max(psnap.backlog, self.backlog_max or 0)
+                    backlog_total += psnap.backlog
+                    backlog_samples += 1
+                    self.backlog_average = backlog_total / backlog_samples
+
+                if not self.quiet:
+                    if i % 20 == 0:
+                        self.print_status_headings()
+
+                    self.print_status_row(ssnap, rsnap, psnap)
+
+                if psnap is not None and self.max_backlog != 0 and psnap.backlog > self.max_backlog:
+                    raise CommandError("Backlog of {:,} messages exceeded the limit of {:,}",
+                                       psnap.backlog, self.max_backlog)
+
+                ssnap, rsnap = None, None
+                i += 1
+
+    column_groups = "{:-^53}  {:-^53}  {:-^24}  {:-^8}"
+    columns = "{:>8}  {:>13}  {:>10}  {:>7}  {:>7}  " \
+              "{:>8}  {:>13}  {:>10}  {:>7}  {:>7}  " \
+              "{:>10}  {:>12}  " \
+              "{:>8}"
+    heading_row_1 = column_groups.format(" Sender ", " Receiver ", " Backlog ", "")
+    heading_row_2 = columns.format \
+        ("Time [s]", "Count [m]", "Rate [m/s]", "CPU [%]", "RSS [M]",
+         "Time [s]", "Count [m]", "Rate [m/s]", "CPU [%]", "RSS [M]",
+         "Count [m]", "Growth [m/s]",
+         "Lat [ms]")
+    heading_row_3 = column_groups.format("", "", "", "")
+
+    def print_status_headings(self):
+        print(self.heading_row_1)
+        print(self.heading_row_2)
+        print(self.heading_row_3)
+
+    def print_status_row(self, ssnap, rsnap, psnap):
+        if ssnap is None:
+            stime, scount, srate, scpu, srss = "-", "-", "-", "-", "-"
+        else:
+            stime = (ssnap.timestamp - self.start_time) / 1000
+            srate = ssnap.period_count / (ssnap.period / 1000)
+            scpu = (ssnap.period_cpu_time / ssnap.period) * 100
+            srss = ssnap.rss / (1000 * 1024)
+
+            stime = "{:,.1f}".format(stime)
+            scount = "{:,d}".format(ssnap.count)
+            srate = "{:,.0f}".format(srate)
+            scpu = "{:,.0f}".format(scpu)
+            srss = "{:,.1f}".format(srss)
+
+        if rsnap is None:
+            rtime, rcount, rrate, rcpu, rrss = "-", "-", "-", "-", "-"
+            latency = "-"
+        else:
+            rtime = (rsnap.timestamp - self.start_time) / 1000
+            rrate = rsnap.period_count / (rsnap.period / 1000)
+            rcpu = (rsnap.period_cpu_time / rsnap.period) * 100
+            rrss = rsnap.rss / (1000 * 1024)
+
+            rtime = "{:,.1f}".format(rtime)
+            rcount = "{:,d}".format(rsnap.count)
+            rrate = "{:,.0f}".format(rrate)
+            rcpu = "{:,.0f}".format(rcpu)
+            rrss = "{:,.1f}".format(rrss)
+
+            latency = "{:,.0f}".format(rsnap.latency)
+
+        backlog, backlog_rate = "-", "-"
+
+        if psnap is not None:
+            backlog = "{:,d}".format(psnap.backlog)
+
+            if psnap.backlog_rate is not None:
+                backlog_rate = "{:,.0f}".format(psnap.backlog_rate)
+
+        row = self.columns.format(stime, scount, srate, scpu, srss,
+                                  rtime, rcount, rrate, rcpu, rrss,
+                                  backlog, backlog_rate,
+                                  latency)
+        print(row)
+
+    def print_summary(self):
+        sender = _plano.read_json(_plano.join(self.output_dir, "sender-summary.json"))
+        receiver = _plano.read_json(_plano.join(self.output_dir, "receiver-summary.json"))
+
+        print_heading("Configuration")
+
+        print_field("Sender", self.sender_impl.name)
+        print_field("Receiver", self.receiver_impl.name)
+        print_field("URL", self.url)
+        print_field("Output files", self.output_dir)
+
+        if self.count != 0:
+            print_numeric_field("Count", self.count, _plano.plural("message", self.count))
+
+        if self.duration != 0:
+            print_numeric_field("Duration", self.duration, _plano.plural("second", self.duration))
+
+        print_numeric_field("Body size", self.body_size, _plano.plural("byte", self.body_size))
+        print_numeric_field("Credit window", self.credit_window, _plano.plural("message", self.credit_window))
+
+        if self.transaction_size != 0:
+            print_numeric_field("Transaction size", self.transaction_size, _plano.plural("message", self.transaction_size))
+
+        if self.durable:
+            print_field("Durable", "Yes")
+
+        if self.set_message_id:
+            print_field("Set message ID", "Yes")
+
+        results = self.results
+        join = results["join"]
+
+        if join is not None:
+            print_heading("Delivery")
+
+            print_numeric_field("Sent", join["sent"], "messages")
+            print_numeric_field("Delivered", join["delivered"], "messages")
+            print_numeric_field("Lost", join["lost"], "messages")
+            print_numeric_field("Unreceived at end", join["unreceived"], "messages")
+            print_numeric_field("Duplicated", join["duplicated"], "messages")
+            print_numeric_field("Out of order", join["reordered"], "messages")
+            print_numeric_field("Unexpected", join["unexpected"], "messages")
+
+        print_heading("Results")
+
+        # XXX Sender and receiver CPU, RSS
+
+        print_numeric_field("Count", results["message_count"], _plano.plural("message", self.count))
+        print_numeric_field("Duration", results["duration"], "seconds", "{:,.1f}")
+
+        if join is not None and join["lost"] > 0:
+            print_field("Throughput", "Not reported: messages were lost")
+        else:
+            print_numeric_field("Sender rate", sender["results"]["message_rate"], "messages/s")
+            print_numeric_field("Receiver rate", receiver["results"]["message_rate"], "messages/s")
+            print_numeric_field("End-to-end rate", results["message_rate"], "messages/s")
+            print_numeric_field("End-to-end data rate", results["data_rate"], "MB/s", "{:,.1f}")
+
+        print_numeric_field("Max backlog", results["backlog_max"], "messages")
+        print_numeric_field("Average backlog", results["backlog_average"], "messages")
+
+        print()
+        print("Latencies by percentile:")
+        print()
+
+        print_latency_fields("0%", results["latency_quartiles"][0],
+                             "90.00%", results["latency_nines"][0])
+        print_latency_fields("25%", results["latency_quartiles"][1],
+                             "99.00%", results["latency_nines"][1])
+        print_latency_fields("50%", results["latency_quartiles"][2],
+                             "99.90%", results["latency_nines"][2])
+        print_latency_fields("100%", results["latency_quartiles"][4],
+                             "99.99%", results["latency_nines"][3])
+
+# The backlog is the number of messages sent but not yet received.
+# The sender and receiver snapshots are taken at different times, so
+# the sender count is adjusted to the receiver snapshot time using the
+# sender's most recent rate.  A sender that has exited sends nothing
+# more, so its count is not projected forward.
+class _PairSnapshot:
+    def __init__(self, previous, ssnap, rsnap, sender_running):
+        self.timestamp = rsnap.timestamp
+        self.sender_count = ssnap.count
+        self.receiver_count = rsnap.count
+        self.backlog_rate = None
+
+        offset = rsnap.timestamp - ssnap.timestamp
+
+        if not sender_running:
+            offset = min(0, offset)
+
+        if ssnap.period > 0:
+            offset = max(-ssnap.period, min(ssnap.period, offset))
+            self.sender_count += int(ssnap.period_count * offset / ssnap.period)
+
+        self.backlog = max(0, self.sender_count - self.receiver_count)
+
+        if previous is not None and self.timestamp > previous.timestamp:
+            period = (self.timestamp - previous.timestamp) / 1000
+            self.backlog_rate = (self.backlog - previous.backlog) / period
+
+    def marshal(self):
+        fields = (self.timestamp,
+                  self.sender_count,
+                  self.receiver_count,
+                  self.backlog,
+                  "" if self.backlog_rate is None else int(self.backlog_rate))
+
+        fields = map(str, fields)
+        line = "{}\n".format(",".join(fields))
+
+        return line.encode("ascii")
+
+def _read_line(file_):
+    fpos = file_.tell()
+    line = file_.readline()
+
+    if line == b"":
+        return None
+
+    if not line.endswith(b"\n"):
+        file_.seek(fpos)
+        return None
+
+    return line[:-1]
+
+# Returns an array of (send time, receive time, message ID) rows, or
+# None if the transfers have no message IDs
+def _read_transfers(transfers_file):
+    data = _subprocess.check_output(["zstd", "--decompress", "--stdout", "--quiet", transfers_file])
+    lines = data.count(b"\n")
+
+    try:
+        values = _numpy.fromstring(data.replace(b"\n", b","), dtype=_numpy.uint64, sep=",")
+    except ValueError:
+        return None
+
+    if lines == 0 or len(values) != lines * 3:
+        return None
+
+    return values.reshape(lines, 3)
+
+# Join sent and received transfers by message ID using a sorted merge.
+# Missing messages sent after the last delivered message are counted
+# as unreceived, not lost, unless 'expect_all' is set.  Returns the
+# join counts and the per-message latencies of delivered messages.
+def _join_transfers(sent, received, expect_all):
+    order = _numpy.argsort(sent[:, 2], kind="stable")
+    sent_ids = sent[order, 2]
+    send_times = sent[order, 0].astype(_numpy.int64)
+
+    received_ids = received[:, 2]
+    unique_ids, first_indexes = _numpy.unique(received_ids, return_index=True)
+
+    # A message is out of order if its first delivery comes after the
+    # first delivery of a message with a higher ID
+    first_ids = received_ids[_numpy.sort(first_indexes)]
+    reordered = _numpy.count_nonzero(first_ids[1:] < _numpy.maximum.accumulate(first_ids)[:-1])
+
+    indexes = _numpy.searchsorted(unique_ids, sent_ids)
+    delivered = unique_ids[_numpy.minimum(indexes, len(unique_ids) - 1)] == sent_ids
+    missing_ids = sent_ids[~delivered]
+
+    if expect_all or not delivered.any():
+        lost = len(missing_ids)
+    else:
+        lost = _numpy.count_nonzero(missing_ids < sent_ids[delivered][-1])
+
+    indexes = _numpy.searchsorted(sent_ids, received_ids)
+    matched = sent_ids[_numpy.minimum(indexes, len(sent_ids) - 1)] == received_ids
+    latencies = received[matched, 1].astype(_numpy.int64) - send_times[indexes[matched]]
+
+    join = {
+        "sent": len(sent_ids),
+        "received": len(received_ids),
+        "delivered": int(_numpy.count_nonzero(delivered)),
+        "lost": int(lost),
+        "unreceived": int(len(missing_ids) - lost),
+        "duplicated": int(len(received_ids) - len(unique_ids)),
+        "reordered": int(reordered),
+        "unexpected": int(len(unique_ids) - _numpy.count_nonzero(delivered)),
+        "lost_ids": [int(x) for x in missing_ids[:lost][:10]],
+    }
+
+    return join, latencies
@@ -0,0 +1,524 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import contextlib as _contextlib
+import json as _json
+import os as _os
+import platform as _platform
+import plano as _plano
+import sqlite3 as _sqlite3
+import time as _time
+
+from .common import *
+from .common import __version__
+
+_description = """
+Query the Quiver results database.
+
+'quiver', 'quiver-arrow', and 'quiver-bench' record each run in a
+SQLite database when given --results-db FILE.  'quiver-results query'
+lists the recorded runs, and 'quiver-results import' adds the runs
+from existing 'quiver-bench' output directories.
+"""
+
+_epilog = """
+database tables:
+  runs           One row per run with its configuration, results,
+                 implementation versions, and status
+  environments   The host, kernel, CPU model, and Quiver version
+  snapshots      The sender and receiver status snapshots of each run,
+                 about every two seconds
+
+The database is a plain SQLite file, so it can also be queried with
+the 'sqlite3' tool.
+
+example usage:
+  $ quiver-bench --results-db results.db
+  $ quiver-results query results.db --sender qpid-proton-c --since 2024-05-01
+  $ sqlite3 results.db "select sender, avg(message_rate) from runs group by sender"
+"""
+
+_schema = """
+pragma journal_mode = wal;
+
+create table if not exists environments (
+    id integer primary key,
+    hostname text,
+    system text,
+    kernel text,
+    cpu_model text,
+    cpu_count integer,
+    python_version text,
+    quiver_version text,
+    unique (hostname, system, kernel, cpu_model, cpu_count, python_version, quiver_version)
+);
+
+create table if not exists runs (
+    id integer primary key,
+    time integer not null,
+    command text not null,
+    session text,
+    trial integer,
+    status text,
+    output_dir text,
+    environment_id integer references environments (id),
+    sender text,
+    server text,
+    receiver text,
+    sender_version text,
+    server_version text,
+    receiver_version text,
+    url text,
+    duration integer,
+    count integer,
+    rate integer,
+    body_size integer,
+    credit_window integer,
+    transaction_size integer,
+    durable integer,
+    message_count integer,
+    message_rate real,
+    latency_average real,
+    {latency_columns},
+    cpu_time integer,
+    max_rss integer,
+    config text,
+    results text
+);
+
+create table if not exists snapshots (
+    run_id integer not null references runs (id) on delete cascade,
+    role text not null,
+    timestamp integer not null,
+    period integer,
+    count integer,
+    period_count integer,
+    latency integer,
+    cpu_time integer,
+    period_cpu_time integer,
+    rss integer
+);
+
+create index if not exists runs_time on runs (time);
+create index if not exists runs_test on runs (sender, server, receiver, time);
+create index if not exists runs_session on runs (session);
+create index if not exists runs_environment on runs (environment_id, time);
+create index if not exists runs_output_dir on runs (output_dir);
+create index if not exists snapshots_run on snapshots (run_id, role, timestamp);
+"""
+
+# '99.9' becomes 'latency_p99_9'
+def latency_column(percentile):
+    return "latency_p{}".format(percentile.replace(".", "_"))
+
+_schema = _schema.format(latency_columns=",\n    ".join("{} integer".format(latency_column(x))
+                                                       for x in LATENCY_PERCENTILES))
+
+_config_columns = ["sender", "server", "receiver", "url", "duration", "count", "rate",
+                   "body_size", "credit_window", "transaction_size", "durable"]
+
+class QuiverResultsCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverResultsCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        subparsers = self.parser.add_subparsers(title="subcommands", dest="subcommand", required=True)
+
+        query = subparsers.add_parser("query", help="List recorded runs")
+        query.add_argument("database", metavar="DATABASE",
+                           help="The results database file")
+        query.add_argument("--sender", metavar="IMPL",
+                           help="Show only runs using sender IMPL")
+        query.add_argument("--server", metavar="IMPL",
+                           help="Show only runs using server IMPL ('none' for peer-to-peer)")
+        query.add_argument("--receiver", metavar="IMPL",
+                           help="Show only runs using receiver IMPL")
+        query.add_argument("--command", metavar="COMMAND",
+                           help="Show only runs recorded by COMMAND")
+        query.add_argument("--session", metavar="ID",
+                           help="Show only runs from the bench session ID")
+        query.add_argument("--status", metavar="STATUS", choices=["PASSED", "FAILED"],
+                           help="Show only runs with STATUS")
+        query.add_argument("--since", metavar="DATE",
+                           help="Show only runs on or after DATE (YYYY-MM-DD)")
+        query.add_argument("--until", metavar="DATE",
+                           help="Show only runs before DATE (YYYY-MM-DD)")
+        query.add_argument("--limit", metavar="COUNT", type=int, default=20,
+                           help="Show at most COUNT runs, newest first (default 20, 0 for no limit)")
+        query.add_argument("--json", action="store_true",
+                           help="Print the runs as JSON")
+
+        import_ = subparsers.add_parser("import", help="Add runs from 'quiver-bench' output")
+        import_.add_argument("database", metavar="DATABASE",
+                             help="The results database file")
+        import_.add_argument("dirs", metavar="DIR", nargs="+",
+                             help="A 'quiver-bench' output directory")
+
+        self.add_common_tool_arguments()
+
+    def init(self):
+        super(QuiverResultsCommand, self).init()
+
+        self.init_common_tool_attributes()
+
+        self.subcommand = self.args.subcommand
+        self.database = ResultsDatabase(self.args.database)
+
+        if self.subcommand == "query":
+            if not _plano.exists(self.args.database):
+                raise CommandError("Database '{}' not found", self.args.database)
+
+            self.since = self.parse_date(self.args.since)
+            self.until = self.parse_date(self.args.until)
+        else:
+            for dir_ in self.args.dirs:
+                if not _plano.is_dir(dir_):
+                    raise CommandError("Directory '{}' not found", dir_)
+
+    def parse_date(self, value):
+        if value is None:
+            return None
+
+        try:
+            return int(_time.mktime(_time.strptime(value, "%Y-%m-%d")) * 1000)
+        except ValueError:
+            self.parser.error("Failure parsing '{}' as a date".format(value))
+
+    def run(self):
+        if self.subcommand == "query":
+            self.run_query()
+        else:
+            self.run_import()
+
+    def run_query(self):
+        args = self.args
+        filters = list()
+        values = list()
+
+        for name in ("sender", "receiver", "command", "session", "status"):
+            value = getattr(args, name)
+
+            if value is not None:
+                filters.append("{} = ?".format(name))
+                values.append(value)
+
+        if args.server == "none":
+            filters.append("server is null")
+        elif args.server is not None:
+            filters.append("server = ?")
+            values.append(args.server)
+
+        if self.since is not None:
+            filters.append("time >= ?")
+            values.append(self.since)
+
+        if self.until is not None:
+            filters.append("time < ?")
+            values.append(self.until)
+
+        runs = self.database.query_runs(filters, values, args.limit)
+
+        if args.json:
+            for run in runs:
+                run["config"] = _json.loads(run["config"])
+                run["results"] = _json.loads(run["results"])
+
+            print(_json.dumps(runs, indent=2))
+            return
+
+        if self.quiet:
+            return
+
+        columns = "{:>6}  {:<16}  {:<60}  {:>8}  {:>7}  {:>10}  {:>8}  {:>8}  {}"
+
+        print(columns.format("ID", "Time", "Test", "Body [B]", "Credit", "Rate [m/s]",
+                             "p50 [ms]", "p99 [ms]", "Status"))
+        print(columns.format("-" * 6, "-" * 16, "-" * 60, "-" * 8, "-" * 7, "-" * 10, "-" * 8, "-" * 8, "-" * 6))
+
+        for run in runs:
+            time = _time.strftime("%Y-%m-%d %H:%M", _time.localtime(run["time"] / 1000))
+            test = [x for x in (run["sender"], run["server"], run["receiver"]) if x is not None]
+
+            print(columns.format(run["id"], time, " -> ".join(test),
+                                 _format_count(run["body_size"]),
+                                 _format_count(run["credit_window"]),
+                                 _format_count(run["message_rate"]),
+                                 _format_count(run[latency_column("50")]),
+                                 _format_count(run[latency_column("99")]),
+                                 _plano.nvl(run["status"], "-")).rstrip())
+
+    def run_import(self):
+        count = 0
+
+        for dir_ in self.args.dirs:
+            count += import_bench_dir(self.database, dir_)
+
+        if not self.quiet:
+            print("Imported {:,} {}".format(count, _plano.plural("run", count)))
+
+class ResultsDatabase:
+    def __init__(self, file):
+        self.file = file
+
+    @_contextlib.contextmanager
+    def connect(self):
+        try:
+            conn = _sqlite3.connect(self.file, timeout=30)
+        except _sqlite3.Error as e:
+            raise CommandError("Failed opening results database '{}': {}", self.file, e)
+
+        try:
+            conn.row_factory = _sqlite3.Row
+            conn.executescript(_schema)
+
+            with conn:
+                yield conn
+        except _sqlite3.Error as e:
+            raise CommandError("Results database '{}' error: {}", self.file, e)
+        finally:
+            conn.close()
+
+    # Config and results use the field names of the quiver and
+    # quiver-arrow summary files.  Snapshots is a list of (role,
+    # snapshots file) pairs.  Time is the start of the run in epoch
+    # milliseconds.
+    def record_run(self, command, config, results, status, versions=dict(), output_dir=None,
+                   session=None, trial=None, snapshots=(), time=None):
+        run = {
+            "time": _plano.nvl(time, now()),
+            "command": command,
+            "session": session,
+            "trial": trial,
+            "status": status,
+            "output_dir": output_dir,
+            "sender_version": versions.get("sender"),
+            "server_version": versions.get("server"),
+            "receiver_version": versions.get("receiver"),
+            "config": _json.dumps(config),
+            "results": _json.dumps(results),
+        }
+
+        for name in _config_columns:
+            run[name] = config.get(name)
+
+        if results is not None:
+            run["message_count"] = results.get("message_count")
+            run["message_rate"] = results.get("message_rate")
+            run["latency_average"] = results.get("latency_average")
+            run["cpu_time"] = results.get("cpu_time")
+            run["max_rss"] = results.get("max_rss")
+
+            if results.get("latency_quartiles") is not None:
+                for percentile in LATENCY_PERCENTILES:
+                    run[latency_column(percentile)] = get_latency(results, percentile)
+
+        rows = list()
+
+        for role, file_ in snapshots:
+            for fields in _read_snapshots(file_):
+                rows.append([role] + fields)
+
+        with self.connect() as conn:
+            run["environment_id"] = _get_environment_id(conn)
+
+            names = list(run.keys())
+            sql = "insert into runs ({}) values ({})".format(", ".join(names), ", ".join("?" * len(names)))
+            run_id = conn.execute(sql, [run[x] for x in names]).lastrowid
+
+            conn.executemany("insert into snapshots values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             [[run_id] + x for x in rows])
+
+        return run_id
+
+    def query_runs(self, filters, values, limit):
+        sql = "select * from runs"
+
+        if filters:
+            sql += " where " + " and ".join(filters)
+
+        sql += " order by time desc, id desc"
+
+        if limit:
+            sql += " limit {}".format(int(limit))
+
+        with self.connect() as conn:
+            return [dict(x) for x in conn.execute(sql, values)]
+
+    def has_output_dir(self, output_dir):
+        with self.connect() as conn:
+            return conn.execute("select 1 from runs where output_dir = ? limit 1", [output_dir]).fetchone() is not None
+
+def _format_count(value):
+    if value is None:
+        return "-"
+
+    return "{:,.0f}".format(value)
+
+def _get_environment_id(conn):
+    env = get_environment()
+    names = list(env.keys())
+
+    conn.execute("insert or ignore into environments ({}) values ({})".format(", ".join(names), ", ".join("?" * len(names))),
+                 [env[x] for x in names])
+
+    sql = "select id from environments where {}".format(" and ".join("{} is ?".format(x) for x in names))
+
+    return conn.execute(sql, [env[x] for x in names]).fetchone()[0]
+
+def get_environment():
+    return {
+        "hostname": _platform.node(),
+        "system": _platform.system(),
+        "kernel": _platform.release(),
+        "cpu_model": _get_cpu_model(),
+        "cpu_count": _os.cpu_count(),
+        "python_version": _platform.python_version(),
+        "quiver_version": __version__,
+    }
+
+def _get_cpu_model():
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+
+                if name.strip() in ("model name", "Model", "cpu model", "Processor"):
+                    return value.strip()
+    except IOError:
+        pass
+
+    return _platform.processor() or None
+
+def _read_snapshots(file_):
+    if not _plano.exists(file_):
+        return
+
+    with open(file_) as f:
+        for line in f:
+            try:
+                fields = [int(x) for x in line.split(",")]
+            except ValueError:
+                continue
+
+            if len(fields) == 8:
+                yield fields
+
+# Returns the first line of 'quiver-arrow --info' or 'quiver-server
+# --info' for an implementation
+def get_impl_version(command, impl):
+    if impl is None:
+        return None
+
+    try:
+        info = _plano.call([command, "--impl", impl, "--info"], quiet=True)
+    except _plano.PlanoProcessError:
+        return None
+
+    return _first_line(info)
+
+def _first_line(text):
+    if text is None:
+        return None
+
+    return text.strip().split("\n")[0] or None
+
+# Records the output of a 'quiver' pair.  The given config fills in
+# for a pair that failed before saving its summary.
+def record_pair_run(database, command, pair_dir, config, status, versions=dict(), session=None, trial=None):
+    results = None
+    summary_file = _plano.join(pair_dir, "pair-summary.json")
+
+    if _plano.exists(summary_file):
+        summary = _plano.read_json(summary_file)
+        config = dict(config, **summary["config"])
+        results = summary["results"]
+
+    arrows = list()
+
+    for role in ("sender", "receiver"):
+        arrow_file = _plano.join(pair_dir, "{}-summary.json".format(role))
+
+        if _plano.exists(arrow_file):
+            arrows.append(_plano.read_json(arrow_file)["results"])
+
+    time = None
+
+    if arrows:
+        time = arrows[0].get("first_send_time")
+
+    if results is not None and len(arrows) == 2:
+        cpu_times = [x.get("cpu_time") for x in arrows]
+        max_rsses = [x.get("max_rss") for x in arrows]
+
+        if None not in cpu_times:
+            results = dict(results, cpu_time=sum(cpu_times))
+
+        if None not in max_rsses:
+            results = dict(results, max_rss=max(max_rsses))
+
+    snapshots = [(x, _plano.join(pair_dir, "{}-snapshots.csv".format(x))) for x in ("sender", "receiver")]
+
+    return database.record_run(command, config, results, status, versions, output_dir=pair_dir,
+                               session=session, trial=trial, snapshots=snapshots, time=time)
+
+# Records each test run under a 'quiver-bench' output directory that
+# is not already in the database.  Returns the number of runs added.
+def import_bench_dir(database, bench_dir):
+    session = "import-{}".format(_plano.get_unique_id(4))
+    count = 0
+
+    for sender, server, receiver, params, test_dir in list_bench_tests(bench_dir):
+        trials_dir = _plano.join(test_dir, "trials")
+        key_file = _plano.join(test_dir, "key.json")
+
+        runs = [(None, test_dir)]
+
+        if _plano.is_dir(trials_dir):
+            runs = [(int(x), _plano.join(trials_dir, x)) for x in sorted(_plano.list_dir(trials_dir))]
+
+        versions = dict()
+
+        config = {
+            "sender": sender,
+            "server": server,
+            "receiver": receiver,
+        }
+
+        if _plano.exists(key_file):
+            key = _plano.read_json(key_file)
+            versions = {k: _first_line(v) for k, v in key["versions"].items()}
+            config.update(key.get("params", dict()))
+
+        for trial, run_dir in runs:
+            pair_dir = _plano.join(run_dir, "pair")
+            status_file = _plano.join(pair_dir, "status.txt")
+
+            if not _plano.exists(status_file) or database.has_output_dir(pair_dir):
+                continue
+
+            status = _plano.read(status_file).strip()
+
+            record_pair_run(database, "quiver-bench", pair_dir, config, status, versions,
+                            session=session, trial=trial)
+
+            count += 1
+
+    return count
@@ -0,0 +1,266 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import plano as _plano
+import shlex as _shlex
+import time as _time
+
+from .common import *
+from .common import __version__, _epilog_urls, _epilog_server_impls
+
+_description = """
+Start a message server with the given queue.
+"""
+
+_epilog = """
+{_epilog_urls}
+
+{_epilog_server_impls}
+""".format(**globals())
+
+class QuiverServerCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverServerCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        self.parser.add_argument("url", metavar="URL",
+                                 help="The location of a message source or target")
+        self.parser.add_argument("--impl", metavar="IMPL",
+                                 help="Use the IMPL server implementation",
+                                 default=DEFAULT_SERVER_IMPL)
+        self.parser.add_argument("--info", action="store_true",
+                                 help="Print implementation details and exit")
+        self.parser.add_argument("--ready-file", metavar="FILE",
+                                 help="The file used to indicate the server is ready")
+        self.parser.add_argument("--snapshots", metavar="FILE",
+                                 help="Sample the CPU time and RSS of the server processes to FILE "
+                                 "every second")
+        self.parser.add_argument("--prelude", metavar="PRELUDE", default="",
+                                 help="Commands to precede the implementation invocation")
+        self.parser.add_argument("--user", metavar="USER",
+                                 help="The SASL username that the client must present")
+        self.parser.add_argument("--password", metavar="SECRET",
+                                 help="SASL password that the client must present.  "
+                                 "Ignored if --sasl-user is not present.")
+        self.parser.add_argument("--cert", metavar="FILE",
+                                 help="The TLS certificate file")
+        self.parser.add_argument("--key", metavar="FILE",
+                                 help="The TLS private key file")
+        self.parser.add_argument("--trust-store", metavar="FILE",
+                                 help="The file containing trusted client certificates.  "
+                                 "If set, the server verifies client identities.")
+
+        self.parser.add_argument("--raw", action="store_true",
+                                 help="Forward the data of each message undecoded, instead of decoding "
+                                 "it and encoding it again (builtin server only)")
+        self.parser.add_argument("--topic", metavar="ADDRESS", action="append",
+                                 help="Send each message for ADDRESS to every consumer, instead of "
+                                 "one (builtin server only)")
+        self.parser.add_argument("--retain-messages", metavar="COUNT", type=int,
+                                 help="Keep at most COUNT messages on each topic (builtin server only)")
+        self.parser.add_argument("--retain-bytes", metavar="BYTES", type=int,
+                                 help="Keep at most BYTES of messages on each topic (builtin server only)")
+        self.parser.add_argument("--max-queue-messages", metavar="COUNT", type=int,
+                                 help="Stop accepting messages for a queue when it holds COUNT messages "
+                                 "(builtin server only)")
+        self.parser.add_argument("--max-queue-bytes", metavar="BYTES", type=int,
+                                 help="Stop accepting messages for a queue when it holds BYTES of messages "
+                                 "(builtin server only)")
+        self.parser.add_argument("--journal", metavar="DIR",
+                                 help="Write durable messages to a journal in DIR and confirm them "
+                                 "only after they reach the disk (builtin server only)")
+        self.parser.add_argument("--commit-interval", metavar="MILLIS", type=float,
+                                 help="Wait at most MILLIS before committing the journal "
+                                 "(builtin server only, default 2)")
+        self.parser.add_argument("--commit-bytes", metavar="BYTES", type=int,
+                                 help="Commit the journal when BYTES are waiting "
+                                 "(builtin server only, default 1048576)")
+        self.parser.add_argument("--workers", metavar="COUNT", type=int,
+                                 help="Run COUNT broker processes sharing the port "
+                                 "(builtin server only, default 1)")
+        self.parser.add_argument("--end-to-end", action="store_true",
+                                 help="Accept each message from a producer only after a consumer "
+                                 "accepts it (builtin server only)")
+        self.parser.add_argument("--metrics", metavar="FILE",
+                                 help="Write queue and process metrics to FILE as JSON lines "
+                                 "(builtin server only)")
+        self.parser.add_argument("--metrics-socket", metavar="PATH",
+                                 help="Serve queue and process metrics as JSON lines on a Unix "
+                                 "socket at PATH (builtin server only)")
+        self.parser.add_argument("--trace", action="store_true",
+                                 help="Log each message the server stores, forwards, and settles "
+                                 "(builtin server only)")
+        self.parser.add_argument("--trace-sample", metavar="COUNT", type=int,
+                                 help="Trace one message in COUNT (builtin server only, default 1)")
+        self.parser.add_argument("--stream-buffer", metavar="BYTES", type=int,
+                                 help="Pass large messages through in pieces, buffering at most BYTES "
+                                 "of each (builtin server with --raw only, default 0, disabled)")
+
+        self.add_common_tool_arguments()
+
+    def init(self):
+        self.intercept_info_request(DEFAULT_SERVER_IMPL)
+
+        super(QuiverServerCommand, self).init()
+
+        self.impl = require_impl(self.args.impl)
+        self.ready_file = self.args.ready_file
+        self.snapshots_file = self.args.snapshots
+        self.prelude = _shlex.split(self.args.prelude)
+        self.user = self.args.user
+        self.password = self.args.password
+        self.cert = self.args.cert
+        self.key = self.args.key
+        self.trust_store = self.args.trust_store
+        self.raw = self.args.raw
+        self.topics = self.args.topic
+        self.retain_messages = self.args.retain_messages
+        self.retain_bytes = self.args.retain_bytes
+        self.max_queue_messages = self.args.max_queue_messages
+        self.max_queue_bytes = self.args.max_queue_bytes
+        self.journal = self.args.journal
+        self.commit_interval = self.args.commit_interval
+        self.commit_bytes = self.args.commit_bytes
+        self.workers = self.args.workers
+        self.end_to_end = self.args.end_to_end
+        self.metrics_file = self.args.metrics
+        self.metrics_socket = self.args.metrics_socket
+        self.trace = self.args.trace
+        self.trace_sample = self.args.trace_sample
+        self.stream_buffer = self.args.stream_buffer
+
+        if self.ready_file is None:
+            self.ready_file = "-"
+
+        self.init_url_attributes()
+        self.init_common_tool_attributes()
+
+    def run(self):
+        args = self.prelude + [
+            self.impl.file,
+            "host={}".format(self.host),
+            "port={}".format(self.port),
+            "path={}".format(self.path),
+            "ready-file={}".format(self.ready_file),
+        ]
+
+        if self.user:
+            args.append("user={}".format(self.user))
+
+        if self.password:
+            args.append("password={}".format(self.password))
+
+        if self.cert:
+            args.append("cert={}".format(self.cert))
+
+        if self.key:
+            args.append("key={}".format(self.key))
+
+        if self.trust_store:
+            args.append("trust-store={}".format(self.trust_store))
+
+        if self.raw:
+            args.append("raw=1")
+
+        if self.topics:
+            args.append("topics={}".format(",".join(self.topics)))
+
+        if self.retain_messages is not None:
+            args.append("retain-messages={}".format(self.retain_messages))
+
+        if self.retain_bytes is not None:
+            args.append("retain-bytes={}".format(self.retain_bytes))
+
+        if self.max_queue_messages is not None:
+            args.append("max-queue-messages={}".format(self.max_queue_messages))
+
+        if self.max_queue_bytes is not None:
+            args.append("max-queue-bytes={}".format(self.max_queue_bytes))
+
+        if self.journal is not None:
+            args.append("journal={}".format(self.journal))
+
+        if self.commit_interval is not None:
+            args.append("commit-interval={}".format(self.commit_interval))
+
+        if self.commit_bytes is not None:
+            args.append("commit-bytes={}".format(self.commit_bytes))
+
+        if self.workers is not None:
+            args.append("workers={}".format(self.workers))
+
+        if self.end_to_end:
+            args.append("end-to-end=1")
+
+        if self.metrics_file is not None:
+            args.append("metrics-file={}".format(self.metrics_file))
+
+        if self.metrics_socket is not None:
+            args.append("metrics-socket={}".format(self.metrics_socket))
+
+        if self.trace:
+            args.append("trace=1")
+
+        if self.trace_sample is not None:
+            args.append("trace-sample={}".format(self.trace_sample))
+
+        if self.stream_buffer is not None:
+            args.append("stream-buffer={}".format(self.stream_buffer))
+
+        if self.quiet:
+            args.append("quiet=1")
+
+        if self.verbose:
+            args.append("verbose=1")
+
+        if self.snapshots_file is None:
+            _plano.run(args)
+            return
+
+        proc = _plano.start(args)
+
+        try:
+            self.monitor_subprocess(proc)
+        except:
+            _plano.stop(proc)
+            raise
+
+        _plano.wait(proc, check=True)
+
+    # The implementation wrapper often starts the real server as a
+    # child, so each sample covers the whole process tree
+    def monitor_subprocess(self, proc):
+        snap = ServerSnapshot()
+        snap.timestamp = now()
+
+        with open(self.snapshots_file, "ab") as fsnaps:
+            while proc.poll() is None:
+                _time.sleep(1)
+
+                snap.previous = None
+                snap = ServerSnapshot(snap)
+                snap.capture(get_process_tree(proc.pid))
+
+                if proc.poll() is not None:
+                    break
+
+                fsnaps.write(snap.marshal())
+                fsnaps.flush()
@@ -0,0 +1,300 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import plano as _plano
+
+from .bench import TestServer, ServerTimeout
+from .common import *
+from .common import __version__
+from .common import _epilog_urls
+from .common import _epilog_arrow_impls
+from .common import _epilog_server_impls
+from .saturate import _PairStep
+
+_description = """
+Find the credit window and transaction size that give a
+sender-receiver pair the best throughput or latency.
+
+'quiver-tune' runs a short 'quiver' pair for each combination of the
+given settings.  It reports the best setting for each body size and
+saves it as an argument file for 'quiver'.
+"""
+
+_epilog = """
+The --credit, --transaction-size, and --body-size arguments take
+comma-separated lists of counts.
+
+{_epilog_urls}
+
+{_epilog_arrow_impls}
+
+{_epilog_server_impls}
+
+example usage:
+  $ quiver-tune --impl rhea --server builtin
+  $ quiver @quiver-tune-output/tune-100.args q0
+""".format(**globals())
+
+class QuiverTuneCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverTuneCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        self.parser.add_argument("url", metavar="URL", nargs="?",
+                                 help="The location of a message source or target "
+                                 "(if not set, the pairs run in peer-to-peer mode or "
+                                 "against the --server implementation)")
+        self.parser.add_argument("--output", metavar="DIR",
+                                 help="Save output files to DIR")
+        self.parser.add_argument("--impl", metavar="IMPL", default=DEFAULT_ARROW_IMPL,
+                                 help="Use IMPL to send and receive " \
+                                 "(default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--sender", metavar="IMPL",
+                                 help="Use IMPL to send (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--receiver", metavar="IMPL",
+                                 help="Use IMPL to receive (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--server", metavar="IMPL",
+                                 help="Start a server using IMPL and test against it")
+        self.parser.add_argument("--objective", metavar="OBJECTIVE", default="throughput",
+                                 choices=["throughput", "latency"],
+                                 help="Pick the setting with the highest 'throughput' or "
+                                 "the lowest 'latency' (default throughput)")
+        self.parser.add_argument("--percentile", metavar="PERCENTILE", default="99",
+                                 choices=LATENCY_PERCENTILES,
+                                 help="Compare latency at PERCENTILE (default 99)")
+        self.parser.add_argument("-d", "--duration", metavar="DURATION", default="10s",
+                                 help="Run each step for DURATION (default 10s)")
+        self.parser.add_argument("--body-size", metavar="COUNTS", default="100",
+                                 help="Tune separately for each of COUNTS body sizes (default 100)")
+        self.parser.add_argument("--credit", metavar="COUNTS", default="10,100,1000,10000",
+                                 help="Try each of COUNTS credit windows (default 10,100,1000,10000)")
+        self.parser.add_argument("--transaction-size", metavar="COUNTS", default="0",
+                                 help="Try each of COUNTS transaction sizes (default 0, disabled)")
+        self.parser.add_argument("--durable", action="store_true",
+                                 help="Require persistent store-and-forward transfers")
+        self.parser.add_argument("--timeout", metavar="DURATION", default="10",
+                                 help="Fail a step after DURATION without transfers (default 10s)")
+
+        self.add_common_tool_arguments()
+
+    def init(self):
+        super(QuiverTuneCommand, self).init()
+
+        impl = self.args.impl
+
+        self.sender_impl = require_impl(self.args.sender, impl)
+        self.receiver_impl = require_impl(self.args.receiver, impl)
+        self.server_impl = None
+
+        if self.args.server is not None:
+            if self.args.url is not None:
+                self.parser.error("A URL and --server cannot be used together")
+
+            self.server_impl = require_impl(self.args.server)
+            self.args.url = "//localhost:{}/q0".format(_plano.get_random_port())
+
+        self.init_url_attributes()
+        self.init_output_dir()
+        self.init_common_tool_attributes()
+
+        self.peer_to_peer = self.args.url is None
+        self.duration = self.parse_duration(self.args.duration)
+        self.durable = self.args.durable
+        self.timeout = self.parse_duration(self.args.timeout)
+
+        self.objective = self.args.objective
+        self.percentile = self.args.percentile
+        self.body_sizes = self.parse_counts(self.args.body_size)
+        self.credit_windows = self.parse_counts(self.args.credit)
+        self.transaction_sizes = self.parse_counts(self.args.transaction_size)
+
+        self.body_size = self.body_sizes[0]
+        self.credit_window = self.credit_windows[0]
+        self.transaction_size = self.transaction_sizes[0]
+
+        self.summary_file = _plano.join(self.output_dir, "tune-summary.json")
+
+        self.steps = list()
+        self.best = dict()
+
+    def run(self):
+        server = None
+
+        if self.server_impl is not None:
+            server = TestServer(_plano.join(self.output_dir, "server"), self.server_impl.name,
+                                durable=self.durable)
+
+            try:
+                server.start(self.port)
+            except ServerTimeout as e:
+                server.stop()
+                raise CommandError(e)
+
+        try:
+            for body_size in self.body_sizes:
+                for transaction_size in self.transaction_sizes:
+                    for credit_window in self.credit_windows:
+                        self.run_step(body_size, credit_window, transaction_size)
+        finally:
+            if server is not None:
+                server.stop()
+
+        for body_size in self.body_sizes:
+            steps = [x for x in self.steps if x.body_size == body_size and x.passed]
+
+            if not steps:
+                continue
+
+            if self.objective == "throughput":
+                self.best[body_size] = max(steps, key=lambda x: x.rate)
+            else:
+                self.best[body_size] = min(steps, key=lambda x: x.latency(self.percentile))
+
+            self.save_args(self.best[body_size])
+
+        self.save_summary()
+
+        if not self.quiet:
+            self.print_summary()
+
+        if not self.best:
+            _plano.exit(1)
+
+    def run_step(self, body_size, credit_window, transaction_size):
+        step_dir = _plano.join(self.output_dir, "steps", "{:02}".format(len(self.steps)))
+        step = _PairStep(self, step_dir, body_size=body_size, credit_window=credit_window,
+                         transaction_size=transaction_size)
+
+        if not self.quiet:
+            label = "Body size {:,}, credit {:,}, transaction size {:,} ".format \
+                (body_size, credit_window, transaction_size)
+            print("{:.<63} ".format(label), end="")
+            _plano.flush()
+
+        step.run()
+        step.check(self.percentile, None, 0)
+
+        if not self.quiet:
+            print("PASSED" if step.passed else "FAILED")
+
+        self.steps.append(step)
+
+    def args_file(self, body_size):
+        return _plano.join(self.output_dir, "tune-{}.args".format(body_size))
+
+    def save_args(self, step):
+        combo = "{} -> {}".format(self.sender_impl.name, self.receiver_impl.name)
+
+        if self.server_impl is not None:
+            combo = "{} -> {} -> {}".format(self.sender_impl.name, self.server_impl.name, self.receiver_impl.name)
+
+        lines = [
+            "# Generated by quiver-tune for {}".format(combo),
+            "# Best {} with a body size of {:,} bytes".format(self.objective, step.body_size),
+            "--sender {} --receiver {}".format(self.sender_impl.name, self.receiver_impl.name),
+            "--body-size {}".format(step.body_size),
+            "--credit {}".format(step.credit_window),
+            "--transaction-size {}".format(step.transaction_size),
+        ]
+
+        if self.durable:
+            lines.append("--durable")
+
+        _plano.write_lines(self.args_file(step.body_size), ["{}\n".format(x) for x in lines])
+
+    def save_summary(self):
+        props = {
+            "config": {
+                "sender": self.sender_impl.name,
+                "receiver": self.receiver_impl.name,
+                "server": self.server_impl.name if self.server_impl is not None else None,
+                "url": self.url,
+                "output_dir": self.output_dir,
+                "duration": self.duration,
+                "durable": self.durable,
+                "objective": self.objective,
+                "percentile": self.percentile,
+                "body_sizes": self.body_sizes,
+                "credit_windows": self.credit_windows,
+                "transaction_sizes": self.transaction_sizes,
+            },
+            "results": {
+                "best": {str(k): v.marshal() for k, v in self.best.items()},
+                "steps": [x.marshal() for x in self.steps],
+            },
+        }
+
+        _plano.write_json(self.summary_file, props)
+
+    def print_summary(self):
+        print_heading("Configuration")
+
+        print_field("Sender", self.sender_impl.name)
+        print_field("Receiver", self.receiver_impl.name)
+
+        if self.server_impl is not None:
+            print_field("Server", self.server_impl.name)
+
+        print_field("URL", self.url)
+        print_field("Output files", self.output_dir)
+        print_numeric_field("Step duration", self.duration, _plano.plural("second", self.duration))
+        print_field("Objective", self.objective)
+
+        print_heading("Steps")
+
+        columns = "{:>10}  {:>10}  {:>10}  {:>12}  {:>10}  {:>10}  {}"
+        percentile = "p{} [ms]".format(self.percentile)
+
+        print(columns.format("Body [B]", "Credit", "Txn size", "Rate [m/s]", "p50 [ms]", percentile, "Status"))
+        print(columns.format(*(["-" * 10] * 3 + ["-" * 12] + ["-" * 10] * 2 + ["-" * 13])))
+
+        for step in self.steps:
+            rate, p50, pn = "-", "-", "-"
+
+            if step.rate is not None:
+                rate = "{:,.0f}".format(step.rate)
+
+            if step.receiver is not None:
+                p50 = "{:,}".format(step.latency("50"))
+                pn = "{:,}".format(step.latency(self.percentile))
+
+            status = step.status
+
+            if self.best.get(step.body_size) is step:
+                status = "BEST"
+
+            print(columns.format("{:,}".format(step.body_size), "{:,}".format(step.credit_window),
+                                 "{:,}".format(step.transaction_size), rate, p50, pn, status))
+
+        print_heading("Results")
+
+        for body_size in self.body_sizes:
+            step = self.best.get(body_size)
+
+            if step is None:
+                print_field("Body size {:,}".format(body_size), "No passing settings")
+                continue
+
+            print_field("Body size {:,}".format(body_size),
+                        "--credit {} --transaction-size {}".format(step.credit_window, step.transaction_size))
+
+        print()
+        print("Use 'quiver @{}' to apply a setting".format(self.args_file(self.body_sizes[0])))
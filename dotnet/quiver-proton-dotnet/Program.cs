@@ -256,7 +256,14 @@ namespace Quiver.Driver
                sent += 1;
 
                line.Clear();
-               Console.Write(line.Append(sentAt).Append(",0\n"));
+               line.Append(sentAt).Append(",0");
+
+               if (setMessageID)
+               {
+                  line.Append(',').Append(sent - 1);
+               }
+
+               Console.Write(line.Append('\n'));
 
                if (transactionSize > 0 && (sent % transactionSize) == 0)
                {
@@ -313,16 +320,18 @@ namespace Quiver.Driver
 
                received += 1;
 
-               if (setMessageID)
-               {
-                  _ = message.MessageId;
-               }
-
                long sentAt = (long)message.GetProperty("SendTime");
                long receivedAt = DateTimeOffset.UtcNow.ToUnixTimeMilliseconds();
 
                line.Clear();
-               Console.Write(line.Append(sentAt).Append(',').Append(receivedAt).Append('\n'));
+               line.Append(sentAt).Append(',').Append(receivedAt);
+
+               if (setMessageID)
+               {
+                  line.Append(',').Append(message.MessageId);
+               }
+
+               Console.Write(line.Append('\n'));
 
                if (transactionSize > 0 && (received % transactionSize) == 0)
                {
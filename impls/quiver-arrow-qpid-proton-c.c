@@ -70,6 +70,7 @@ struct arrow {
     bool tls;
     uint32_t desired_duration;
     size_t desired_count;
+    size_t desired_rate;
     size_t body_size;
     size_t credit_window;
     bool durable;
@@ -78,10 +79,11 @@ struct arrow {
     pn_proactor_t* proactor;
     pn_listener_t* listener;
     pn_connection_t* connection;
+    pn_link_t* sender;
     pn_message_t* message;
     pn_rwbytes_t buffer; // Encoded message buffer
 
-    time_t start_time;
+    int64_t start_time;
     size_t sent;
     size_t received;
     size_t acknowledged;
@@ -175,10 +177,12 @@ static void decode_message(pn_message_t* m, pn_delivery_t* d, pn_rwbytes_t* buf)
 }
 
 static void process_message(struct arrow* a, pn_message_t* m) {
+    pn_bytes_t id = pn_bytes(0, NULL);
+
     if (a->set_message_id) {
         pn_atom_t id_atom = pn_message_get_id(m);
         ASSERT(id_atom.type == PN_STRING);
-        pn_bytes_t id = id_atom.u.as_bytes;
+        id = id_atom.u.as_bytes;
     }
 
     pn_data_t* props = pn_message_properties(m);
@@ -202,7 +206,12 @@ static void process_message(struct arrow* a, pn_message_t* m) {
 
     ASSERT(pn_data_exit(props));
 
-    printf("%" PRId64 ",%" PRId64 "\n", stime, now());
+    if (a->set_message_id) {
+        // The sender includes the terminating NUL in the ID
+        printf("%" PRId64 ",%" PRId64 ",%.*s\n", stime, now(), (int) strnlen(id.start, id.size), id.start);
+    } else {
+        printf("%" PRId64 ",%" PRId64 "\n", stime, now());
+    }
 }
 
 static void send_message(struct arrow* a, pn_link_t* l) {
@@ -243,7 +252,42 @@ static void send_message(struct arrow* a, pn_link_t* l) {
 
     a->sent++;
 
-    printf("%" PRId64 ",0\n", stime);
+    if (a->set_message_id) {
+        printf("%" PRId64 ",0,%zu\n", stime, a->sent);
+    } else {
+        printf("%" PRId64 ",0\n", stime);
+    }
+}
+
+// Send as many messages as credit allows, limited to the number due
+// so far when a desired rate is set
+static void send_messages(struct arrow* a, pn_link_t* l) {
+    size_t limit = SIZE_MAX;
+
+    if (a->desired_rate > 0) {
+        limit = (size_t) ((now() - a->start_time) * a->desired_rate / 1000) + 1;
+    }
+
+    while (pn_link_credit(l) > 0) {
+        if (a->desired_count > 0 && a->sent == a->desired_count) {
+            break;
+        }
+
+        if (a->sent >= limit) {
+            break;
+        }
+
+        send_message(a, l);
+    }
+}
+
+static bool pacing(struct arrow* a) {
+    return a->operation == SEND && a->desired_rate > 0;
+}
+
+static int64_t pacing_interval(struct arrow* a) {
+    int64_t interval = 1000 / a->desired_rate;
+    return interval < 1 ? 1 : (interval > 100 ? 100 : interval);
 }
 
 static void fail_if_condition(pn_event_t* e, pn_condition_t* cond) {
@@ -346,17 +390,19 @@ static bool handle(struct arrow* a, pn_event_t* e) {
         pn_link_t* link = pn_event_link(e);
 
         if (pn_link_is_sender(link)) {
-            while (pn_link_credit(link) > 0) {
-                if (a->desired_count > 0 && a->sent == a->desired_count) {
-                    break;
-                }
-
-                send_message(a, link);
-            }
+            a->sender = link;
+            send_messages(a, link);
         }
 
         break;
     }
+    case PN_CONNECTION_WAKE:
+        if (a->sender) {
+            send_messages(a, a->sender);
+        }
+
+        break;
+
     case PN_DELIVERY: {
         pn_delivery_t* delivery = pn_event_delivery(e);
         pn_link_t* link = pn_delivery_link(delivery);
@@ -432,6 +478,20 @@ static bool handle(struct arrow* a, pn_event_t* e) {
         break;
 
     case PN_PROACTOR_TIMEOUT:
+        if (pacing(a)) {
+            int64_t elapsed = now() - a->start_time;
+
+            if (a->desired_duration == 0 || elapsed < a->desired_duration * 1000) {
+                // The connection must be woken to send from its own context
+                if (a->connection) {
+                    pn_connection_wake(a->connection);
+                }
+
+                pn_proactor_set_timeout(a->proactor, pacing_interval(a));
+                break;
+            }
+        }
+
         stop(a);
         break;
 
@@ -453,7 +513,9 @@ static bool handle(struct arrow* a, pn_event_t* e) {
 }
 
 void run(struct arrow* a) {
-    if (a->desired_duration > 0) {
+    if (pacing(a)) {
+        pn_proactor_set_timeout(a->proactor, pacing_interval(a));
+    } else if (a->desired_duration > 0) {
         pn_proactor_set_timeout(a->proactor, a->desired_duration * 1000);
     }
 
@@ -524,6 +586,7 @@ int main(size_t argc, char** argv) {
     a.key = find_arg(kwargc, kwargv, "key");
     a.desired_duration = atoi(find_arg(kwargc, kwargv, "duration"));
     a.desired_count = atoi(find_arg(kwargc, kwargv, "count"));
+    a.desired_rate = atoi(find_arg(kwargc, kwargv, "rate"));
     a.body_size = atoi(find_arg(kwargc, kwargv, "body-size"));
     a.credit_window = atoi(find_arg(kwargc, kwargv, "credit-window"));
     a.durable = atoi(find_arg(kwargc, kwargv, "durable")) == 1;
@@ -204,7 +204,11 @@ struct handler : public proton::messaging_handler {
             snd.send(msg);
             sent++;
 
-            std::cout << stime << ",0\n";
+            if (set_message_id) {
+                std::cout << stime << ",0," << sent << "\n";
+            } else {
+                std::cout << stime << ",0\n";
+            }
         }
     }
 
@@ -221,14 +225,14 @@ struct handler : public proton::messaging_handler {
 
         received++;
 
-        if (set_message_id) {
-            proton::message_id id = msg.id();
-        }
-
         proton::scalar stime = msg.properties().get("SendTime");
         int64_t rtime = now();
 
-        std::cout << stime << "," << rtime << "\n";
+        if (set_message_id) {
+            std::cout << stime << "," << rtime << "," << msg.id() << "\n";
+        } else {
+            std::cout << stime << "," << rtime << "\n";
+        }
 
         if (received == desired_count) {
             stop();
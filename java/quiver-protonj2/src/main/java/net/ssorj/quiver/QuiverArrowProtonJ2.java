@@ -250,7 +250,13 @@ public class QuiverArrowProtonJ2 {
                 sent += 1;
 
                 line.setLength(0);
-                out.append(line.append(stime).append(",0\n"));
+                line.append(stime).append(",0");
+
+                if (this.setMessageID) {
+                    line.append(',').append(sent - 1);
+                }
+
+                out.append(line.append('\n'));
 
                 if (transactionSize > 0 && (sent % transactionSize) == 0) {
                     sender.session().commitTransaction();
@@ -299,15 +305,17 @@ public class QuiverArrowProtonJ2 {
 
                 received += 1;
 
-                if (this.setMessageID) {
-                    final Object id = message.messageId();
-                }
-
                 final long stime = (long) message.property("SendTime");
                 final long rtime = System.currentTimeMillis();
 
                 line.setLength(0);
-                out.append(line.append(stime).append(',').append(rtime).append('\n'));
+                line.append(stime).append(',').append(rtime);
+
+                if (this.setMessageID) {
+                    line.append(',').append(message.messageId());
+                }
+
+                out.append(line.append('\n'));
 
                 if (transactionSize > 0 && (received % transactionSize) == 0) {
                     receiver.session().commitTransaction();
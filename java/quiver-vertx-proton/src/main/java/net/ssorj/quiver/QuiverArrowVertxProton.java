@@ -200,8 +200,10 @@ public class QuiverArrowVertxProton {
                                 msg.setDurable(true);
                             }
 
+                            String id = null;
+
                             if (setMessageID) {
-                                final String id = String.valueOf(count.get());
+                                id = String.valueOf(count.get());
                                 msg.setMessageId(id);
                             }
 
@@ -212,7 +214,13 @@ public class QuiverArrowVertxProton {
                             count.incrementAndGet();
 
                             line.setLength(0);
-                            out.append(line.append(stime).append(",0\n"));
+                            line.append(stime).append(",0");
+
+                            if (id != null) {
+                                line.append(',').append(id);
+                            }
+
+                            out.append(line.append('\n'));
                         }
                     } finally {
                         out.flush();
@@ -238,15 +246,17 @@ public class QuiverArrowVertxProton {
         receiver.handler((delivery, msg) -> {
                 try {
                     try {
-                        if (setMessageID) {
-                            final Object id = msg.getMessageId();
-                        }
-
                         final long stime = (Long) msg.getApplicationProperties().getValue().get("SendTime");
                         final long rtime = System.currentTimeMillis();
 
                         line.setLength(0);
-                        out.append(line.append(stime).append(',').append(rtime).append('\n'));
+                        line.append(stime).append(',').append(rtime);
+
+                        if (setMessageID) {
+                            line.append(',').append(msg.getMessageId());
+                        }
+
+                        out.append(line.append('\n'));
 
                         delivery.disposition(ACCEPTED, true);
 
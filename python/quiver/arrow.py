@@ -32,7 +32,9 @@ from .common import __version__
 from .common import _epilog_urls
 from .common import _epilog_arrow_impls
 from .common import _epilog_count_and_duration_formats
+from .common import _read_process_usage
 from .common import _urlparse
+from .results import ResultsDatabase, get_impl_version
 
 _description = """
 Send or receive a set number of messages as fast as possible using a
@@ -158,6 +160,8 @@ class QuiverArrowCommand(Command):
         self.latency_average = None
         self.latency_quartiles = None
         self.latency_nines = None
+        self.cpu_time = None
+        self.max_rss = None
 
     def run(self):
         args = self.prelude + [
@@ -206,12 +210,21 @@ class QuiverArrowCommand(Command):
             if proc.returncode != 0:
                 raise CommandError("{} exited with code {}", self.role, proc.returncode)
 
+        # The implementation is the only child process waited for so far
+        usage = _resource.getrusage(_resource.RUSAGE_CHILDREN)
+
+        self.cpu_time = int((usage.ru_utime + usage.ru_stime) * 1000)
+        self.max_rss = usage.ru_maxrss * 1024
+
         if _plano.get_file_size(self.transfers_file) == 0:
             raise CommandError("No transfers")
 
         self.compute_results()
         self.save_summary()
 
+        if self.results_db is not None:
+            self.record_results()
+
         if _plano.exists("{}.zst".format(self.transfers_file)):
             _plano.remove("{}.zst".format(self.transfers_file))
 
@@ -291,7 +304,7 @@ class QuiverArrowCommand(Command):
         with open(self.transfers_file, "rb") as f:
             for line in f:
                 try:
-                    send_time, receive_time = line.split(b",", 1)
+                    send_time, receive_time = line.split(b",", 2)[:2]
                     yield send_time, receive_time
                 except ValueError as e:
                     _plano.error("Failed to parse line '{}': {}", line, e)
@@ -299,13 +312,8 @@ class QuiverArrowCommand(Command):
 
     def compute_latencies(self, transfers):
         latencies = transfers["receive_time"] - transfers["send_time"]
-        q = 0, 25, 50, 75, 100, 90, 99, 99.9, 99.99, 99.999
-        percentiles = _numpy.percentile(latencies, q)
-        percentiles = [int(x) for x in percentiles]
 
-        self.latency_average = _numpy.mean(latencies)
-        self.latency_quartiles = percentiles[:5]
-        self.latency_nines = percentiles[5:]
+        self.latency_average, self.latency_quartiles, self.latency_nines = _compute_latency_stats(latencies)
 
     def save_summary(self):
         props = {
@@ -339,12 +347,30 @@ class QuiverArrowCommand(Command):
                 "latency_average": self.latency_average,
                 "latency_quartiles": self.latency_quartiles,
                 "latency_nines": self.latency_nines,
+                "cpu_time": self.cpu_time,
+                "max_rss": self.max_rss,
             },
         }
 
         with open(self.summary_file, "w") as f:
             _json.dump(props, f, indent=2)
 
+    def record_results(self):
+        with open(self.summary_file) as f:
+            summary = _json.load(f)
+
+        config = dict(summary["config"])
+        config[self.role] = self.impl.name
+
+        versions = {
+            self.role: get_impl_version("quiver-arrow", self.impl.name),
+        }
+
+        database = ResultsDatabase(self.results_db)
+        database.record_run("quiver-arrow", config, summary["results"], "PASSED", versions,
+                            output_dir=self.output_dir, snapshots=[(self.role, self.snapshots_file)],
+                            time=self.start_time)
+
     def print_summary(self):
         with open(self.summary_file) as f:
             arrow = _json.load(f)
@@ -443,7 +469,7 @@ class _StatusSnapshot:
                 continue
 
             try:
-                send_time, receive_time = line.split(b",", 1)
+                send_time, receive_time = line.split(b",", 2)[:2]
                 record = int(send_time), int(receive_time)
             except ValueError:
                 continue
@@ -460,23 +486,18 @@ class _StatusSnapshot:
                 self.latency = int(_numpy.mean(latencies))
 
     def capture_proc_info(self, proc):
-        proc_file = _join("/", "proc", str(proc.pid), "stat")
+        usage = _read_process_usage(proc.pid)
 
-        try:
-            with open(proc_file, "r") as f:
-                line = f.read()
-        except IOError:
+        if usage is None:
             return
 
-        fields = line.split()
-
-        self.cpu_time = int(sum(map(int, fields[13:17])) / _ticks_per_ms)
+        self.cpu_time = int(usage[0])
         self.period_cpu_time = self.cpu_time
 
         if self.previous is not None:
             self.period_cpu_time = self.cpu_time - self.previous.cpu_time
 
-        self.rss = int(fields[23]) * _page_size
+        self.rss = usage[1]
 
     def marshal(self):
         fields = (self.timestamp,
@@ -506,6 +527,11 @@ class _StatusSnapshot:
          self.period_cpu_time,
          self.rss) = fields
 
+# Returns the average, quartiles, and nines of an array of latencies
+def _compute_latency_stats(latencies):
+    percentiles = _numpy.percentile(latencies, [float(x) for x in LATENCY_PERCENTILES])
+    percentiles = [int(x) for x in percentiles]
+
+    return float(_numpy.mean(latencies)), percentiles[:5], percentiles[5:]
+
 _join = _plano.join
-_ticks_per_ms = _os.sysconf(_os.sysconf_names["SC_CLK_TCK"]) / 1000
-_page_size = _resource.getpagesize()
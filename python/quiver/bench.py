@@ -18,15 +18,23 @@
 #
 
 import argparse as _argparse
+import concurrent.futures as _futures
+import hashlib as _hashlib
+import json as _json
+import math as _math
+import numpy as _numpy
 import os as _os
 import plano as _plano
+import queue as _queue
 import shlex as _shlex
 import subprocess as _subprocess
+import threading as _threading
 import time as _time
 import traceback as _traceback
 
 from .common import *
 from .common import __version__
+from .results import ResultsDatabase, record_pair_run, _first_line
 
 _description = """
 Benchmark message sender, receiver, and server combinations.
@@ -39,6 +47,49 @@ _epilog = """
 The --include-* and --exclude-* arguments take comma-separated lists
 of implementation names.  Use 'quiver-arrow --help' and
 'quiver-server --help' to list the available implementations.
+
+--rate and --set-message-id are passed on to each test pair, so every
+pair sends at the given rate and joins its transfers by message ID.
+
+Each test directory records a key made from the sender, server, and
+receiver, the test arguments, and the implementation versions.  With
+--resume, tests that already passed with the same key are skipped.
+With --rerun-failed, only tests that failed with the same key are run.
+
+With --large-messages, the tests use bodies of 1 MB, 10 MB, and 100 MB
+and a credit window of 10, in place of --body-size and --credit.  Each
+test reports its data rate in MB/s as well as its message rate.
+
+With --trials, each test runs several times.  The trials are
+interleaved across tests so that slow periods on the host do not all
+land on one test.  Each test directory then has an aggregate.json with
+the mean, median, standard deviation, and 95% confidence interval of
+the throughput, data rate, and latency percentiles across trials.
+Trials far from the median are flagged as outliers.
+
+With --jobs, tests run in parallel.  Each running test is pinned to its
+own set of CPUs and uses its own ports.
+
+With --reuse-servers, each server is started once and its tests run
+one at a time against it, each on its own queue named after the
+sender, receiver, and trial.  The server is restarted only if it exits
+or a test fails.  Each start is saved under 'servers/<impl>' with its
+startup time in startup.txt, apart from the test times.  With --jobs,
+the servers run in parallel, each on its own CPUs.
+
+With --server-metrics, the builtin server records the depth, rates,
+and credit of its queues once a second in server-metrics.jsonl, and
+the results charts show them over time.  Tracking queue sizes costs
+the server an encode of each message it forwards undecoded, so the
+metrics are off by default.
+
+server readiness:
+  Each server is given a named pipe as its ready file and signals
+  readiness by writing to it, so a test starts as soon as the server is
+  ready.  A server that exits before it is ready fails at once.  With
+  --probe-port, quiver-bench also waits until the server port accepts
+  connections.  The time to ready of each server start is saved in
+  startup.txt and summarized at the end of the run.
 """
 
 class QuiverBenchCommand(Command):
@@ -74,8 +125,29 @@ class QuiverBenchCommand(Command):
                                  help="Test only peer-to-peer mode")
         self.parser.add_argument("--mixed-pairs", action="store_true",
                                  help="Test unmatched senders and receivers")
-
-        self.add_common_test_arguments()
+        self.parser.add_argument("--sweep", metavar="RATES",
+                                 help="After each passing test, run a rate sweep using RATES "
+                                 "(see 'quiver-saturate --help')")
+        self.parser.add_argument("--jobs", metavar="COUNT", type=int, default=1,
+                                 help="Run COUNT tests at once, each on its own CPUs (default 1)")
+        self.parser.add_argument("--trials", metavar="COUNT", type=int, default=1,
+                                 help="Run each test COUNT times and aggregate the results (default 1)")
+        self.parser.add_argument("--resume", action="store_true",
+                                 help="Skip tests that already passed in the output directory")
+        self.parser.add_argument("--rerun-failed", action="store_true",
+                                 help="Run only tests that failed in the output directory")
+        self.parser.add_argument("--reuse-servers", action="store_true",
+                                 help="Start each server once and run all of its tests against it")
+        self.parser.add_argument("--probe-port", action="store_true",
+                                 help="After a server signals it is ready, also wait until its port "
+                                 "accepts connections")
+        self.parser.add_argument("--server-metrics", action="store_true",
+                                 help="Record the queue metrics of the builtin server")
+        self.parser.add_argument("--large-messages", action="store_true",
+                                 help="Test message bodies of 1 MB, 10 MB, and 100 MB with a credit "
+                                 "window of 10 messages")
+
+        self.add_common_test_arguments(sweep=True)
         self.add_common_tool_arguments()
 
     def init(self):
@@ -101,15 +173,52 @@ class QuiverBenchCommand(Command):
             self.client_server = False
 
         self.mixed_pairs = self.args.mixed_pairs
+        self.sweep = self.args.sweep
+        self.jobs = self.args.jobs
+        self.cpu_sets = None
+        self.trials = self.args.trials
+        self.resume = self.args.resume
+        self.rerun_failed = self.args.rerun_failed
+        self.reuse_servers = self.args.reuse_servers
+        self.probe_port = self.args.probe_port
+        self.server_metrics = self.args.server_metrics
+
+        if self.trials < 1:
+            raise CommandError("The trial count must be at least 1")
+
+        if self.resume and self.rerun_failed:
+            raise CommandError("--resume and --rerun-failed cannot be used together")
+
+        if self.jobs < 1:
+            raise CommandError("The job count must be at least 1")
+
+        if self.jobs > 1:
+            cpus = sorted(_os.sched_getaffinity(0))
+
+            if self.jobs > len(cpus):
+                raise CommandError("Cannot run {} jobs on {} {}", self.jobs, len(cpus), _plano.plural("CPU", len(cpus)))
+
+            size = len(cpus) // self.jobs
+            self.cpu_sets = [cpus[i * size:(i + 1) * size] for i in range(self.jobs)]
+
+        if self.args.large_messages:
+            self.args.body_size = "1m,10m,100m"
+            self.args.credit = "10"
 
         self.init_impl_attributes()
-        self.init_common_test_attributes()
+        self.init_common_test_attributes(sweep=True)
         self.init_common_tool_attributes()
+        self.init_params()
 
         if not self.verbose:
             _plano.enable_logging("warn")
 
         self.failures = list()
+        self.ports = set()
+        self.lock = _threading.Lock()
+        self.impl_info = dict()
+        self.startup_times = dict()
+        self.session = _plano.get_unique_id(4)
 
     def init_impl_attributes(self):
         sender_impls = set(ARROW_IMPLS)
@@ -156,7 +265,30 @@ class QuiverBenchCommand(Command):
     def parse_impls(self, value):
         return {x for x in value.split(",")}
 
+    # Each impl combination is tested with every combination of the
+    # parameter values.  Axes with more than one value are swept.
+    def init_params(self):
+        axes = [
+            ("body-size", self.body_sizes),
+            ("credit", self.credit_windows),
+            ("transaction-size", self.transaction_sizes),
+            ("durable", self.durable_modes),
+        ]
+
+        swept_axes = [name for name, values in axes if len(values) > 1]
+
+        self.params = list()
+
+        for body_size in self.body_sizes:
+            for credit_window in self.credit_windows:
+                for transaction_size in self.transaction_sizes:
+                    for durable in self.durable_modes:
+                        self.params.append(_TestParams(body_size, credit_window, transaction_size, durable,
+                                                       swept_axes))
+
     def run(self):
+        tests = list()
+
         if self.client_server:
             for sender_impl in self.sender_impls:
                 for receiver_impl in self.receiver_impls:
@@ -188,7 +320,7 @@ class QuiverBenchCommand(Command):
                             if server_impl not in CORE_PROTOCOL_SERVER_IMPLS:
                                 continue
 
-                        self.run_test(sender_impl, server_impl, receiver_impl)
+                        tests.append((sender_impl, server_impl, receiver_impl))
 
         if self.peer_to_peer:
             for sender_impl in self.sender_impls:
@@ -206,7 +338,39 @@ class QuiverBenchCommand(Command):
                     if receiver_impl not in PEER_TO_PEER_ARROW_IMPLS:
                         continue
 
-                    self.run_test(sender_impl, None, receiver_impl)
+                    tests.append((sender_impl, None, receiver_impl))
+
+        tests = [x + (params,) for x in tests for params in self.params]
+
+        if self.resume or self.rerun_failed:
+            tests = [x for x in tests if not self.skip_test(*x)]
+
+        for test in tests:
+            self.prepare_test(*test)
+
+        # Interleave the trials: trial 1 of every test, then trial 2...
+        if self.trials == 1:
+            runs = [x + (None,) for x in tests]
+        else:
+            runs = [x + (trial,) for trial in range(1, self.trials + 1) for x in tests]
+
+        if self.reuse_servers:
+            self.run_tests_with_shared_servers(runs)
+        elif self.jobs == 1:
+            for run in runs:
+                self.run_test(*run)
+        else:
+            self.run_tests_in_parallel(runs)
+
+        if self.trials > 1:
+            for test in tests:
+                self.aggregate_trials(*test)
+
+        if not self.quiet:
+            self.print_startup_times()
+
+        if self.results_db is not None:
+            print("Results recorded in {} (session {})".format(self.results_db, self.session))
 
         print("Test failures: {}".format(len(self.failures)))
 
@@ -216,87 +380,504 @@ class QuiverBenchCommand(Command):
         if len(self.failures) > 0:
             _plano.exit(1)
 
-    def run_test(self, sender_impl, server_impl, receiver_impl):
-        peer_to_peer = server_impl is None
-        port = _plano.get_random_port()
-        server = None
+    def run_tests_in_parallel(self, runs):
+        def task(test):
+            return lambda cpus: self.run_test(*test, cpus=cpus)
+
+        self.run_on_cpu_sets([task(x) for x in runs])
+
+    # The runs are grouped by server, keeping their order.  Each group
+    # starts its server once and runs its tests one at a time.
+    # Peer-to-peer tests have no server and run one at a time as usual.
+    def run_tests_with_shared_servers(self, runs):
+        groups = dict()
 
-        if server_impl == "activemq":
-            port = 5672
+        for run in runs:
+            groups.setdefault(run[1], list()).append(run)
 
-        if peer_to_peer:
+        def task(server_impl):
+            def run_group(cpus):
+                if server_impl is None:
+                    for run in groups[server_impl]:
+                        self.run_test(*run, cpus=cpus)
+
+                    return
+
+                durable = any(x[3].durable for x in groups[server_impl])
+                server = _SharedServer(self, server_impl, durable)
+
+                try:
+                    for run in groups[server_impl]:
+                        self.run_test(*run, cpus=cpus, shared_server=server)
+                finally:
+                    server.stop()
+
+            return run_group
+
+        if self.jobs == 1:
+            for server_impl in groups:
+                task(server_impl)(None)
+        else:
+            self.run_on_cpu_sets([task(x) for x in groups])
+
+    def record_startup_time(self, server):
+        with self.lock:
+            self.startup_times.setdefault(server.impl, list()).append(server.startup_time)
+
+    def print_startup_times(self):
+        for impl, times in sorted(self.startup_times.items()):
+            if len(times) <= 3:
+                ready = ", ".join("{:.2f}s".format(x) for x in times)
+            else:
+                ready = "{:.2f}s mean, {:.2f}s min, {:.2f}s max".format(sum(times) / len(times),
+                                                                         min(times), max(times))
+
+            print("Server {} started {} {}, ready in {}".format(impl, len(times), _plano.plural("time", len(times)),
+                                                               ready))
+
+    # Each worker takes a free CPU set, pins itself to it, and runs one
+    # task.  Thread CPU affinity is inherited by the processes the
+    # thread starts, so the task's server and arrows stay on the set.
+    def run_on_cpu_sets(self, tasks):
+        cpu_sets = _queue.Queue()
+
+        for cpu_set in self.cpu_sets:
+            cpu_sets.put(cpu_set)
+
+        def run_task(task):
+            cpus = cpu_sets.get()
+
+            try:
+                _os.sched_setaffinity(0, cpus)
+                task(cpus)
+            finally:
+                cpu_sets.put(cpus)
+
+        with _futures.ThreadPoolExecutor(max_workers=self.jobs) as executor:
+            for future in [executor.submit(run_task, x) for x in tasks]:
+                future.result()
+
+    def test_summary(self, sender_impl, server_impl, receiver_impl, params):
+        if server_impl is None:
             summary = "{} -> {} ".format(sender_impl, receiver_impl)
-            server_name = "none"
         else:
             summary = "{} -> {} -> {} ".format(sender_impl, server_impl, receiver_impl)
-            server_name = server_impl
 
-        test_dir = _plano.join(self.output_dir, sender_impl, server_name, receiver_impl)
-        pair_dir = _plano.join(test_dir, "pair")
-        server_dir = _plano.join(test_dir, "server")
+        if params.name is not None:
+            summary = "{}[{}] ".format(summary, params.label)
+
+        return summary
+
+    # A bench that sweeps parameters has a directory for each
+    # parameter combination under the impl directories
+    def test_dir(self, sender_impl, server_impl, receiver_impl, params):
+        test_dir = _plano.join(self.output_dir, sender_impl, _plano.nvl(server_impl, "none"), receiver_impl)
+
+        if params.name is not None:
+            test_dir = _plano.join(test_dir, params.name)
+
+        return test_dir
+
+    # Each trial of a test has its own directory under 'trials'.  A
+    # single trial uses the test directory itself.
+    def run_dirs(self, sender_impl, server_impl, receiver_impl, params):
+        test_dir = self.test_dir(sender_impl, server_impl, receiver_impl, params)
+
+        if self.trials == 1:
+            return [test_dir]
+
+        return [_plano.join(test_dir, "trials", "{:02}".format(x)) for x in range(1, self.trials + 1)]
+
+    def prepare_test(self, sender_impl, server_impl, receiver_impl, params):
+        test_dir = self.test_dir(sender_impl, server_impl, receiver_impl, params)
+
+        # Start clean so no output from an earlier run is mixed in
+        _plano.remove(test_dir)
+        _plano.make_dir(test_dir)
+
+        key, inputs = self.test_key(sender_impl, server_impl, receiver_impl, params)
+        _plano.write_json(_plano.join(test_dir, "key.json"), dict(key=key, **inputs))
+
+    # The key changes if anything that affects the results changes
+    def test_key(self, sender_impl, server_impl, receiver_impl, params):
+        args = self.args
+
+        inputs = {
+            "sender": sender_impl,
+            "server": server_impl,
+            "receiver": receiver_impl,
+            "params": params.marshal(),
+            "args": {
+                "count": args.count,
+                "duration": args.duration,
+                "rate": args.rate,
+                "set_message_id": args.set_message_id,
+                "timeout": args.timeout,
+                "sweep": args.sweep,
+                "trials": args.trials,
+                "reuse_servers": args.reuse_servers,
+            },
+            "versions": {
+                "sender": self.get_impl_info("quiver-arrow", sender_impl),
+                "server": self.get_impl_info("quiver-server", server_impl),
+                "receiver": self.get_impl_info("quiver-arrow", receiver_impl),
+            },
+        }
 
-        pair = _TestPair(self, pair_dir, sender_impl, receiver_impl, peer_to_peer)
+        data = _json.dumps(inputs, sort_keys=True).encode("utf-8")
+
+        return _hashlib.sha256(data).hexdigest(), inputs
+
+    def get_impl_info(self, command, impl):
+        if impl is None:
+            return None
+
+        with self.lock:
+            try:
+                return self.impl_info[(command, impl)]
+            except KeyError:
+                pass
+
+        try:
+            info = _plano.call([command, "--impl", impl, "--info"], quiet=True).strip()
+        except _plano.PlanoProcessError:
+            info = None
+
+        with self.lock:
+            self.impl_info[(command, impl)] = info
+
+        return info
+
+    # Returns the status of a previous run of the test with the same
+    # key, or None if there was none
+    def previous_status(self, sender_impl, server_impl, receiver_impl, params):
+        test_dir = self.test_dir(sender_impl, server_impl, receiver_impl, params)
+        key_file = _plano.join(test_dir, "key.json")
+        status_files = list()
+
+        for run_dir in self.run_dirs(sender_impl, server_impl, receiver_impl, params):
+            status_files.append(_plano.join(run_dir, "pair", "status.txt"))
+
+            if self.sweep is not None:
+                status_files.append(_plano.join(run_dir, "sweep", "status.txt"))
+
+        if not _plano.exists(key_file):
+            return None
+
+        key, inputs = self.test_key(sender_impl, server_impl, receiver_impl, params)
+
+        if _plano.read_json(key_file).get("key") != key:
+            return None
+
+        statuses = [_plano.read(x).strip() if _plano.exists(x) else None for x in status_files]
+
+        if None in statuses:
+            return None
+
+        if all(x == "PASSED" for x in statuses):
+            return "PASSED"
+
+        return "FAILED"
+
+    def skip_test(self, sender_impl, server_impl, receiver_impl, params):
+        status = self.previous_status(sender_impl, server_impl, receiver_impl, params)
+
+        if self.resume:
+            skip = status == "PASSED"
+        else:
+            skip = status != "FAILED"
+
+        if skip and not self.verbose and not self.quiet:
+            summary = self.test_summary(sender_impl, server_impl, receiver_impl, params)
+            print("{:.<111} SKIPPED ({})".format(summary, "passed" if status == "PASSED" else "not failed"))
+
+        return skip
+
+    def allocate_port(self):
+        with self.lock:
+            while True:
+                port = _plano.get_random_port()
+
+                if port not in self.ports:
+                    self.ports.add(port)
+                    return port
+
+    def release_port(self, port):
+        with self.lock:
+            self.ports.discard(port)
+
+    def run_test(self, sender_impl, server_impl, receiver_impl, params, trial=None, cpus=None, shared_server=None):
+        peer_to_peer = server_impl is None
+        port = self.allocate_port()
+        queue = "q0"
+        server = None
+
+        summary = self.test_summary(sender_impl, server_impl, receiver_impl, params)
+        run_dir = self.test_dir(sender_impl, server_impl, receiver_impl, params)
+
+        if trial is not None:
+            summary = "{}(trial {}) ".format(summary, trial)
+            run_dir = self.run_dirs(sender_impl, server_impl, receiver_impl, params)[trial - 1]
+
+        # Give each test its own queue on a shared server
+        if shared_server is not None:
+            self.release_port(port)
+            queue = "q-{}-{}".format(sender_impl, receiver_impl)
+
+            if params.name is not None:
+                queue = "{}-{}".format(queue, params.name)
+
+            if trial is not None:
+                queue = "{}-{}".format(queue, trial)
+
+        pair_dir = _plano.join(run_dir, "pair")
+        server_dir = _plano.join(run_dir, "server")
+        sweep_dir = _plano.join(run_dir, "sweep")
+        cpus_file = _plano.join(run_dir, "cpus.txt")
+
+        _plano.make_dir(run_dir)
+
+        pair = _TestPair(self, pair_dir, sender_impl, receiver_impl, params, peer_to_peer, queue)
+        sweep = None
+
+        if self.sweep is not None:
+            sweep = _TestSweep(self, sweep_dir, sender_impl, receiver_impl, params, peer_to_peer, queue)
 
         if not peer_to_peer:
-            server = _TestServer(server_dir, server_impl)
+            server = TestServer(server_dir, server_impl, self.probe_port, self.server_metrics, params.durable)
 
-        if not self.verbose and not self.quiet:
+        if cpus is not None:
+            _plano.write(cpus_file, "{}\n".format(",".join(str(x) for x in cpus)))
+
+        if self.jobs == 1 and not self.verbose and not self.quiet:
             print("{:.<111} ".format(summary), end="")
             _plano.flush()
 
-        if server is not None:
+        if shared_server is not None:
+            try:
+                shared_server.start()
+            except ServerTimeout as e:
+                self.report_server_failure(summary, e, shared_server.server)
+
+            port = shared_server.port
+            offsets = shared_server.offsets()
+            running_server = shared_server.server
+        elif server is not None:
             try:
                 server.start(port)
-            except _Timeout as e:
-                self.failures.append(str(e)) # XXX capture the combo
+                self.record_startup_time(server)
+            except ServerTimeout as e:
+                self.report_server_failure(summary, e, server)
 
-                if self.verbose:
-                    _plano.error(str(e))
-                else:
-                    print("FAILED")
+            running_server = server
 
-                if server is not None:
-                    server.print_summary()
+        captured = False
 
         try:
+            if server is not None:
+                server_start = running_server.sample()
+
             pair.run(port, self.args)
 
+            if server is not None:
+                server.save_summary(running_server, server_start, running_server.sample(), pair.message_count())
+
+            if sweep is not None:
+                sweep.run(port, self.args)
+
             if not self.verbose and not self.quiet:
-                print("PASSED")
+                with self.lock:
+                    self.print_result(summary, "PASSED")
         except KeyboardInterrupt:
             raise
-        except _plano.CalledProcessError as e:
+        except _plano.PlanoProcessError as e:
             self.failures.append(str(e)) # XXX capture the combo
 
-            if self.verbose:
-                _plano.error(str(e))
-            elif not self.quiet:
-                print("FAILED")
+            if shared_server is not None:
+                shared_server.capture(server, offsets, failed=True)
+                captured = True
 
-            pair.print_summary()
+            with self.lock:
+                if self.verbose:
+                    _plano.error(str(e))
+                elif not self.quiet:
+                    self.print_result(summary, "FAILED")
 
-            if server is not None:
-                server.print_summary()
+                pair.print_summary()
+
+                if sweep is not None and _plano.exists(sweep.output_file):
+                    sweep.print_summary()
+
+                if server is not None:
+                    server.print_summary()
         except:
             _traceback.print_exc()
         finally:
             _plano.flush()
 
-            if server is not None:
-                server.stop()
+            if shared_server is not None:
+                if not captured:
+                    shared_server.capture(server, offsets)
+            else:
+                if server is not None:
+                    server.stop()
+
+                self.release_port(port)
+
+        self.report(pair, server, trial)
+
+    def report_server_failure(self, summary, error, server):
+        self.failures.append(str(error)) # XXX capture the combo
+
+        with self.lock:
+            if self.verbose:
+                _plano.error(str(error))
+            else:
+                self.print_result(summary, "FAILED")
+
+            server.print_summary()
+
+    def aggregate_trials(self, sender_impl, server_impl, receiver_impl, params):
+        trials = list()
+
+        for i, run_dir in enumerate(self.run_dirs(sender_impl, server_impl, receiver_impl, params)):
+            summary_file = _plano.join(run_dir, "pair", "pair-summary.json")
+            status_file = _plano.join(run_dir, "pair", "status.txt")
+
+            if not _plano.exists(status_file) or _plano.read(status_file).strip() != "PASSED":
+                continue
+
+            results = _plano.read_json(summary_file)["results"]
+            values = {"throughput": results["message_rate"], "data_rate": results.get("data_rate")}
+
+            for percentile in LATENCY_PERCENTILES:
+                values["latency_{}".format(percentile)] = get_latency(results, percentile)
+
+            trials.append((i + 1, values))
+
+        metrics = dict()
+        outliers = set()
 
-        self.report(pair, server)
+        for name in ["throughput", "data_rate"] + ["latency_{}".format(x) for x in LATENCY_PERCENTILES]:
+            samples = [(trial, values[name]) for trial, values in trials if values[name] is not None]
+            metric = _aggregate([x[1] for x in samples])
+            metric["outliers"] = [samples[x][0] for x in metric["outliers"]]
+            metrics[name] = metric
 
-    def report(self, pair, server):
-        pass
+            outliers.update(metric["outliers"])
+
+        aggregate = {
+            "trials": self.trials,
+            "passed_trials": [x[0] for x in trials],
+            "outlier_trials": sorted(outliers),
+            "metrics": metrics,
+        }
+
+        test_dir = self.test_dir(sender_impl, server_impl, receiver_impl, params)
+        _plano.write_json(_plano.join(test_dir, "aggregate.json"), aggregate)
+
+    def print_result(self, summary, status):
+        if self.jobs == 1:
+            print(status)
+        else:
+            print("{:.<111} {}".format(summary, status))
+
+    def report(self, pair, server, trial):
+        if self.results_db is None:
+            return
+
+        server_impl = server.impl if server is not None else None
+
+        config = {
+            "sender": pair.sender_impl,
+            "server": server_impl,
+            "receiver": pair.receiver_impl,
+            "duration": self.duration,
+            "count": self.count,
+            "rate": self.rate,
+            "body_size": pair.params.body_size,
+            "credit_window": pair.params.credit_window,
+            "transaction_size": pair.params.transaction_size,
+            "durable": pair.params.durable,
+        }
+
+        versions = {
+            "sender": _first_line(self.get_impl_info("quiver-arrow", pair.sender_impl)),
+            "server": _first_line(self.get_impl_info("quiver-server", server_impl)),
+            "receiver": _first_line(self.get_impl_info("quiver-arrow", pair.receiver_impl)),
+        }
+
+        status = "FAILED"
+
+        if _plano.exists(pair.status_file):
+            status = _plano.read(pair.status_file).strip()
+
+        try:
+            with self.lock:
+                record_pair_run(ResultsDatabase(self.results_db), "quiver-bench", pair.output_dir, config,
+                                status, versions, session=self.session, trial=trial)
+        except CommandError as e:
+            _plano.warn(str(e))
+
+# Two-sided 95% critical values of Student's t distribution by degrees
+# of freedom
+_t_95 = [None, 12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+         2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+         2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042]
+
+# Summary statistics for a list of trial values.  Outliers are the
+# indexes of values whose modified z-score (based on the median
+# absolute deviation) exceeds 3.5.
+def _aggregate(values):
+    count = len(values)
+
+    result = {
+        "count": count,
+        "values": values,
+        "mean": None,
+        "median": None,
+        "stddev": None,
+        "ci95": None,
+        "outliers": [],
+    }
+
+    if count == 0:
+        return result
+
+    data = _numpy.array(values, dtype=float)
+    mean = float(_numpy.mean(data))
+    median = float(_numpy.median(data))
+
+    result["mean"] = mean
+    result["median"] = median
+
+    if count < 2:
+        return result
+
+    stddev = float(_numpy.std(data, ddof=1))
+    t = _t_95[count - 1] if count - 1 < len(_t_95) else 1.960
+    margin = t * stddev / _math.sqrt(count)
+
+    result["stddev"] = stddev
+    result["ci95"] = [mean - margin, mean + margin]
+
+    mad = float(_numpy.median(_numpy.abs(data - median)))
+
+    if count >= 3 and mad > 0:
+        scores = 0.6745 * (data - median) / mad
+        result["outliers"] = [int(x) for x in _numpy.nonzero(_numpy.abs(scores) > 3.5)[0]]
+
+    return result
 
 class _TestPair:
-    def __init__(self, command, output_dir, sender_impl, receiver_impl, peer_to_peer):
+    def __init__(self, command, output_dir, sender_impl, receiver_impl, params, peer_to_peer, queue="q0"):
         self.command = command
         self.output_dir = output_dir
         self.sender_impl = sender_impl
         self.receiver_impl = receiver_impl
+        self.params = params
         self.peer_to_peer = peer_to_peer
+        self.queue = queue
 
         self.command_file = _plano.join(self.output_dir, "command.txt")
         self.output_file = _plano.join(self.output_dir, "output.txt")
@@ -311,11 +892,15 @@ class _TestPair:
             "--receiver", self.receiver_impl,
             "--count", args.count,
             "--duration", args.duration,
-            "--body-size", args.body_size,
-            "--credit", args.credit,
+            "--rate", args.rate,
             "--timeout", args.timeout,
         ]
 
+        command += self.params.args()
+
+        if args.set_message_id:
+            command += ["--set-message-id"]
+
         if self.command.verbose:
             command += ["--verbose"]
 
@@ -323,8 +908,10 @@ class _TestPair:
             "--output", self.output_dir,
         ]
 
-        if not self.peer_to_peer:
-            command += ["//localhost:{}/q0".format(port)]
+        if self.peer_to_peer:
+            command += ["--port", str(port)]
+        else:
+            command += ["//localhost:{}/{}".format(port, self.queue)]
 
         _plano.write(self.command_file, "{}\n".format(" ".join(command)))
 
@@ -337,6 +924,14 @@ class _TestPair:
 
         _plano.write(self.status_file, "PASSED\n")
 
+    def message_count(self):
+        summary_file = _plano.join(self.output_dir, "receiver-summary.json")
+
+        if not _plano.exists(summary_file):
+            return None
+
+        return _plano.read_json(summary_file)["results"]["message_count"]
+
     def print_summary(self):
         print("--- Test command ---")
         print("> {}".format(_plano.read(self.command_file)), end="")
@@ -345,44 +940,178 @@ class _TestPair:
         for line in _plano.read_lines(self.output_file):
             print("> {}".format(line), end="")
 
-class _TestServer:
-    def __init__(self, output_dir, impl):
+class _TestSweep(_TestPair):
+    def run(self, port, args):
+        _plano.make_dir(self.output_dir)
+
+        command = [
+            "quiver-saturate",
+            "--sender", self.sender_impl,
+            "--receiver", self.receiver_impl,
+            "--sweep", args.sweep,
+            "--duration", args.duration,
+            "--timeout", args.timeout,
+        ]
+
+        command += self.params.args()
+
+        if self.command.verbose:
+            command += ["--verbose"]
+
+        command += [
+            "--output", self.output_dir,
+        ]
+
+        if self.peer_to_peer:
+            command += ["--port", str(port)]
+        else:
+            command += ["//localhost:{}/{}".format(port, self.queue)]
+
+        _plano.write(self.command_file, "{}\n".format(" ".join(command)))
+
+        with open(self.output_file, "w") as f:
+            try:
+                _plano.run(command, stdout=f, stderr=f)
+            except:
+                _plano.write(self.status_file, "FAILED\n")
+                raise
+
+        _plano.write(self.status_file, "PASSED\n")
+
+    def print_summary(self):
+        print("--- Sweep command ---")
+        print("> {}".format(_plano.read(self.command_file)), end="")
+        print("--- Sweep output ---")
+
+        for line in _plano.read_lines(self.output_file):
+            print("> {}".format(line), end="")
+
+class _TestParams:
+    def __init__(self, body_size, credit_window, transaction_size, durable, swept_axes):
+        self.body_size = body_size
+        self.credit_window = credit_window
+        self.transaction_size = transaction_size
+        self.durable = durable
+        self.swept_axes = swept_axes
+
+    def values(self):
+        return {
+            "body-size": str(self.body_size),
+            "credit": str(self.credit_window),
+            "transaction-size": str(self.transaction_size),
+            "durable": "yes" if self.durable else "no",
+        }
+
+    # The directory name, such as 'body-size-1000_durable-yes', made
+    # from the swept axes only.  None if nothing is swept.
+    @property
+    def name(self):
+        if not self.swept_axes:
+            return None
+
+        values = self.values()
+
+        return "_".join("{}-{}".format(x, values[x]) for x in self.swept_axes)
+
+    @property
+    def label(self):
+        values = self.values()
+
+        return ", ".join("{} {}".format(x, values[x]) for x in self.swept_axes)
+
+    def args(self):
+        args = [
+            "--body-size", str(self.body_size),
+            "--credit", str(self.credit_window),
+            "--transaction-size", str(self.transaction_size),
+        ]
+
+        if self.durable:
+            args += ["--durable"]
+
+        return args
+
+    def marshal(self):
+        return {
+            "body_size": self.body_size,
+            "credit_window": self.credit_window,
+            "transaction_size": self.transaction_size,
+            "durable": self.durable,
+        }
+
+# A server started for a test, with its command, output, and snapshots
+# saved in the output dir.  quiver-tune uses it too.
+class TestServer:
+    def __init__(self, output_dir, impl, probe_port=False, metrics=False, durable=False):
         self.output_dir = output_dir
         self.impl = impl
+        self.probe_port = probe_port
+        self.metrics = metrics
+        self.durable = durable
 
-        self.ready_file = _plano.make_temp_file()
+        self.ready_pipe = None
         self.command_file = _plano.join(self.output_dir, "command.txt")
         self.output_file = _plano.join(self.output_dir, "output.txt")
         self.status_file = _plano.join(self.output_dir, "status.txt")
+        self.startup_file = _plano.join(self.output_dir, "startup.txt")
+        self.snapshots_file = _plano.join(self.output_dir, "server-snapshots.csv")
+        self.metrics_file = _plano.join(self.output_dir, "server-metrics.jsonl")
+        self.summary_file = _plano.join(self.output_dir, "server-summary.json")
 
         self.output = None
         self.proc = None
+        self.startup_time = None
 
     def start(self, port):
         assert self.proc is None
 
         _plano.make_dir(self.output_dir)
 
+        self.ready_pipe = ReadyPipe()
         self.output = open(self.output_file, "w")
 
         command = [
             "quiver-server", "//localhost:{}/q0".format(port),
             "--impl", self.impl,
-            "--ready-file", self.ready_file,
+            "--ready-file", self.ready_pipe.path,
+            "--snapshots", self.snapshots_file,
             "--verbose",
         ]
 
+        # Durable tests against the builtin server need somewhere to
+        # keep messages.  Other tests get no journal, so they carry no
+        # journal costs.  Its metrics give the queue depth and credit
+        # over the test, at some cost to the server, so they are
+        # recorded only on request.
+        if self.impl == "builtin":
+            if self.durable:
+                command += ["--journal", _plano.join(self.output_dir, "journal")]
+
+            if self.metrics:
+                command += ["--metrics", self.metrics_file]
+
         _plano.write(self.command_file, "{}\n".format(" ".join(command)))
 
+        start_time = _time.time()
+
         self.proc = _plano.start(command, stdout=self.output, stderr=self.output)
 
-        for i in range(30):
-            if _plano.read(self.ready_file) == "ready\n":
-                break
+        if not self.ready_pipe.wait(30, self.proc):
+            if self.proc.poll() is not None:
+                raise ServerTimeout("Server exited before it was ready")
 
-            _plano.sleep(0.2)
-        else:
-            raise _Timeout("Timed out waiting for server to be ready")
+            raise ServerTimeout("Timed out waiting for server to be ready")
+
+        if self.probe_port:
+            try:
+                probe_port(port, timeout=max(0, 30 - (_time.time() - start_time)))
+            except CommandError as e:
+                raise ServerTimeout(str(e))
+
+        # Seconds from start to ready, kept apart from the test times
+        self.startup_time = _time.time() - start_time
+
+        _plano.write(self.startup_file, "{:.3f}\n".format(self.startup_time))
 
     def stop(self):
         assert self.proc is not None
@@ -396,7 +1125,49 @@ class _TestServer:
         else:
             _plano.write(self.status_file, "PASSED\n")
 
-        _plano.remove(self.ready_file)
+        self.ready_pipe.close()
+
+    # The server implementation processes, without 'quiver-server'
+    # itself
+    def sample(self):
+        snap = ServerSnapshot()
+        snap.capture(get_process_tree(self.proc.pid)[1:])
+
+        return snap
+
+    # Saves the server CPU time per message and peak RSS for a test.
+    # The samples come from the running server, which is this one or
+    # a shared server.
+    def save_summary(self, running_server, start, end, message_count):
+        max_rss = max(start.rss, end.rss)
+
+        if _plano.exists(running_server.snapshots_file):
+            with open(running_server.snapshots_file, "rb") as f:
+                for line in f:
+                    snap = ServerSnapshot()
+                    snap.unmarshal(line)
+
+                    if start.timestamp <= snap.timestamp <= end.timestamp:
+                        max_rss = max(max_rss, snap.rss)
+
+        cpu_time = end.cpu_time - start.cpu_time
+        cpu_per_message = None
+
+        if message_count:
+            cpu_per_message = cpu_time * 1000 / message_count
+
+        summary = {
+            "results": {
+                "duration": end.timestamp - start.timestamp,
+                "message_count": message_count,
+                "cpu_time": cpu_time,
+                "cpu_per_message": cpu_per_message,
+                "max_rss": max_rss,
+            }
+        }
+
+        _plano.make_dir(self.output_dir)
+        _plano.write_json(self.summary_file, summary)
 
     def print_summary(self):
         print("--- Server command ---")
@@ -406,5 +1177,86 @@ class _TestServer:
         for line in _plano.read_lines(self.output_file):
             print("> {}".format(line), end="")
 
-class _Timeout(Exception):
+# A server started once for many tests.  Each start gets its own
+# directory under 'servers/<impl>'.  Each test gets a copy of the server
+# command and the server output written during the test.
+class _SharedServer:
+    def __init__(self, command, impl, durable=False):
+        self.command = command
+        self.impl = impl
+        self.durable = durable
+        self.output_dir = _plano.join(command.output_dir, "servers", impl)
+
+        self.server = None
+        self.port = None
+        self.starts = 0
+        self.restart = False
+
+    def start(self):
+        if self.server is not None:
+            if self.server.proc.poll() is None and not self.restart:
+                return
+
+            self.stop()
+
+        self.starts += 1
+        self.restart = False
+        self.port = self.command.allocate_port()
+        self.server = TestServer(_plano.join(self.output_dir, "{:02}".format(self.starts)), self.impl,
+                                 self.command.probe_port, self.command.server_metrics, self.durable)
+
+        try:
+            self.server.start(self.port)
+        except ServerTimeout:
+            self.restart = True
+            raise
+
+        self.command.record_startup_time(self.server)
+
+    def stop(self):
+        if self.server is None:
+            return
+
+        self.server.stop()
+        self.command.release_port(self.port)
+
+        self.server = None
+
+    # The current sizes of the server output, snapshots, and metrics
+    # files
+    def offsets(self):
+        offsets = [_plano.get_file_size(self.server.output_file)]
+
+        for file_ in (self.server.snapshots_file, self.server.metrics_file):
+            offsets.append(_plano.get_file_size(file_) if _plano.exists(file_) else 0)
+
+        return offsets
+
+    # Restart the server before the next test if it exited or the
+    # test failed
+    def capture(self, test_server, offsets, failed=False):
+        _plano.make_dir(test_server.output_dir)
+        _plano.copy(self.server.command_file, test_server.command_file)
+
+        for source, target, offset in ((self.server.output_file, test_server.output_file, offsets[0]),
+                                       (self.server.snapshots_file, test_server.snapshots_file, offsets[1]),
+                                       (self.server.metrics_file, test_server.metrics_file, offsets[2])):
+            if not _plano.exists(source):
+                continue
+
+            with open(source, "rb") as fin:
+                fin.seek(offset)
+
+                with open(target, "wb") as fout:
+                    fout.write(fin.read())
+
+        running = self.server.proc.poll() is None
+
+        _plano.write(test_server.status_file, "PASSED\n" if running else "FAILED\n")
+
+        if failed or not running:
+            self.restart = True
+
+# Raised when a test server exits or times out before it is ready
+class ServerTimeout(Exception):
     pass
@@ -0,0 +1,356 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import plano as _plano
+
+from .common import *
+from .common import __version__
+
+_description = """
+Compare the results of two 'quiver-bench' runs.
+
+'quiver-bench-compare' matches the tests in the baseline and current
+output directories by sender, server, and receiver.  It reports
+significant changes in throughput, median latency, tail latency, and
+client and server CPU time per message, ranked from the worst
+regression to the best improvement.  It exits with a non-zero code if there are regressions.
+"""
+
+_epilog = """
+significance:
+  A change is significant if it exceeds --threshold percent of the
+  baseline value.  Latency changes must also be at least 1 ms.  If
+  both runs used --trials, the 95% confidence intervals of the two
+  means must not overlap.  A test that passed in the baseline and
+  failed in the current run is always a regression.
+
+example usage:
+  $ quiver-bench-compare quiver-bench-2024-05-01 quiver-bench-2024-05-08
+"""
+
+class QuiverBenchCompareCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverBenchCompareCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        self.parser.add_argument("baseline", metavar="BASELINE-DIR",
+                                 help="The output directory of the earlier bench run")
+        self.parser.add_argument("current", metavar="CURRENT-DIR",
+                                 help="The output directory of the later bench run")
+        self.parser.add_argument("--threshold", metavar="PERCENT", type=float, default=5,
+                                 help="Report changes larger than PERCENT (default 5)")
+        self.parser.add_argument("--percentile", metavar="PERCENTILE", default="99",
+                                 choices=LATENCY_PERCENTILES,
+                                 help="Use PERCENTILE as the tail latency (default 99)")
+        self.parser.add_argument("--all", action="store_true",
+                                 help="Show unchanged results as well")
+
+        self.add_common_tool_arguments()
+
+    def init(self):
+        super(QuiverBenchCompareCommand, self).init()
+
+        self.init_common_tool_attributes()
+
+        for path in (self.args.baseline, self.args.current):
+            if not _plano.is_dir(path):
+                raise CommandError("Directory '{}' not found", path)
+
+        self.baseline_dir = self.args.baseline
+        self.current_dir = self.args.current
+        self.threshold = self.args.threshold
+        self.percentile = self.args.percentile
+        self.show_all = self.args.all
+
+        self.metrics = [
+            # Name, label, unit, higher is better
+            ("throughput", "Throughput", "m/s", True),
+            ("latency_50", "Median latency", "ms", False),
+            ("latency_{}".format(self.percentile), "p{} latency".format(self.percentile), "ms", False),
+            ("cpu_per_message", "CPU per message", "us", False),
+            ("server_cpu_per_message", "Server CPU/message", "us", False),
+        ]
+
+        self.comparisons = list()
+        self.missing = list()
+
+    def run(self):
+        baseline = read_bench_results(self.baseline_dir, self.percentile)
+        current = read_bench_results(self.current_dir, self.percentile)
+
+        for test in sorted(baseline.keys() | current.keys()):
+            if test not in current:
+                self.missing.append((test, "current"))
+                continue
+
+            if test not in baseline:
+                self.missing.append((test, "baseline"))
+                continue
+
+            self.compare(test, baseline[test], current[test])
+
+        # Worst regression first and best improvement last
+        order = {"REGRESSION": 0, "-": 1, "IMPROVEMENT": 2}
+
+        def rank(comparison):
+            if comparison.verdict == "REGRESSION":
+                return order[comparison.verdict], -comparison.severity
+
+            return order[comparison.verdict], comparison.severity
+
+        self.comparisons.sort(key=rank)
+
+        if not self.quiet:
+            self.print_summary()
+
+        if self.regressions:
+            _plano.exit(1)
+
+    @property
+    def regressions(self):
+        return [x for x in self.comparisons if x.verdict == "REGRESSION"]
+
+    @property
+    def improvements(self):
+        return [x for x in self.comparisons if x.verdict == "IMPROVEMENT"]
+
+    def compare(self, test, baseline, current):
+        if baseline.status == "PASSED" and current.status != "PASSED":
+            self.comparisons.append(_Comparison(test, "Status", "", baseline.status, current.status,
+                                                None, "REGRESSION", float("inf")))
+            return
+
+        if current.status != "PASSED" or baseline.status != "PASSED":
+            return
+
+        for name, label, unit, higher_is_better in self.metrics:
+            before = baseline.metrics.get(name)
+            after = current.metrics.get(name)
+
+            if before is None or after is None or before.value is None or after.value is None:
+                continue
+
+            if before.value == 0:
+                continue
+
+            change = (after.value - before.value) / before.value * 100
+            significant = abs(change) > self.threshold
+
+            if unit == "ms" and abs(after.value - before.value) < 1:
+                significant = False
+
+            if before.ci95 is not None and after.ci95 is not None:
+                if before.ci95[0] <= after.ci95[1] and after.ci95[0] <= before.ci95[1]:
+                    significant = False
+
+            verdict = "-"
+
+            if significant:
+                better = change > 0 if higher_is_better else change < 0
+                verdict = "IMPROVEMENT" if better else "REGRESSION"
+
+            self.comparisons.append(_Comparison(test, label, unit, before.value, after.value,
+                                                change, verdict, abs(change)))
+
+    def print_summary(self):
+        print_heading("Configuration")
+
+        print_field("Baseline", self.baseline_dir)
+        print_field("Current", self.current_dir)
+        print_numeric_field("Threshold", self.threshold, "percent", "{:,.1f}")
+
+        print_heading("Changes")
+
+        rows = [x for x in self.comparisons if self.show_all or x.verdict != "-"]
+
+        if rows:
+            width = max(len(x.test) for x in rows)
+            columns = "{:<" + str(width) + "}  {:<24}  {:>12}  {:>12}  {:>9}  {}"
+
+            print(columns.format("Test", "Metric", "Baseline", "Current", "Change", "Verdict"))
+            print(columns.format("-" * width, "-" * 24, "-" * 12, "-" * 12, "-" * 9, "-" * 11))
+
+            for row in rows:
+                print(columns.format(row.test, row.metric_label, row.format_value(row.before),
+                                     row.format_value(row.after), row.format_change(), row.verdict).rstrip())
+        else:
+            print("No significant changes")
+
+        for test, where in self.missing:
+            print()
+            print("Test {} is missing from the {} results".format(test, where))
+
+        print_heading("Results")
+
+        print_numeric_field("Regressions", len(self.regressions), _plano.plural("change", len(self.regressions)))
+        print_numeric_field("Improvements", len(self.improvements), _plano.plural("change", len(self.improvements)))
+
+class _Comparison:
+    def __init__(self, test, metric, unit, before, after, change, verdict, severity):
+        self.test = test
+        self.metric = metric
+        self.unit = unit
+        self.before = before
+        self.after = after
+        self.change = change
+        self.verdict = verdict
+        self.severity = severity
+
+    @property
+    def metric_label(self):
+        if self.unit:
+            return "{} [{}]".format(self.metric, self.unit)
+
+        return self.metric
+
+    def format_value(self, value):
+        if isinstance(value, str):
+            return value
+
+        if value < 100:
+            return "{:,.1f}".format(value)
+
+        return "{:,.0f}".format(value)
+
+    def format_change(self):
+        if self.change is None:
+            return "-"
+
+        return "{:+,.1f}%".format(self.change)
+
+class _Metric:
+    def __init__(self, value, ci95=None):
+        self.value = value
+        self.ci95 = ci95
+
+class _TestResults:
+    def __init__(self, status):
+        self.status = status
+        self.metrics = dict()
+
+# Returns a map of test names to results for a bench output directory.
+# Tests with several trials use the aggregate results.
+def read_bench_results(bench_dir, percentile):
+    tests = dict()
+
+    for sender, server, receiver, params, test_dir in list_bench_tests(bench_dir):
+        if server is None:
+            name = "{} -> {}".format(sender, receiver)
+        else:
+            name = "{} -> {} -> {}".format(sender, server, receiver)
+
+        if params is not None:
+            name = "{} [{}]".format(name, params)
+
+        results = _read_test_results(test_dir, percentile)
+
+        if results is not None:
+            tests[name] = results
+
+    return tests
+
+def _read_test_results(test_dir, percentile):
+    trials_dir = _plano.join(test_dir, "trials")
+    run_dirs = [test_dir]
+
+    if _plano.is_dir(trials_dir):
+        run_dirs = [_plano.join(trials_dir, x) for x in sorted(_plano.list_dir(trials_dir))]
+
+    statuses = list()
+
+    for run_dir in run_dirs:
+        status_file = _plano.join(run_dir, "pair", "status.txt")
+
+        if not _plano.exists(status_file):
+            return None
+
+        statuses.append(_plano.read(status_file).strip())
+
+    results = _TestResults("PASSED" if all(x == "PASSED" for x in statuses) else "FAILED")
+
+    if results.status != "PASSED":
+        return results
+
+    names = ["throughput", "latency_50", "latency_{}".format(percentile)]
+    aggregate_file = _plano.join(test_dir, "aggregate.json")
+
+    if _plano.exists(aggregate_file):
+        metrics = _plano.read_json(aggregate_file)["metrics"]
+
+        for name in names:
+            results.metrics[name] = _Metric(metrics[name]["mean"], metrics[name]["ci95"])
+    else:
+        pair_dir = _plano.join(run_dirs[0], "pair")
+        summary_file = _plano.join(pair_dir, "pair-summary.json")
+
+        if not _plano.exists(summary_file):
+            summary_file = _plano.join(pair_dir, "receiver-summary.json")
+
+        summary = _plano.read_json(summary_file)["results"]
+
+        results.metrics["throughput"] = _Metric(summary["message_rate"])
+
+        for name in names[1:]:
+            results.metrics[name] = _Metric(get_latency(summary, name[len("latency_"):]))
+
+    cpu_times = list()
+    server_cpu_times = list()
+
+    for run_dir in run_dirs:
+        cpu_time = _read_cpu_per_message(_plano.join(run_dir, "pair"))
+        server_cpu_time = _read_server_cpu_per_message(_plano.join(run_dir, "server"))
+
+        if cpu_time is not None:
+            cpu_times.append(cpu_time)
+
+        if server_cpu_time is not None:
+            server_cpu_times.append(server_cpu_time)
+
+    if cpu_times:
+        results.metrics["cpu_per_message"] = _Metric(sum(cpu_times) / len(cpu_times))
+
+    if server_cpu_times:
+        results.metrics["server_cpu_per_message"] = _Metric(sum(server_cpu_times) / len(server_cpu_times))
+
+    return results
+
+# Sender and receiver CPU time in microseconds per message received
+def _read_cpu_per_message(pair_dir):
+    sender = _plano.read_json(_plano.join(pair_dir, "sender-summary.json"))["results"]
+    receiver = _plano.read_json(_plano.join(pair_dir, "receiver-summary.json"))["results"]
+
+    if sender.get("cpu_time") is None or receiver.get("cpu_time") is None:
+        return None
+
+    if not receiver["message_count"]:
+        return None
+
+    return (sender["cpu_time"] + receiver["cpu_time"]) * 1000 / receiver["message_count"]
+
+# Server CPU time in microseconds per message, as saved by
+# 'quiver-bench'
+def _read_server_cpu_per_message(server_dir):
+    summary_file = _plano.join(server_dir, "server-summary.json")
+
+    if not _plano.exists(summary_file):
+        return None
+
+    return _plano.read_json(summary_file)["results"]["cpu_per_message"]
@@ -0,0 +1,442 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one
+# or more contributor license agreements.  See the NOTICE file
+# distributed with this work for additional information
+# regarding copyright ownership.  The ASF licenses this file
+# to you under the Apache License, Version 2.0 (the
+# "License"); you may not use this file except in compliance
+# with the License.  You may obtain a copy of the License at
+#
+#   http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an
+# "AS IS" BASIS, WITHOUT WARRANTIES OR CONDITIONS OF ANY
+# KIND, either express or implied.  See the License for the
+# specific language governing permissions and limitations
+# under the License.
+#
+
+import plano as _plano
+
+from .charts import line_chart
+from .common import *
+from .common import __version__
+from .common import _epilog_urls
+from .common import _epilog_arrow_impls
+
+_description = """
+Find the highest message rate a sender-receiver pair can sustain
+while staying within a latency objective.
+
+'quiver-saturate' runs a series of short, rate-limited 'quiver' pairs.
+It binary-searches the target rate until latency at the chosen
+percentile exceeds the objective or the receiver falls behind.
+
+With --sweep, it instead runs a pair at each of the given rates and
+charts latency against offered load.
+"""
+
+_epilog = """
+{_epilog_urls}
+
+{_epilog_arrow_impls}
+
+sweep rates:
+  A comma-separated list of rates or ranges.  A rate ending in '%' is
+  relative to the maximum rate.  A range is START..STOP/STEP.
+  1k,2k,5k                        Three fixed rates
+  10%..120%/10%                   10% to 120% of the maximum in steps of 10%
+
+example usage:
+  $ quiver-saturate               # Search using the default C arrow peer-to-peer
+  $ quiver-saturate q0 --latency-limit 5 --percentile 99.9
+  $ quiver-saturate q0 --sweep 10%..120%/10%
+""".format(**globals())
+
+class QuiverSaturateCommand(Command):
+    def __init__(self, home_dir):
+        super(QuiverSaturateCommand, self).__init__(home_dir)
+
+        self.parser.description = _description.lstrip()
+        self.parser.epilog = _epilog.lstrip()
+
+        self.parser.add_argument("url", metavar="URL", nargs="?",
+                                 help="The location of a message source or target "
+                                 "(if not set, the pairs run in peer-to-peer mode)")
+        self.parser.add_argument("--output", metavar="DIR",
+                                 help="Save output files to DIR")
+        self.parser.add_argument("--impl", metavar="IMPL", default=DEFAULT_ARROW_IMPL,
+                                 help="Use IMPL to send and receive " \
+                                 "(default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--sender", metavar="IMPL",
+                                 help="Use IMPL to send (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--receiver", metavar="IMPL",
+                                 help="Use IMPL to receive (default {})".format(DEFAULT_ARROW_IMPL))
+        self.parser.add_argument("--latency-limit", metavar="MILLIS", default="10",
+                                 help="Fail a step when latency exceeds MILLIS (default 10)")
+        self.parser.add_argument("--percentile", metavar="PERCENTILE", default="99",
+                                 choices=LATENCY_PERCENTILES,
+                                 help="Apply the latency limit at PERCENTILE (default 99)")
+        self.parser.add_argument("--min-rate", metavar="COUNT", default="100",
+                                 help="Start searching at COUNT messages per second (default 100)")
+        self.parser.add_argument("--max-rate", metavar="COUNT", default="0",
+                                 help="Stop searching at COUNT messages per second "
+                                 "(default 0, measure with an unpaced run)")
+        self.parser.add_argument("--rate-tolerance", metavar="PERCENT", default="5",
+                                 help="Fail a step when the end-to-end rate falls more than "
+                                 "PERCENT below the target (default 5)")
+        self.parser.add_argument("--steps", metavar="COUNT", default="8",
+                                 help="Run at most COUNT search steps (default 8)")
+        self.parser.add_argument("--sweep", metavar="RATES",
+                                 help="Run a step at each of RATES instead of searching")
+        self.parser.add_argument("-d", "--duration", metavar="DURATION", default="10s",
+                                 help="Run each step for DURATION (default 10s)")
+        self.parser.add_argument("--body-size", metavar="COUNT", default="100",
+                                 help="Send message bodies containing COUNT bytes (default 100)")
+        self.parser.add_argument("--credit", metavar="COUNT", default="1000",
+                                 help="Sustain credit for COUNT incoming messages (default 1000)")
+        self.parser.add_argument("--transaction-size", metavar="COUNT", default="0",
+                                 help="Transfer batches of COUNT messages inside transactions "
+                                 "(default 0, disabled)")
+        self.parser.add_argument("--durable", action="store_true",
+                                 help="Require persistent store-and-forward transfers")
+        self.parser.add_argument("--timeout", metavar="DURATION", default="10",
+                                 help="Fail a step after DURATION without transfers (default 10s)")
+
+        self.add_peer_to_peer_arguments()
+        self.add_common_tool_arguments()
+
+    def init(self):
+        super(QuiverSaturateCommand, self).init()
+
+        impl = self.args.impl
+
+        self.sender_impl = require_impl(self.args.sender, impl)
+        self.receiver_impl = require_impl(self.args.receiver, impl)
+
+        self.init_url_attributes()
+        self.init_output_dir()
+        self.init_common_tool_attributes()
+
+        self.peer_to_peer = self.args.url is None
+        self.duration = self.parse_duration(self.args.duration)
+        self.body_size = self.parse_count(self.args.body_size)
+        self.credit_window = self.parse_count(self.args.credit)
+        self.transaction_size = self.parse_count(self.args.transaction_size)
+        self.durable = self.args.durable
+        self.timeout = self.parse_duration(self.args.timeout)
+
+        self.latency_limit = self.parse_count(self.args.latency_limit)
+        self.percentile = self.args.percentile
+        self.min_rate = self.parse_count(self.args.min_rate)
+        self.max_rate = self.parse_count(self.args.max_rate)
+        self.rate_tolerance = self.parse_count(self.args.rate_tolerance) / 100
+        self.max_steps = self.parse_count(self.args.steps)
+
+        if self.min_rate <= 0:
+            self.parser.error("The minimum rate must be greater than zero")
+
+        if self.max_rate != 0 and self.max_rate < self.min_rate:
+            self.parser.error("The maximum rate must not be less than the minimum rate")
+
+        self.sweep = None
+
+        if self.args.sweep is not None:
+            self.sweep = self.parse_rates(self.args.sweep)
+
+        self.summary_file = _plano.join(self.output_dir, "saturate-summary.json")
+        self.chart_file = _plano.join(self.output_dir, "saturate-chart.svg")
+
+        self.steps = list()
+        self.knee = None
+
+    # Returns a list of (value, relative) tuples
+    def parse_rates(self, value):
+        rates = list()
+
+        for item in value.split(","):
+            if ".." in item:
+                start, rest = item.split("..", 1)
+                stop, step = rest.split("/", 1) if "/" in rest else (rest, start)
+
+                start, stop, step = [self.parse_rate(x) for x in (start, stop, step)]
+
+                if len({start[1], stop[1], step[1]}) != 1 or step[0] <= 0:
+                    self.parser.error("Failure parsing '{}' as a rate range".format(item))
+
+                rate = start[0]
+
+                while rate <= stop[0]:
+                    rates.append((rate, start[1]))
+                    rate += step[0]
+            else:
+                rates.append(self.parse_rate(item))
+
+        return rates
+
+    def parse_rate(self, value):
+        if value.endswith("%"):
+            return self.parse_count(value[:-1]), True
+
+        return self.parse_count(value), False
+
+    def measure_max_rate(self):
+        if self.max_rate != 0:
+            return self.max_rate
+
+        step = self.run_step(0)
+
+        if step.error is not None:
+            raise CommandError("The unpaced run failed: {}", step.error)
+
+        return max(1, int(step.rate))
+
+    def run(self):
+        if self.sweep is not None:
+            self.run_sweep()
+        else:
+            self.run_search()
+
+        self.save_summary()
+        self.save_chart()
+
+        if not self.quiet:
+            self.print_summary()
+
+        if self.sweep is not None:
+            if all(x.error == "error" for x in self.steps):
+                _plano.exit(1)
+        elif self.knee is None:
+            _plano.exit(1)
+
+    def run_sweep(self):
+        max_rate = None
+
+        if any(relative for rate, relative in self.sweep):
+            max_rate = self.measure_max_rate()
+
+        for rate, relative in self.sweep:
+            if relative:
+                rate = max(1, max_rate * rate // 100)
+
+            if self.run_step(rate).passed:
+                self.knee = max(rate, _plano.nvl(self.knee, 0))
+
+    def run_search(self):
+        max_rate = self.measure_max_rate()
+
+        lower, upper = min(self.min_rate, max_rate), max_rate
+
+        # Confirm the search range before bisecting it
+
+        if self.run_step(upper).passed:
+            self.knee = upper
+        elif self.run_step(lower).passed:
+            self.knee = lower
+
+            while len(self.steps) < self.max_steps and upper - lower > max(1, upper // 100):
+                rate = (lower + upper) // 2
+
+                if self.run_step(rate).passed:
+                    lower = self.knee = rate
+                else:
+                    upper = rate
+
+    def run_step(self, rate):
+        step_dir = _plano.join(self.output_dir, "steps", "{:02}".format(len(self.steps)))
+        step = _PairStep(self, step_dir, rate=rate)
+
+        if not self.quiet:
+            print("{:.<63} ".format("Rate {} ".format(step.rate_label)), end="")
+            _plano.flush()
+
+        step.run()
+        step.check(self.percentile, self.latency_limit, self.rate_tolerance)
+
+        if not self.quiet:
+            print("PASSED" if step.passed else "FAILED")
+
+        self.steps.append(step)
+
+        return step
+
+    def save_summary(self):
+        props = {
+            "config": {
+                "sender": self.sender_impl.name,
+                "receiver": self.receiver_impl.name,
+                "url": self.url,
+                "output_dir": self.output_dir,
+                "duration": self.duration,
+                "body_size": self.body_size,
+                "credit_window": self.credit_window,
+                "transaction_size": self.transaction_size,
+                "durable": self.durable,
+                "latency_limit": self.latency_limit,
+                "percentile": self.percentile,
+                "min_rate": self.min_rate,
+                "max_rate": self.max_rate,
+                "rate_tolerance": self.rate_tolerance,
+                "sweep": self.args.sweep,
+            },
+            "results": {
+                "knee_rate": self.knee,
+                "steps": [x.marshal() for x in self.steps],
+            },
+        }
+
+        _plano.write_json(self.summary_file, props)
+
+    def save_chart(self):
+        _plano.write(self.chart_file, render_latency_chart(self.steps))
+
+    def print_summary(self):
+        print_heading("Configuration")
+
+        print_field("Sender", self.sender_impl.name)
+        print_field("Receiver", self.receiver_impl.name)
+        print_field("URL", self.url)
+        print_field("Output files", self.output_dir)
+        print_numeric_field("Step duration", self.duration, _plano.plural("second", self.duration))
+        print_numeric_field("Latency limit", self.latency_limit, "ms")
+        print_field("Latency percentile", "{}%".format(self.percentile))
+
+        print_heading("Steps")
+
+        print_step_table(self.steps, self.percentile)
+
+        print_heading("Results")
+
+        print_numeric_field("Sustainable rate", self.knee, "messages/s")
+
+def render_latency_chart(steps):
+    steps = sorted([x for x in steps if x.target_rate != 0 and x.receiver is not None], key=lambda x: x.target_rate)
+    series = list()
+
+    for percentile in ("50", "99", "99.9"):
+        points = [(x.target_rate, x.latency(percentile)) for x in steps]
+        series.append(("p{}".format(percentile), points))
+
+    return line_chart(series, "Offered load [messages/s]", "Latency [ms]")
+
+def print_step_table(steps, percentile):
+    columns = "{:>12}  {:>12}  {:>10}  {:>10}  {:<13}"
+
+    print(columns.format("Target [m/s]", "Rate [m/s]", "p50 [ms]", "p{} [ms]".format(percentile), "Status").rstrip())
+    print(columns.format(*(["-" * 12] * 2 + ["-" * 10] * 2 + ["-" * 13])))
+
+    for step in sorted(steps, key=lambda x: (x.target_rate == 0, x.target_rate)):
+        rate, p50, pn = "-", "-", "-"
+
+        if step.rate is not None:
+            rate = "{:,.0f}".format(step.rate)
+
+        if step.receiver is not None:
+            p50 = "{:,}".format(step.latency("50"))
+            pn = "{:,}".format(step.latency(percentile))
+
+        print(columns.format(step.rate_label, rate, p50, pn, step.status).rstrip())
+
+class _PairStep:
+    def __init__(self, command, output_dir, rate=0, body_size=None, credit_window=None, transaction_size=None):
+        self.command = command
+        self.output_dir = output_dir
+        self.target_rate = rate
+        self.body_size = _plano.nvl(body_size, command.body_size)
+        self.credit_window = _plano.nvl(credit_window, command.credit_window)
+        self.transaction_size = _plano.nvl(transaction_size, command.transaction_size)
+
+        self.command_file = _plano.join(self.output_dir, "command.txt")
+        self.output_file = _plano.join(self.output_dir, "output.txt")
+
+        self.sender = None
+        self.receiver = None
+        self.rate = None
+        self.error = None
+        self.passed = False
+
+    @property
+    def rate_label(self):
+        if self.target_rate == 0:
+            return "unpaced"
+
+        return "{:,}".format(self.target_rate)
+
+    @property
+    def status(self):
+        if self.passed:
+            return "PASSED"
+
+        return "FAILED ({})".format(self.error)
+
+    def run(self):
+        _plano.make_dir(self.output_dir)
+
+        command = [
+            "quiver",
+            "--sender", self.command.sender_impl.name,
+            "--receiver", self.command.receiver_impl.name,
+            "--duration", str(self.command.duration),
+            "--rate", str(self.target_rate),
+            "--body-size", str(self.body_size),
+            "--credit", str(self.credit_window),
+            "--transaction-size", str(self.transaction_size),
+            "--timeout", str(self.command.timeout),
+            "--output", self.output_dir,
+        ]
+
+        if self.command.durable:
+            command += ["--durable"]
+
+        if self.command.peer_to_peer:
+            command += ["--port", str(self.command.port)]
+        else:
+            command += [self.command.url]
+
+        _plano.write(self.command_file, "{}\n".format(" ".join(command)))
+
+        with open(self.output_file, "w") as f:
+            try:
+                _plano.run(command, stdout=f, stderr=f)
+            except _plano.PlanoProcessError:
+                self.error = "error"
+                return
+
+        self.sender = _plano.read_json(_plano.join(self.output_dir, "sender-summary.json"))["results"]
+        self.receiver = _plano.read_json(_plano.join(self.output_dir, "receiver-summary.json"))["results"]
+
+        duration = (self.receiver["last_receive_time"] - self.sender["first_send_time"]) / 1000
+
+        if duration > 0:
+            self.rate = self.receiver["message_count"] / duration
+
+    def latency(self, percentile):
+        return get_latency(self.receiver, percentile)
+
+    def check(self, percentile, latency_limit, rate_tolerance):
+        if self.error is not None:
+            return
+
+        if self.rate is None:
+            self.error = "no transfers"
+        elif self.target_rate != 0 and self.rate < self.target_rate * (1 - rate_tolerance):
+            self.error = "behind"
+        elif self.target_rate != 0 and self.latency(percentile) > latency_limit:
+            self.error = "latency"
+        else:
+            self.passed = True
+
+    def marshal(self):
+        return {
+            "output_dir": self.output_dir,
+            "target_rate": self.target_rate,
+            "body_size": self.body_size,
+            "credit_window": self.credit_window,
+            "transaction_size": self.transaction_size,
+            "rate": self.rate,
+            "passed": self.passed,
+            "error": self.error,
+            "sender": self.sender,
+            "receiver": self.receiver,
+        }
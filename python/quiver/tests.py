@@ -19,6 +19,7 @@
 
 import sys as _sys
 import os as _os
+import socket as _socket
 
 from plano import *
 from quiver.common import *
@@ -53,6 +54,28 @@ def command_quiver_bench():
         _test_command("quiver-bench")
         run(f"quiver-bench --init-only --output {output}")
 
+@test
+def command_quiver_bench_compare():
+    with working_dir() as output:
+        _test_command("quiver-bench-compare")
+        run(f"quiver-bench-compare --init-only {output} {output}")
+
+@test
+def command_quiver_results():
+    with working_dir() as output:
+        _test_command("quiver-results")
+        run(f"quiver-results --init-only import {output}/results.db {output}")
+
+@test
+def command_quiver_saturate():
+    _test_command("quiver-saturate")
+    run("quiver-saturate --init-only q0")
+
+@test
+def command_quiver_tune():
+    _test_command("quiver-tune")
+    run("quiver-tune --init-only q0")
+
 # Arrows
 
 @test
@@ -105,6 +128,283 @@ def server_builtin():
 def server_qpid_dispatch():
     _test_server("qpid-dispatch")
 
+@test
+def server_builtin_raw():
+    # Check both decoded and undecoded forwarding
+    for args in ([], ["--raw"]):
+        with _TestServer(extra_server_args=args) as server:
+            run(f"quiver {server.url} --count 10")
+
+@test
+def server_ready_pipe():
+    ready_pipe = ReadyPipe()
+
+    try:
+        with start(["quiver-server", _test_url(), "--ready-file", ready_pipe.path]) as proc:
+            assert ready_pipe.wait(30, proc)
+
+        # A server that exits before it is ready does not use up the timeout
+        with start(["quiver-server", _test_url(), "--impl", "no-such-impl",
+                    "--ready-file", ready_pipe.path]) as proc:
+            start_time = get_time()
+
+            assert not ready_pipe.wait(30, proc)
+            assert get_time() - start_time < 10
+    finally:
+        ready_pipe.close()
+
+@test
+def server_builtin_topic_retention():
+    with working_dir() as output:
+        server_output = join(output, "server.txt")
+        metrics_file = join(output, "metrics.jsonl")
+        server_args = ["--topic", "t0", "--retain-messages", "10", "--metrics", metrics_file]
+
+        with _TestServer(extra_server_args=server_args, output=server_output) as server:
+            url = server.url.rsplit("/", 1)[0] + "/t0"
+
+            # Every consumer gets every message, and the log drops
+            # each message once all the consumers have it
+            receivers = [start(f"quiver-arrow receive {url} --count 20 --timeout 10 --output {output}/receiver{i}")
+                         for i in range(2)]
+
+            _await_output(server_output, "to topic 't0'", 2)
+
+            run(f"quiver-arrow send {url} --count 20 --output {output}/sender0")
+
+            for i, receiver in enumerate(receivers):
+                wait(receiver, check=True)
+
+                summary = read_json(join(output, f"receiver{i}", "receiver-summary.json"))
+                assert summary["results"]["message_count"] == 20, summary
+
+            _await_node_metric(metrics_file, "t0", "depth", 0)
+
+            # With no consumers, the log keeps the newest 10
+            run(f"quiver-arrow send {url} --count 100 --output {output}/sender1")
+
+            _await_node_metric(metrics_file, "t0", "depth", 10)
+
+@test
+def server_builtin_queue_limit():
+    with working_dir() as output:
+        server_output = join(output, "server.txt")
+        metrics_file = join(output, "metrics.jsonl")
+        server_args = ["--max-queue-messages", "100", "--metrics", metrics_file]
+
+        with _TestServer(extra_server_args=server_args, output=server_output) as server:
+            # With no consumer, the queue fills and the producer gets
+            # no more credit
+            sender = start(f"quiver-arrow send {server.url} --count 1000 --timeout 60 --output {output}/sender")
+
+            _await_output(server_output, "Stopped credit to 1 producer on queue 'q0'")
+            sleep(2)
+
+            depth = _read_node_metric(metrics_file, "q0", "depth")
+
+            # The producer may use the credit it already had
+            assert 100 <= depth <= 110, depth
+            assert sender.poll() is None
+
+            # A slow consumer drains the queue, and the producer gets
+            # credit again
+            run(f"quiver-arrow receive {server.url} --count 1000 --credit 10 --timeout 60 "
+                f"--output {output}/receiver")
+
+            wait(sender, check=True)
+
+            _await_output(server_output, "Resumed credit to 1 producer on queue 'q0'")
+
+@test
+def server_builtin_metrics():
+    with working_dir() as output:
+        metrics_file = join(output, "metrics.jsonl")
+        metrics_socket = join(output, "metrics.sock")
+        server_args = ["--metrics", metrics_file, "--metrics-socket", metrics_socket]
+
+        with _TestServer(extra_server_args=server_args) as server:
+            run(f"quiver-arrow send {server.url} --count 10 --body-size 1000 --output {output}/sender")
+
+            _await_node_metric(metrics_file, "q0", "depth", 10)
+
+            # The bytes are those of the encoded messages
+            size = _read_node_metric(metrics_file, "q0", "bytes")
+
+            assert 10 * 1000 < size < 10 * 1200, size
+
+            run(f"quiver-arrow receive {server.url} --count 10 --timeout 10 --output {output}/receiver")
+
+            _await_node_metric(metrics_file, "q0", "dequeued", 10)
+
+            record = parse_json(read_lines(metrics_file)[-1])
+            node = {x["address"]: x for x in record["nodes"]}["q0"]
+
+            assert record["worker"] is None, record
+            assert record["cpu_time"] > 0, record
+            assert record["rss"] > 0, record
+            assert node["type"] == "queue", node
+            assert node["enqueued"] == 10, node
+            assert node["depth"] == 0, node
+            assert node["consumers"] == 0, node
+
+            # Socket clients get the same lines from the next interval
+            with _socket.socket(_socket.AF_UNIX, _socket.SOCK_STREAM) as sock:
+                sock.settimeout(10)
+                sock.connect(metrics_socket)
+
+                data = b""
+
+                while not data.endswith(b"\n"):
+                    chunk = sock.recv(65536)
+
+                    assert chunk, data
+
+                    data += chunk
+
+            record = parse_json(data.decode("utf-8").splitlines()[0])
+            node = {x["address"]: x for x in record["nodes"]}["q0"]
+
+            assert node["enqueued"] == 10, node
+            assert node["dequeued"] == 10, node
+
+@test
+def server_builtin_trace_sample():
+    with working_dir() as output:
+        server_output = join(output, "server.txt")
+        server_args = ["--trace", "--trace-sample", "10"]
+
+        with _TestServer(extra_server_args=server_args, output=server_output) as server:
+            run(f"quiver {server.url} --count 95")
+
+        # Each trace point logs the first message and every tenth
+        # after it
+        lines = read_lines(server_output)
+        stored = [x for x in lines if ": Stored " in x]
+        forwarded = [x for x in lines if ": Forwarded " in x]
+
+        assert len(stored) == 10, stored
+        assert len(forwarded) == 10, forwarded
+
+@test
+def server_builtin_journal():
+    with working_dir() as output:
+        journal_dir = join(output, "journal")
+
+        # Durable messages sent to one server are received from the next
+        with _TestServer(extra_server_args=["--journal", journal_dir]) as server:
+            run(f"quiver-arrow send {server.url} --count 10 --durable --output {output}/sender")
+
+        with _TestServer(extra_server_args=["--journal", journal_dir]) as server:
+            run(f"quiver-arrow receive {server.url} --count 10 --timeout 10 --output {output}/receiver")
+
+@test
+def server_builtin_journal_redelivery():
+    with working_dir() as output:
+        journal_dir = join(output, "journal")
+
+        # Durable messages a consumer took but did not settle go to
+        # the next consumer
+        with _TestServer(extra_server_args=["--journal", journal_dir]) as server:
+            run(f"quiver-arrow send {server.url} --count 20 --durable --output {output}/sender")
+
+            # The first consumer accepts five messages and leaves the
+            # rest of its credit window unsettled
+            connection, receiver = _blocking_receiver(server.url, 10)
+
+            try:
+                for i in range(5):
+                    receiver.receive()
+
+                receiver.accept()
+            finally:
+                connection.close()
+
+            run(f"quiver-arrow receive {server.url} --count 15 --timeout 10 --output {output}/receiver")
+
+@test
+def server_builtin_workers():
+    # Queues are spread across the workers, so some pairs go through
+    # two of them
+    with _TestServer(extra_server_args=["--workers", "2"]) as server:
+        for address in ("q0", "q1", "q2", "q3"):
+            url = server.url.rsplit("/", 1)[0]
+            run(f"quiver {url}/{address} --count 10")
+
+@test
+def server_builtin_end_to_end():
+    with _TestServer(extra_server_args=["--end-to-end"]) as server:
+        run(f"quiver {server.url} --count 10")
+
+@test
+def server_builtin_end_to_end_release():
+    with working_dir() as output:
+        with _TestServer(extra_server_args=["--end-to-end"]) as server:
+            sender = start(f"quiver-arrow send {server.url} --count 10 --timeout 30 --output {output}/sender")
+
+            # Released messages go back on the queue, and the producer
+            # waits for the next consumer to accept them
+            connection, receiver = _blocking_receiver(server.url, 10)
+
+            try:
+                for i in range(10):
+                    receiver.receive()
+
+                receiver.release(delivered=False)
+            finally:
+                connection.close()
+
+            sleep(1)
+
+            assert sender.poll() is None
+
+            run(f"quiver-arrow receive {server.url} --count 10 --timeout 10 --output {output}/receiver")
+
+            wait(sender, check=True)
+
+            summary = read_json(join(output, "receiver", "receiver-summary.json"))
+
+            assert summary["results"]["message_count"] == 10, summary
+
+@test
+def server_builtin_streaming():
+    with working_dir() as output:
+        server_output = join(output, "server.txt")
+        server_args = ["--raw", "--stream-buffer", "65536", "--trace"]
+
+        with _TestServer(extra_server_args=server_args, output=server_output) as server:
+            run(f"quiver {server.url} --count 10 --body-size 1m --credit 2")
+
+            # With no consumer, messages are assembled and queued
+            run(f"quiver-arrow send {server.url} --count 5 --body-size 1m --timeout 10 --output {output}/sender")
+            run(f"quiver-arrow receive {server.url} --count 5 --timeout 10 --output {output}/receiver")
+
+        assert read(server_output).count(": Streamed message of ") == 10, server_output
+
+        # Streaming is off by default
+        with _TestServer(extra_server_args=["--raw", "--trace"], output=server_output) as server:
+            run(f"quiver {server.url} --count 10 --body-size 1m --credit 2")
+
+        assert ": Streamed message of " not in read(server_output), server_output
+
+@test
+def server_builtin_streaming_journal():
+    with working_dir() as output:
+        server_output = join(output, "server.txt")
+        journal_dir = join(output, "journal")
+        server_args = ["--raw", "--journal", journal_dir, "--stream-buffer", "65536", "--trace"]
+
+        # With a journal, messages that are not durable still stream,
+        # and durable ones are stored whole
+        with _TestServer(extra_server_args=server_args, output=server_output) as server:
+            run(f"quiver {server.url} --count 10 --body-size 1m --credit 2")
+            run(f"quiver {server.url} --count 10 --body-size 1m --credit 2 --durable")
+            run(f"quiver-arrow send {server.url} --count 5 --body-size 1m --durable --output {output}/sender")
+
+        assert read(server_output).count(": Streamed message of ") == 10, server_output
+
+        with _TestServer(extra_server_args=["--journal", journal_dir]) as server:
+            run(f"quiver-arrow receive {server.url} --count 5 --timeout 10 --output {output}/receiver")
+
 # Pairs
 
 # qpid-jms
@@ -381,6 +681,42 @@ def pair_vertx_proton_to_rhea():
 def pair_vertx_proton_to_vertx_proton():
     _test_pair("vertx-proton", "vertx-proton")
 
+@test
+def pair_message_join():
+    with working_dir() as output:
+        run(f"quiver --count 100 --set-message-id --output {output}")
+
+        summary = read_json(join(output, "pair-summary.json"))
+        delivery = summary["results"]["join"]
+
+        assert delivery is not None, summary
+        assert delivery["delivered"] == 100, delivery
+        assert delivery["lost"] == 0, delivery
+
+@test
+def pair_backlog():
+    with working_dir() as output:
+        run(f"quiver --duration 3 --rate 100 --output {output}")
+
+        summary = read_json(join(output, "pair-summary.json"))
+
+        assert summary["results"]["backlog_max"] is not None, summary
+        assert exists(join(output, "pair-snapshots.csv")), output
+
+@test
+def pair_results_db():
+    with working_dir() as output:
+        database = join(output, "results.db")
+
+        run(f"quiver --count 1 --output {output}/pair --results-db {database}")
+
+        runs = parse_json(call(f"quiver-results query {database} --json"))
+
+        assert len(runs) == 1, runs
+        assert runs[0]["command"] == "quiver", runs
+        assert runs[0]["message_count"] == 1, runs
+        assert runs[0]["status"] == "PASSED", runs
+
 # Bench
 
 @test
@@ -398,6 +734,210 @@ def bench():
 
         run(command)
 
+        # The builtin server records metrics only with --server-metrics
+        server_dir = join(output, "qpid-proton-c", "builtin", "qpid-proton-c", "server")
+
+        assert exists(join(server_dir, "server-summary.json")), server_dir
+        assert not exists(join(server_dir, "server-metrics.jsonl")), server_dir
+
+@test
+def bench_resume():
+    with working_dir() as output:
+        command = [
+            "quiver-bench",
+            "--count", "1",
+            "--include-servers", "builtin",
+            "--include-senders", "qpid-proton-c",
+            "--include-receivers", "qpid-proton-c",
+            "--output", output,
+        ]
+
+        run(command)
+
+        key_file = join(output, "qpid-proton-c", "builtin", "qpid-proton-c", "key.json")
+        key = read_json(key_file)["key"]
+
+        result = call(command + ["--resume"])
+
+        assert "SKIPPED (passed)" in result, result
+        assert read_json(key_file)["key"] == key
+
+@test
+def bench_trials():
+    with working_dir() as output:
+        command = [
+            "quiver-bench",
+            "--count", "1",
+            "--trials", "2",
+            "--include-servers", "builtin",
+            "--include-senders", "qpid-proton-c",
+            "--include-receivers", "qpid-proton-c",
+            "--client-server",
+            "--output", output,
+        ]
+
+        run(command)
+
+        aggregate = read_json(join(output, "qpid-proton-c", "builtin", "qpid-proton-c", "aggregate.json"))
+
+        assert aggregate["passed_trials"] == [1, 2], aggregate
+        assert aggregate["metrics"]["latency_50"]["count"] == 2, aggregate
+
+@test
+def bench_reuse_servers():
+    with working_dir() as output:
+        command = [
+            "quiver-bench",
+            "--count", "1",
+            "--trials", "2",
+            "--reuse-servers",
+            "--probe-port",
+            "--server-metrics",
+            "--include-servers", "builtin",
+            "--include-senders", "qpid-proton-c",
+            "--include-receivers", "qpid-proton-c",
+            "--client-server",
+            "--output", output,
+        ]
+
+        result = call(command)
+
+        assert "Server builtin started 1 time, ready in" in result, result
+        assert list_dir(join(output, "servers", "builtin")) == ["01"], output
+        assert exists(join(output, "servers", "builtin", "01", "startup.txt")), output
+
+        trial_dir = join(output, "qpid-proton-c", "builtin", "qpid-proton-c", "trials", "02")
+
+        assert read(join(trial_dir, "server", "status.txt")) == "PASSED\n", trial_dir
+        assert exists(join(trial_dir, "server", "server-snapshots.csv")), trial_dir
+        assert exists(join(trial_dir, "server", "server-metrics.jsonl")), trial_dir
+
+        server_summary = read_json(join(trial_dir, "server", "server-summary.json"))
+
+        assert server_summary["results"]["message_count"] == 1, server_summary
+        assert server_summary["results"]["max_rss"] > 0, server_summary
+        assert "q-qpid-proton-c-qpid-proton-c-2" in read(join(trial_dir, "pair", "command.txt")), trial_dir
+
+@test
+def bench_sweep_params():
+    with working_dir() as output:
+        command = [
+            "quiver-bench",
+            "--count", "1",
+            "--body-size", "10,100",
+            "--durable", "both",
+            "--include-servers", "builtin",
+            "--include-senders", "qpid-proton-c",
+            "--include-receivers", "qpid-proton-c",
+            "--client-server",
+            "--output", output,
+        ]
+
+        run(command)
+
+        test_dir = join(output, "qpid-proton-c", "builtin", "qpid-proton-c")
+
+        assert list_dir(test_dir) == ["body-size-100_durable-no", "body-size-100_durable-yes",
+                                      "body-size-10_durable-no", "body-size-10_durable-yes"], list_dir(test_dir)
+
+        key = read_json(join(test_dir, "body-size-10_durable-yes", "key.json"))
+
+        assert key["params"]["body_size"] == 10, key
+        assert key["params"]["durable"] is True, key
+
+        # Only durable tests give the builtin server a journal
+        assert "--journal" in read(join(test_dir, "body-size-10_durable-yes", "server", "command.txt"))
+        assert "--journal" not in read(join(test_dir, "body-size-10_durable-no", "server", "command.txt"))
+
+@test
+def bench_compare():
+    with working_dir() as output:
+        baseline = join(output, "baseline")
+        current = join(output, "current")
+
+        command = [
+            "quiver-bench",
+            "--count", "1",
+            "--include-servers", "builtin",
+            "--include-senders", "qpid-proton-c",
+            "--include-receivers", "qpid-proton-c",
+            "--client-server",
+            "--output", baseline,
+        ]
+
+        run(command)
+        run(f"quiver-bench-compare {baseline} {baseline}")
+
+        copy(baseline, current)
+
+        summary_file = join(current, "qpid-proton-c", "builtin", "qpid-proton-c", "pair", "pair-summary.json")
+        summary = read_json(summary_file)
+        summary["results"]["message_rate"] = summary["results"]["message_rate"] / 2
+        write_json(summary_file, summary)
+
+        with expect_error():
+            run(f"quiver-bench-compare {baseline} {current}")
+
+# Saturate
+
+@test
+def saturate():
+    with working_dir() as output:
+        command = [
+            "quiver-saturate",
+            "--duration", "1",
+            "--max-rate", "1k",
+            "--steps", "4",
+            "--latency-limit", "1000",
+            "--output", output,
+        ]
+
+        run(command)
+
+        summary = read_json(join(output, "saturate-summary.json"))
+
+        assert summary["results"]["knee_rate"] is not None, summary
+
+@test
+def saturate_sweep():
+    with working_dir() as output:
+        command = [
+            "quiver-saturate",
+            "--duration", "1",
+            "--max-rate", "1k",
+            "--sweep", "50%..100%/50%,200",
+            "--output", output,
+        ]
+
+        run(command)
+
+        summary = read_json(join(output, "saturate-summary.json"))
+
+        assert len(summary["results"]["steps"]) == 3, summary
+        assert read(join(output, "saturate-chart.svg")).startswith("<svg"), output
+
+# Tune
+
+@test
+def tune():
+    with working_dir() as output:
+        command = [
+            "quiver-tune",
+            "--server", "builtin",
+            "--duration", "1",
+            "--credit", "10,100",
+            "--output", output,
+        ]
+
+        run(command)
+
+        summary = read_json(join(output, "tune-summary.json"))
+
+        assert len(summary["results"]["steps"]) == 2, summary
+        assert "100" in summary["results"]["best"], summary
+
+        run(f"quiver --init-only @{join(output, 'tune-100.args')} q0")
+
 # TLS/SASL
 
 @test
@@ -477,12 +1017,12 @@ class _TestServer:
             port = "5672"
 
         self.url = "{}//localhost:{}/q0".format(scheme + ":" if scheme else "", port)
-        self.ready_file = make_temp_file()
+        self.ready_pipe = ReadyPipe()
 
         command = [
             "quiver-server", self.url,
             "--verbose",
-            "--ready-file", self.ready_file,
+            "--ready-file", self.ready_pipe.path,
             "--impl", impl,
         ]
 
@@ -492,17 +1032,65 @@ class _TestServer:
         self.proc.url = self.url
 
     def __enter__(self):
-        for i in range(30):
-            if read(self.ready_file) == "ready\n":
-                break
-
-            sleep(0.2)
+        self.ready_pipe.wait(30, self.proc)
 
         return self.proc
 
     def __exit__(self, exc_type, exc_value, traceback):
         stop(self.proc)
-        remove(self.ready_file)
+        self.ready_pipe.close()
+
+# Waits until TEXT appears COUNT times in a server output file
+def _await_output(file, text, count=1, timeout=30):
+    deadline = get_time() + timeout
+
+    while read(file).count(text) < count:
+        if get_time() > deadline:
+            raise Exception(f"Timed out waiting for '{text}' in {file}")
+
+        sleep(0.1, quiet=True)
+
+# Waits until the latest metrics line from the builtin server shows
+# VALUE for the given node field
+def _await_node_metric(file, address, name, value, timeout=30):
+    deadline = get_time() + timeout
+    current = None
+
+    while current != value:
+        if get_time() > deadline:
+            raise Exception(f"Timed out waiting for {name} {value} on '{address}' (last {current})")
+
+        sleep(0.2, quiet=True)
+
+        current = _read_node_metric(file, address, name)
+
+# Returns the node field from the latest metrics line, or None if
+# there is none yet
+def _read_node_metric(file, address, name):
+    if not exists(file):
+        return None
+
+    lines = read_lines(file)
+
+    if not lines or not lines[-1].endswith("\n"):
+        return None
+
+    nodes = parse_json(lines[-1])["nodes"]
+
+    return {x["address"]: x[name] for x in nodes}.get(address)
+
+# A Proton blocking receiver, for tests that need to settle messages
+# by hand
+def _blocking_receiver(url, credit):
+    try:
+        from proton.utils import BlockingConnection
+    except ImportError:
+        raise PlanoTestSkipped("Proton Python is unavailable")
+
+    url = _urlparse(url)
+    connection = BlockingConnection(url.netloc, timeout=10)
+
+    return connection, connection.create_receiver(url.path[1:], credit=credit)
 
 def _test_url():
     return "//localhost:{}/q0".format(get_random_port())